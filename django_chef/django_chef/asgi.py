@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'django_chef.settings')
+# recipe_app warms up in ready() when STARTUP_WARMUP is on (recipe_app/warmup.py)
+os.environ.setdefault('DJANGO_CHEF_SERVER', '1')
 
 application = get_asgi_application()
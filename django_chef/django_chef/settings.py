@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -43,6 +44,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # serves collected, precompressed static files when STATIC_ASSETS_SERVE is on
+    'recipe_app.static_assets.StaticAssetMiddleware',
+    # local stand-in for a reverse proxy/CDN caching public pages (see recipe_app.public_cache)
+    'recipe_app.public_cache.SharedCacheMiddleware',
+    # keeps a user's reads on the primary db right after they write, only active with replicas
+    'recipe_app.replicas.ReplicaPinMiddleware',
+    # only active when HTML_MINIFY is on
+    'recipe_app.middleware.HTMLMinifyMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -58,13 +67,20 @@ TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [ BASE_DIR / 'templates'],
-        'APP_DIRS': True,
         'OPTIONS': {
+            # compiled templates are kept in memory (runserver still reloads them on change)
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
             'context_processors': [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
                 'recipe_app.context_processors.show_date',
+                'recipe_app.context_processors.static_bundles',
             ],
         },
     },
@@ -72,6 +88,11 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'django_chef.wsgi.application'
 
+# production profile: warm up server processes when they start (URLs, templates,
+# lookup tables, see recipe_app/warmup.py) and strip whitespace from HTML responses
+STARTUP_WARMUP = not DEBUG
+HTML_MINIFY = not DEBUG
+
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
@@ -80,9 +101,74 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # workers keep the connection they opened at start-up (recipe_app/warmup.py)
+        'CONN_MAX_AGE': 60,
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# read replicas: reads go to one of DATABASE_REPLICAS, writes to default (see recipe_app.replicas).
+# a user's reads stay on default for REPLICA_PIN_SECONDS after they write
+DATABASE_ROUTERS = ['recipe_app.archive.ArchiveRouter', 'recipe_app.replicas.PrimaryReplicaRouter']
+DATABASE_REPLICAS = []
+REPLICA_PIN_SECONDS = 5
+# rows that must never be read stale: tasks are claimed right after being read,
+# and a session has to exist as soon as its cookie is sent
+PRIMARY_ONLY_MODELS = ['recipe_app.task', 'sessions.session']
+
+# local replica setup: DJANGO_CHEF_SQLITE_REPLICA=1 adds a second sqlite file as a replica,
+# kept in sync by manage.py simulate_replication (with an artificial lag)
+if os.environ.get('DJANGO_CHEF_SQLITE_REPLICA'):
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db_replica.sqlite3',
+        'CONN_MAX_AGE': 60,
+        'CONN_HEALTH_CHECKS': True,
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS = ['replica']
+
+# archived recipes in a separate sqlite file instead of the default database (see recipe_app.archive),
+# created with manage.py migrate --database archive
+if os.environ.get('DJANGO_CHEF_SQLITE_ARCHIVE'):
+    DATABASES['archive'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db_archive.sqlite3',
+    }
+
+
+# Caches
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# local memory is per process: point these at Redis/Memcached when running several workers.
+# 'shared' is seen by every process on this host and survives restarts, for data that must
+# not be lost when the next request lands on another worker (see SERVE_* below)
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'django-chef-default',
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache',
+        # culling drops random entries, wizards in progress among them
+        'OPTIONS': {'MAX_ENTRIES': 100_000},
+    },
+}
+
+# sessions: read from the cache, only written through to the db when they change.
+# a logout on one worker must end the session on all of them, so a cache they share
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+SESSION_CACHE_ALIAS = 'shared'
+
+# flash messages ride in a signed cookie so they never rewrite the session
+MESSAGE_STORAGE = 'django.contrib.messages.storage.cookie.CookieStorage'
+
+# create-recipe wizard step data: cache alias and lifetime (seconds) of abandoned wizards.
+# the steps of one wizard may be served by different workers, so not a per-process cache
+WIZARD_CACHE_ALIAS = 'shared'
+WIZARD_STORAGE_TIMEOUT = 60 * 60 * 24
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -128,6 +214,28 @@ USE_TZ = True
 # static files
 STATIC_URL = 'static/'
 STATICFILES_DIRS = [BASE_DIR / 'static']
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+
+# static build (manage.py build_static): one purged css bundle and one js bundle,
+# content-hashed names and precompressed siblings, see recipe_app.static_assets
+STATIC_BUNDLES = not DEBUG
+STATIC_BUNDLES_CSS = ['css/bootstrap.css', 'css/sketchy_theme.css', 'css/bootstrap-icons.css', 'css/custom.css']
+STATIC_BUNDLES_JS = ['js/bootstrap.bundle.js', 'js/custom.js', 'js/htmx.min.js', 'js/offline.js', 'js/steps.js']
+STATIC_BUNDLE_CSS_NAME = 'css/app.bundle.css'
+STATIC_BUNDLE_JS_NAME = 'js/app.bundle.js'
+# class names added outside of templates/forms/scripts that purging must keep
+STATIC_PURGE_SAFELIST = []
+STATIC_ASSETS_SERVE = not DEBUG
+
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': ('recipe_app.static_assets.BundledManifestStorage' if STATIC_BUNDLES
+                    else 'django.contrib.staticfiles.storage.StaticFilesStorage'),
+    },
+}
 
 # media files (for profile pictures)
 MEDIA_URL = '/media/'
@@ -137,3 +245,69 @@ MEDIA_ROOT = BASE_DIR / 'media'
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# recipe revision history: store a full snapshot every N versions, diffs in between
+RECIPE_VERSION_CHECKPOINT_EVERY = 10
+
+# background tasks (manage.py run_workers): seconds a claimed task stays invisible
+# to other workers, and run tasks inline instead of queueing them
+TASK_VISIBILITY_TIMEOUT = 300
+TASK_ALWAYS_EAGER = False
+
+# write endpoint rate limits/coalescing, configured per url in recipe_app/urls.py
+THROTTLE_ENABLED = True
+THROTTLE_CACHE_ALIAS = 'default'
+
+# public recipe pages: browser and shared-cache (CDN) lifetimes in seconds
+PUBLIC_RECIPE_MAX_AGE = 60 * 5
+PUBLIC_RECIPE_S_MAXAGE = 60 * 60 * 24
+PUBLIC_CACHE_ALIAS = 'default'
+# query parameters that change a public page; others share the page's cache entry
+PUBLIC_CACHE_QUERY_PARAMS = []
+# dotted paths of callables taking a list of surrogate keys, e.g. to purge a CDN
+PUBLIC_CACHE_PURGE_HOOKS = []
+
+# cookbook export (recipe_app/export.py): recipes per query, books streamed while the
+# user waits (bigger ones are written by a background task) and image rendition size
+EXPORT_CHUNK_SIZE = 200
+EXPORT_STREAM_MAX = 500
+EXPORT_IMAGE_SIZE = 480
+
+# activity log (recipe_app/events.py): 'db' (Event rows) or 'jsonl' (a file per day in
+# EVENT_LOG_DIR). events are buffered and written every EVENT_LOG_BATCH_SIZE events or
+# EVENT_LOG_FLUSH_INTERVAL seconds, EVENT_LOG_EAGER writes each one at once
+EVENT_LOG_SINK = 'db'
+EVENT_LOG_DIR = BASE_DIR / 'event_log'
+EVENT_LOG_BATCH_SIZE = 100
+EVENT_LOG_FLUSH_INTERVAL = 5
+EVENT_LOG_EAGER = False
+EVENT_LOG_RETENTION_DAYS = 180
+# days of files a recipe's activity feed reads with the 'jsonl' sink
+EVENT_LOG_FEED_DAYS = 30
+
+# pantry search (recipe_app/pantry.py): inverted ingredient index files and results per search
+PANTRY_INDEX_DIR = BASE_DIR / 'pantry_index'
+PANTRY_RESULTS = 24
+
+# home-page dashboard (recipe_app/dashboard.py): cached stats are fresh for DASHBOARD_FRESH
+# seconds, then served stale for up to DASHBOARD_STALE more while they reload in the background
+DASHBOARD_CACHE_ALIAS = 'default'
+DASHBOARD_FRESH = 60
+DASHBOARD_STALE = 60 * 10
+DASHBOARD_EAGER = False
+
+# manage.py serve (recipe_app/prefork.py): seconds a stopping worker may take to finish its
+# request, and a reloaded server to get its workers ready before the reload is given up
+SERVE_GRACEFUL_TIMEOUT = 30
+SERVE_READY_TIMEOUT = 60
+# with several workers, what lives in the per-process 'default' cache is per worker: the
+# THROTTLE_* limits apply per worker (up to --workers times the rate overall) and a repeated
+# POST is only coalesced when the same worker gets it, and a dashboard marked stale by one
+# worker may be served unchanged by another for up to DASHBOARD_FRESH seconds. point those
+# aliases at a shared Redis/Memcached cache for exact limits; the wizard already uses 'shared'
+
+# recipe archive (recipe_app/archive.py): recipes untouched for ARCHIVE_AFTER_MONTHS move to
+# ArchivedRecipe rows in ARCHIVE_DATABASE, ARCHIVE_BATCH_SIZE recipes per transaction
+ARCHIVE_DATABASE = 'archive' if 'archive' in DATABASES else 'default'
+ARCHIVE_AFTER_MONTHS = 12
+ARCHIVE_BATCH_SIZE = 500
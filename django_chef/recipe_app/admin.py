@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import CustomUser, Category, IngreadientMeasure, Recipe
+from .models import CustomUser, Category, IngreadientMeasure, Recipe, Task, Event
+from .duplicates import find_duplicates, merge_recipes
 
 @admin.register(CustomUser)
 class UserAdmin(admin.ModelAdmin):
@@ -29,6 +30,7 @@ class RecipeAdmin(admin.ModelAdmin):
     search_fields = ['title','category__name']
     ordering = ['title']
     fields = ['title', 'category', 'owner']
+    actions = ['merge_duplicates']
 
     def save_model(self, request, obj, form, change):
         # Only auto-assign owner if it's blank (admin can still choose manually)
@@ -40,4 +42,27 @@ class RecipeAdmin(admin.ModelAdmin):
         qs = super().get_queryset(request)
         if request.user.is_superuser:
             return qs
-        return qs.filter(owner=request.user)
\ No newline at end of file
+        return qs.filter(owner=request.user)
+
+    @admin.action(description="Merge duplicates among selected recipes")
+    def merge_duplicates(self, request, queryset):
+        groups = 0
+        removed = 0
+        for keep, *duplicates in find_duplicates(queryset):
+            groups += 1
+            removed += merge_recipes(keep, duplicates)
+        self.message_user(request, f"Merged {groups} duplicate groups, removed {removed} recipes.")
+
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    list_display = ['id', 'name', 'status', 'priority', 'attempts', 'run_at', 'finished_at']
+    list_filter = ['status', 'name']
+    search_fields = ['name', 'idempotency_key']
+    ordering = ['-id']
+
+@admin.register(Event)
+class EventAdmin(admin.ModelAdmin):
+    list_display = ['created_at', 'actor_name', 'action', 'object_type', 'label', 'recipe_id']
+    list_filter = ['action', 'object_type']
+    search_fields = ['actor_name', 'label']
+    date_hierarchy = 'created_at'
@@ -1,6 +1,17 @@
+import os
+
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class RecipeAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'recipe_app'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from . import warmup
+
+        # servers only: management commands and tests start as they did
+        if settings.STARTUP_WARMUP and os.environ.get(warmup.SERVER_ENV):
+            warmup.warm_app()
@@ -0,0 +1,290 @@
+"""
+Hot/cold archival of stale recipes.
+
+Recipes nobody touched for ``ARCHIVE_AFTER_MONTHS`` (``updated_at``, which
+child edits bump too) are moved out of the recipe, ingredient, step,
+favorite and version tables, so those only hold the recipes in use and their
+indexes stay small enough to be cached. ``manage.py archive_recipes`` moves
+them ``ARCHIVE_BATCH_SIZE`` at a time into ``ArchivedRecipe``: one row per
+recipe holding its fields and all its children's rows as JSON. The ids of its
+ingredients and steps go to ``ArchivedChild``, indexed, so the urls of those
+find the recipe without reading the blobs. The rows live in
+``ARCHIVE_DATABASE``, which ``ArchiveRouter`` sends them to: the default
+database, or a separate SQLite file (``DJANGO_CHEF_SQLITE_ARCHIVE=1``).
+Public recipes are never archived, their page is anyone's to read.
+
+A batch is written to the archive before it is deleted from the hot tables,
+so a move interrupted halfway leaves a recipe in both places (the hot copy
+wins, the next run overwrites the archived one), never in neither. While it
+is deleted (``is_moving``), the signals leave the recipe's image alone and
+skip the per-row work; the dashboards of the users concerned are rebuilt once
+per batch instead. The pantry index drops the recipe as for a deletion.
+
+An archived recipe is still its owner's: ``ReadRecipe`` shows it from the
+archive as it is (``read``), and every other view of it, an edit of one of
+its ingredients or steps, or a favorite toggle first moves it back
+(``rehydrate``) with the same ids, so urls keep working. Its ingredients,
+inserted in bulk without signals, are logged to the pantry index explicitly. The recipe list
+shows the titles of the archived ones. Rows its children referred to that
+were deleted meanwhile are dropped (favorites) or cleared (measures,
+category, version authors), as the foreign keys would have done.
+"""
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, transaction
+from django.utils import timezone
+
+from . import dashboard, pantry
+from .export import rendition_name
+from .models import (ArchivedChild, ArchivedRecipe, Category, CustomUser, FavoriteRecipe, IngreadientMeasure,
+                     Ingredient, Recipe, RecipeVersion, Step)
+from .tasks import delete_stored_file
+from .versioning import image_of
+
+# the children moved along with a recipe: payload key and model
+CHILDREN = [('ingredients', Ingredient), ('steps', Step), ('favorites', FavoriteRecipe), ('versions', RecipeVersion)]
+# the children with urls of their own, looked up by id in ArchivedChild
+LOOKED_UP = ['ingredients', 'steps']
+# the archive's models, in ARCHIVE_DATABASE
+ARCHIVE_MODELS = [ArchivedRecipe, ArchivedChild]
+
+_moving = ContextVar('archive_moving', default=False)
+
+
+def _setting(name, default):
+    return getattr(settings, f"ARCHIVE_{name}", default)
+
+
+def archive_database():
+    return _setting('DATABASE', DEFAULT_DB_ALIAS)
+
+
+class ArchiveRouter:
+    """``ArchivedRecipe`` and ``ArchivedChild`` rows to ``ARCHIVE_DATABASE``, nothing else there."""
+    def db_for_read(self, model, **hints):
+        if model in ARCHIVE_MODELS:
+            return archive_database()
+        return None
+
+    db_for_write = db_for_read
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        alias = archive_database()
+        if alias == DEFAULT_DB_ALIAS:
+            return None
+        if app_label == ArchivedRecipe._meta.app_label and model_name in {m._meta.model_name for m in ARCHIVE_MODELS}:
+            return db == alias
+        return False if db == alias else None
+
+
+def is_moving():
+    """True while archived recipes are deleted from the hot tables."""
+    return _moving.get()
+
+
+@contextmanager
+def _moving_out():
+    token = _moving.set(True)
+    try:
+        yield
+    finally:
+        _moving.reset(token)
+
+
+def cutoff(months=None):
+    months = _setting('AFTER_MONTHS', 12) if months is None else months
+    return timezone.now() - timedelta(days=30 * months)
+
+
+def stale_recipes(before):
+    """Recipes untouched since ``before`` that may be archived."""
+    return Recipe.objects.filter(updated_at__lt=before, is_public=False)
+
+
+# moving out
+def archive_batch(recipe_ids, before):
+    """Move the recipes of ``recipe_ids`` still untouched since ``before``; return how many moved."""
+    with transaction.atomic():
+        recipes = list(stale_recipes(before).select_for_update().filter(pk__in=recipe_ids).order_by('pk').values())
+        if not recipes:
+            return 0
+        recipe_ids = [row['id'] for row in recipes]
+        children = {name: defaultdict(list) for name, _model in CHILDREN}
+        for name, model in CHILDREN:
+            for row in model.objects.filter(recipe_id__in=recipe_ids).order_by('pk').values():
+                children[name][row['recipe_id']].append(row)
+        archived = [
+            ArchivedRecipe(id=row['id'], owner_id=row['owner_id'], title=row['title'], slug=row['slug'],
+                           updated_at=row['updated_at'],
+                           data={'recipe': row, **{name: rows[row['id']] for name, rows in children.items()}})
+            for row in recipes
+        ]
+        # written (and committed, if it is another database) before anything is deleted
+        with transaction.atomic(using=archive_database()):
+            ArchivedRecipe.objects.bulk_create(
+                archived, update_conflicts=True, unique_fields=['id'],
+                update_fields=['owner_id', 'title', 'slug', 'updated_at', 'archived_at', 'data'],
+            )
+            # those of an earlier, interrupted move are replaced
+            ArchivedChild.objects.filter(archived_id__in=recipe_ids).delete()
+            ArchivedChild.objects.bulk_create(
+                ArchivedChild(archived_id=recipe_id, kind=name, child_id=row['id'])
+                for name in LOOKED_UP for recipe_id, rows in children[name].items() for row in rows
+            )
+        with _moving_out():
+            Recipe.objects.filter(pk__in=recipe_ids).delete()
+    users = {row['owner_id'] for row in recipes}
+    users.update(row['user_id'] for rows in children['favorites'].values() for row in rows)
+    users.discard(None)
+    dashboard.rebuild_all(sorted(users))
+    return len(recipe_ids)
+
+
+def archive_stale(months=None, batch_size=None):
+    """Archive every recipe untouched for ``months``, a batch per transaction; yield the running total."""
+    before = cutoff(months)
+    batch_size = batch_size or _setting('BATCH_SIZE', 500)
+    moved = last = 0
+    while True:
+        recipe_ids = list(stale_recipes(before).filter(pk__gt=last).order_by('pk')
+                          .values_list('pk', flat=True)[:batch_size])
+        if not recipe_ids:
+            return
+        moved += archive_batch(recipe_ids, before)
+        last = recipe_ids[-1]
+        yield moved
+
+
+# reading
+def find(user, pk, slug):
+    """``user``'s archived recipe of a recipe url, or None."""
+    if not user.is_authenticated:
+        return None
+    return ArchivedRecipe.objects.filter(pk=pk, owner_id=user.pk, slug=slug).first()
+
+
+def find_by_child(user, slug, model, pk):
+    """``user``'s archived recipe holding the ingredient or step ``pk`` (child urls carry the recipe's slug)."""
+    if not user.is_authenticated:
+        return None
+    name = next(name for name, child_model in CHILDREN if child_model is model)
+    children = ArchivedChild.objects.filter(kind=name, child_id=pk)
+    return ArchivedRecipe.objects.filter(owner_id=user.pk, slug=slug, pk__in=children.values('archived_id')).first()
+
+
+def titles(user):
+    """``(pk, title, slug)`` of ``user``'s archived recipes, by title."""
+    return list(ArchivedRecipe.objects.filter(owner_id=user.pk).order_by('title').values_list('pk', 'title', 'slug'))
+
+
+def _instance(model, row):
+    """An unsaved ``model`` instance of a ``values()`` row read back from JSON."""
+    return model(**{field.attname: field.to_python(row[field.attname])
+                    for field in model._meta.concrete_fields if field.attname in row})
+
+
+def _clear_missing(instances, attname, model):
+    """Clear ``attname`` where it points to a deleted ``model`` row, as ``on_delete=SET_NULL`` did."""
+    ids = {getattr(instance, attname) for instance in instances} - {None}
+    existing = set(model.objects.filter(pk__in=ids).values_list('pk', flat=True)) if ids else set()
+    for instance in instances:
+        if getattr(instance, attname) not in existing:
+            setattr(instance, attname, None)
+
+
+def _prefetched(recipe, name, instances):
+    # as prefetch_related leaves it: recipe.<name>.all() runs no query
+    queryset = getattr(recipe, name).all()
+    queryset._result_cache = instances
+    queryset._prefetch_done = True
+    recipe._prefetched_objects_cache[name] = queryset
+
+
+def read(archived, user):
+    """An unsaved ``Recipe`` of ``archived`` with its ingredients and steps loaded, to show it."""
+    data = archived.data
+    recipe = _instance(Recipe, data['recipe'])
+    recipe.category = Category.objects.filter(pk=recipe.category_id).first() if recipe.category_id else None
+    ingredients = [_instance(Ingredient, row) for row in data['ingredients']]
+    measures = IngreadientMeasure.objects.in_bulk({ingredient.measure_id for ingredient in ingredients} - {None})
+    for ingredient in ingredients:
+        ingredient.measure = measures.get(ingredient.measure_id)
+    steps = sorted((_instance(Step, row) for row in data['steps']), key=lambda step: step.step_number)
+    recipe._prefetched_objects_cache = {}
+    _prefetched(recipe, 'ingredients', ingredients)
+    _prefetched(recipe, 'steps', steps)
+    recipe.is_fav = any(row['user_id'] == user.pk for row in data['favorites'])
+    recipe.is_archived = True
+    return recipe
+
+
+# moving back
+def rehydrate(archived):
+    """Move ``archived`` back into the hot tables with its ids; return the recipe."""
+    data = archived.data
+    try:
+        with transaction.atomic():
+            recipe = Recipe.objects.filter(pk=archived.pk).first()
+            if recipe is None:
+                recipe = _restore(data)
+    except IntegrityError:
+        # moved back by a concurrent request
+        recipe = Recipe.objects.get(pk=archived.pk)
+    ArchivedRecipe.objects.filter(pk=archived.pk).delete()
+    return recipe
+
+
+def _restore(data):
+    recipe = _instance(Recipe, data['recipe'])
+    _clear_missing([recipe], 'category_id', Category)
+    # a new updated_at: it is in use again
+    recipe.save(force_insert=True)
+    ingredients = [_instance(Ingredient, row) for row in data['ingredients']]
+    _clear_missing(ingredients, 'measure_id', IngreadientMeasure)
+    Ingredient.objects.bulk_create(ingredients)
+    # bulk_create sends no signals: log the ingredients to the pantry index ourselves
+    pantry.recipe_changed(recipe.pk)
+    Step.objects.bulk_create(_instance(Step, row) for row in data['steps'])
+    versions = [_instance(RecipeVersion, row) for row in data['versions']]
+    _clear_missing(versions, 'author_id', CustomUser)
+    RecipeVersion.objects.bulk_create(versions)
+    favorites = [_instance(FavoriteRecipe, row) for row in data['favorites']]
+    users = set(CustomUser.objects.filter(pk__in={favorite.user_id for favorite in favorites})
+                .values_list('pk', flat=True))
+    favorites = [favorite for favorite in favorites if favorite.user_id in users]
+    added_on = [favorite.added_on for favorite in favorites]
+    FavoriteRecipe.objects.bulk_create(favorites)
+    # bulk_create stamps auto_now_add fields, bulk_update does not
+    for favorite, added in zip(favorites, added_on):
+        favorite.added_on = added
+    FavoriteRecipe.objects.bulk_update(favorites, ['added_on'])
+    # bulk_create sends no signals: the recipe's own save counted the recipe
+    for favorite in favorites:
+        dashboard.favorite_changed(favorite.user_id, 1)
+    return recipe
+
+
+def restore(user, pk, slug=None):
+    """Move ``user``'s archived recipe ``pk`` back; the recipe, or None when there is none."""
+    if not user.is_authenticated:
+        return None
+    archived = ArchivedRecipe.objects.filter(pk=pk, owner_id=user.pk)
+    if slug is not None:
+        archived = archived.filter(slug=slug)
+    archived = archived.first()
+    return rehydrate(archived) if archived else None
+
+
+def forget_owner(user_id):
+    """Delete a deleted user's archived recipes and their images, their versions' too."""
+    archived = ArchivedRecipe.objects.filter(owner_id=user_id)
+    for (data,) in archived.values_list('data'):
+        images = {data['recipe'].get('image')} | {image_of(row['data']) for row in data['versions']}
+        for image in sorted(images - {None, ''}):
+            delete_stored_file.enqueue(image)
+            delete_stored_file.enqueue(rendition_name(image))
+    archived.delete()
@@ -1,7 +1,13 @@
 import datetime
+from django.conf import settings
 
 def show_date(request):
     current_date = datetime.date.today()
     return {
         'current_date': current_date,
-    }
\ No newline at end of file
+    }
+
+def static_bundles(request):
+    return {
+        'use_static_bundles': settings.STATIC_BUNDLES,
+    }
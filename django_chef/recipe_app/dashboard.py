@@ -0,0 +1,297 @@
+"""
+Home-page dashboard: a user's recipes by category, average spice level,
+favorites, newest and quickest recipes.
+
+Nothing is aggregated when the page is shown. ``UserStats`` holds the
+numbers of every user and the signals in signals.py keep it current by
+deltas: a created, edited or deleted recipe or favorite adjusts the counters
+of its user's row (locked while it changes). The newest and quickest
+``DASHBOARD_LIST_SIZE`` recipes are kept as short lists that a change
+updates in place; only when one of their recipes is deleted or got slower is
+the list queried again, through the owner index. ``rebuild`` recomputes rows
+from the recipes and favorites themselves: for a user without a row yet, and
+for everyone with ``manage.py rebuild_user_stats``, which also repairs any
+drift (bulk updates send no signals).
+
+``dashboard`` reads through the cache with stale-while-revalidate: an entry
+is fresh for ``DASHBOARD_FRESH`` seconds, then served as it is for up to
+``DASHBOARD_STALE`` more while a thread reloads it. A change to the user's
+stats marks the entry stale once it commits. Only a missing entry is read
+while the user waits, and that is one row; a missing row is rebuilt in the
+background (the page says so meanwhile). ``DASHBOARD_EAGER`` reloads inline,
+for tests.
+"""
+import logging
+import threading
+import time
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections, transaction
+from django.db.models import Case, Count, F, IntegerField, Sum, Value, When, Window
+from django.db.models.functions import RowNumber
+
+from .models import Category, FavoriteRecipe, Recipe, UserStats, time_display
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'dashboard'
+DASHBOARD_LIST_SIZE = 5
+# cook times in minutes, to rank recipes by how quick they are
+UNIT_MINUTES = {'min': 1, 'hr': 60, 'day': 60 * 24, 'wk': 60 * 24 * 7, 'mo': 60 * 24 * 30}
+# what a recipe contributes to its owner's stats
+RECIPE_FIELDS = ('owner_id', 'category_id', 'spice_level', 'cook_time', 'cook_time_unit', 'title', 'slug')
+
+
+def _setting(name, default):
+    return getattr(settings, f"DASHBOARD_{name}", default)
+
+
+def get_cache():
+    return caches[_setting('CACHE_ALIAS', 'default')]
+
+
+def _key(user_id):
+    return f"{KEY_PREFIX}:{user_id}"
+
+
+# list entries
+def _minutes():
+    """Cook time in minutes as a query expression."""
+    factors = [When(cook_time_unit=unit, then=Value(minutes)) for unit, minutes in UNIT_MINUTES.items()]
+    return F('cook_time') * Case(*factors, default=Value(1), output_field=IntegerField())
+
+
+def _recent_entry(pk, state):
+    return [pk, state['title'], state['slug']]
+
+
+def _quick_entry(pk, state):
+    minutes = state['cook_time'] * UNIT_MINUTES.get(state['cook_time_unit'], 1)
+    return [pk, state['title'], state['slug'], minutes, time_display(state['cook_time'], state['cook_time_unit'])]
+
+
+def _recent_rank(entry):
+    return -entry[0]
+
+
+def _quick_rank(entry):
+    return entry[3], entry[0]
+
+
+LISTS = [('recent', _recent_entry, _recent_rank), ('quickest', _quick_entry, _quick_rank)]
+
+
+def _lists_query(recipes, name):
+    """The first recipes of each owner in list ``name``, as ``(owner id, pk, *state)`` rows."""
+    order = F('pk').desc() if name == 'recent' else [F('minutes').asc(), F('pk').asc()]
+    return (recipes.annotate(minutes=_minutes(), rank=Window(RowNumber(), partition_by=F('owner'), order_by=order))
+            .filter(rank__lte=DASHBOARD_LIST_SIZE).order_by('owner', 'rank')
+            .values_list('owner_id', 'pk', *RECIPE_FIELDS[1:]))
+
+
+def _entries(rows, make_entry):
+    return [make_entry(pk, dict(zip(RECIPE_FIELDS[1:], state))) for pk, *state in rows]
+
+
+# deltas
+def recipe_state(recipe):
+    """What ``recipe`` contributes to the stats, for comparing before and after a save."""
+    return {field: getattr(recipe, field) for field in RECIPE_FIELDS}
+
+
+def _count(counts, category_id, delta):
+    key = '' if category_id is None else str(category_id)
+    counts[key] = counts.get(key, 0) + delta
+    if counts[key] <= 0:
+        del counts[key]
+
+
+def _apply(stats, pk, before, after):
+    if before:
+        stats.recipe_count -= 1
+        stats.spice_total -= before['spice_level']
+        _count(stats.category_counts, before['category_id'], -1)
+    if after:
+        stats.recipe_count += 1
+        stats.spice_total += after['spice_level']
+        _count(stats.category_counts, after['category_id'], 1)
+    for name, make_entry, rank in LISTS:
+        entries = getattr(stats, name)
+        old = next((entry for entry in entries if entry[0] == pk), None)
+        new = make_entry(pk, after) if after else None
+        if old and (new is None or rank(new) > rank(old)):
+            # a recipe not in the list may rank before it now
+            entries = None
+        else:
+            entries = sorted([entry for entry in entries if entry[0] != pk] + ([new] if new else []), key=rank)
+            entries = entries[:DASHBOARD_LIST_SIZE]
+        if entries is None or len(entries) < min(DASHBOARD_LIST_SIZE, stats.recipe_count):
+            rows = _lists_query(Recipe.objects.filter(owner_id=stats.pk), name)
+            entries = _entries((row[1:] for row in rows), make_entry)
+        setattr(stats, name, entries)
+
+
+def _change(user_id, update):
+    with transaction.atomic():
+        stats = UserStats.objects.select_for_update().filter(pk=user_id).first()
+        if stats is None:
+            # no row yet: the next dashboard view builds it from the recipes themselves
+            return
+        update(stats)
+        stats.save()
+    transaction.on_commit(partial(mark_stale, user_id))
+
+
+def recipe_changed(pk, before, after):
+    """Apply a recipe going from ``before`` to ``after`` (``recipe_state`` dicts, None: absent)."""
+    if before == after:
+        return
+    before_owner = before['owner_id'] if before else None
+    after_owner = after['owner_id'] if after else None
+    if before_owner and before_owner != after_owner:
+        _change(before_owner, lambda stats: _apply(stats, pk, before, None))
+        before = None
+    if after_owner:
+        _change(after_owner, lambda stats: _apply(stats, pk, before, after))
+
+
+def favorite_changed(user_id, delta):
+    def update(stats):
+        stats.favorite_count = max(stats.favorite_count + delta, 0)
+    _change(user_id, update)
+
+
+# rebuilds
+def _compute(recipes, favorites, user_ids):
+    """Fresh ``UserStats`` of ``user_ids`` from ``recipes`` and ``favorites`` (querysets of those users)."""
+    stats = {user_id: UserStats(user_id=user_id) for user_id in user_ids}
+    totals = recipes.order_by().values('owner').annotate(count=Count('pk'), spice=Sum('spice_level'))
+    for row in totals:
+        stats[row['owner']].recipe_count = row['count']
+        stats[row['owner']].spice_total = row['spice'] or 0
+    for owner, category_id, count in (recipes.order_by().values('owner', 'category')
+                                      .annotate(count=Count('pk')).values_list('owner', 'category', 'count')):
+        _count(stats[owner].category_counts, category_id, count)
+    for user_id, count in favorites.order_by().values('user').annotate(count=Count('pk')).values_list('user', 'count'):
+        stats[user_id].favorite_count = count
+    for name, make_entry, _rank in LISTS:
+        for row in _lists_query(recipes, name):
+            getattr(stats[row[0]], name).extend(_entries([row[1:]], make_entry))
+    return list(stats.values())
+
+
+def _save(rows):
+    UserStats.objects.bulk_create(
+        rows, update_conflicts=True, unique_fields=['user'],
+        update_fields=['recipe_count', 'spice_total', 'favorite_count', 'category_counts', 'recent', 'quickest',
+                       'updated_at'],
+    )
+
+
+def rebuild(user_id):
+    """Recompute one user's row."""
+    rows = _compute(Recipe.objects.filter(owner_id=user_id), FavoriteRecipe.objects.filter(user_id=user_id), [user_id])
+    _save(rows)
+    transaction.on_commit(partial(mark_stale, user_id))
+    return rows[0]
+
+
+def rebuild_all(user_ids):
+    """Recompute the rows of ``user_ids`` in a few grouped queries; returns how many."""
+    rows = _compute(Recipe.objects.filter(owner_id__in=user_ids), FavoriteRecipe.objects.filter(user_id__in=user_ids),
+                    user_ids)
+    _save(rows)
+    get_cache().delete_many([_key(user_id) for user_id in user_ids])
+    return len(rows)
+
+
+# reads
+def payload(stats):
+    """What the dashboard template shows of a ``UserStats`` row."""
+    names = dict(Category.objects.filter(pk__in=[key for key in stats.category_counts if key])
+                 .values_list('pk', 'name'))
+    categories = {}
+    for key, count in stats.category_counts.items():
+        # a deleted category left its recipes uncategorized
+        name = names.get(int(key), 'Uncategorized') if key else 'Uncategorized'
+        categories[name] = categories.get(name, 0) + count
+    return {
+        'recipes': stats.recipe_count,
+        'favorites': stats.favorite_count,
+        'avg_spice': round(stats.spice_total / stats.recipe_count, 1) if stats.recipe_count else None,
+        'categories': sorted(categories.items(), key=lambda item: (-item[1], item[0])),
+        'recent': [{'pk': pk, 'title': title, 'slug': slug} for pk, title, slug in stats.recent],
+        'quickest': [{'pk': pk, 'title': title, 'slug': slug, 'cook': cook}
+                     for pk, title, slug, _minutes, cook in stats.quickest],
+    }
+
+
+def _store(user_id, data):
+    entry = (data, time.time() + _setting('FRESH', 60))
+    get_cache().set(_key(user_id), entry, _setting('FRESH', 60) + _setting('STALE', 600))
+
+
+def load(user_id, build=False):
+    """Read (or with ``build``, rebuild a missing) row into the cache; None without a row."""
+    stats = UserStats.objects.filter(pk=user_id).first()
+    if stats is None and build:
+        stats = rebuild(user_id)
+    if stats is None:
+        return None
+    data = payload(stats)
+    _store(user_id, data)
+    return data
+
+
+def _revalidate_now(user_id):
+    try:
+        load(user_id, build=True)
+    except Exception:
+        logger.exception("Could not refresh the dashboard of user %s", user_id)
+    finally:
+        get_cache().delete(f"{_key(user_id)}:refreshing")
+
+
+def _in_thread(user_id):
+    try:
+        _revalidate_now(user_id)
+    finally:
+        # the thread's own connection
+        connections.close_all()
+
+
+def revalidate(user_id):
+    """Reload the entry in the background, once at a time per user."""
+    if not get_cache().add(f"{_key(user_id)}:refreshing", 1, _setting('FRESH', 60)):
+        return
+    if _setting('EAGER', False):
+        _revalidate_now(user_id)
+    else:
+        threading.Thread(target=_in_thread, args=(user_id,), name='dashboard-refresh', daemon=True).start()
+
+
+def mark_stale(user_id):
+    """Serve the entry once more, reloaded in the background."""
+    cache = get_cache()
+    entry = cache.get(_key(user_id))
+    if entry is not None:
+        cache.set(_key(user_id), (entry[0], 0), _setting('STALE', 600))
+
+
+def dashboard(user):
+    """The dashboard data of ``user``, None while it is being built."""
+    entry = get_cache().get(_key(user.pk))
+    if entry is None:
+        data = load(user.pk)
+        if data is None:
+            revalidate(user.pk)
+            # built by the eager revalidation, or the next view
+            entry = get_cache().get(_key(user.pk))
+            return entry[0] if entry else None
+        return data
+    data, fresh_until = entry
+    if fresh_until <= time.time():
+        revalidate(user.pk)
+    return data
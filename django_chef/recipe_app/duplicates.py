@@ -0,0 +1,152 @@
+"""
+Near-duplicate recipe detection and merging.
+
+Recipes are blocked by ``(owner, slug)`` so only recipes of the same user with
+the same normalized title are ever compared. Candidates inside a block are
+scored by Jaccard similarity of their shingled ingredient names and step text.
+The recipe table is streamed in slug order, and ingredients/steps are only
+loaded for blocks that actually hold more than one recipe, a batch at a time.
+"""
+import re
+import zlib
+from itertools import groupby
+
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.functions import Length
+
+from .models import Recipe, Ingredient, Step, FavoriteRecipe
+
+WORD_RE = re.compile(r"[a-z0-9]+")
+
+INGREDIENT_WEIGHT = 0.6
+STEP_WEIGHT = 0.4
+
+
+# shingles
+def _hash(text):
+    return zlib.crc32(text.encode())
+
+
+def ingredient_shingles(names):
+    """Hash each normalized ingredient name, so order and casing don't matter."""
+    return {_hash(" ".join(WORD_RE.findall(name.lower()))) for name in names}
+
+
+def text_shingles(texts, size=3):
+    """Hash every ``size``-word window of the combined step text."""
+    words = WORD_RE.findall(" ".join(texts).lower())
+    if len(words) < size:
+        return {_hash(" ".join(words))} if words else set()
+    return {_hash(" ".join(words[i:i + size])) for i in range(len(words) - size + 1)}
+
+
+def jaccard(a, b):
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def similarity(a, b):
+    """Weighted ingredient/step similarity between two candidate dicts."""
+    return (INGREDIENT_WEIGHT * jaccard(a['ingredients'], b['ingredients'])
+            + STEP_WEIGHT * jaccard(a['steps'], b['steps']))
+
+
+# detection
+def _load_candidates(ids):
+    """Load the shingles and "richness" for a batch of recipe ids in 3 queries."""
+    candidates = {
+        row['pk']: {
+            'pk': row['pk'],
+            'richness': (row['n_ingredients'] + row['n_steps'], bool(row['image']), row['description_length'], -row['pk']),
+            'ingredients': [],
+            'steps': [],
+        }
+        for row in Recipe.objects.filter(pk__in=ids).values('pk', 'image').annotate(
+            n_ingredients=Count('ingredients', distinct=True),
+            n_steps=Count('steps', distinct=True),
+            description_length=Length('description'),
+        )
+    }
+    for recipe_id, name in Ingredient.objects.filter(recipe_id__in=ids).values_list('recipe_id', 'name'):
+        candidates[recipe_id]['ingredients'].append(name)
+    for recipe_id, text in Step.objects.filter(recipe_id__in=ids).order_by().values_list('recipe_id', 'step'):
+        candidates[recipe_id]['steps'].append(text)
+
+    for candidate in candidates.values():
+        candidate['ingredients'] = ingredient_shingles(candidate['ingredients'])
+        candidate['steps'] = text_shingles(candidate['steps'])
+    return candidates
+
+
+def _cluster(block, candidates, threshold):
+    """Greedily group a block around its richest recipes; yield groups of 2+."""
+    members = sorted((candidates[pk] for pk in block), key=lambda c: c['richness'], reverse=True)
+    clusters = []
+    for candidate in members:
+        for cluster in clusters:
+            if similarity(cluster[0], candidate) >= threshold:
+                cluster.append(candidate)
+                break
+        else:
+            clusters.append([candidate])
+
+    for cluster in clusters:
+        if len(cluster) > 1:
+            yield [c['pk'] for c in cluster]
+
+
+def find_duplicates(queryset=None, threshold=0.8, chunk_size=2000):
+    """Yield lists of duplicate recipe ids, richest recipe first.
+
+    Only ``(pk, owner_id, slug)`` is streamed for the whole table; children are
+    loaded for about ``chunk_size`` recipes at a time.
+    """
+    queryset = Recipe.objects.all() if queryset is None else queryset
+    rows = (queryset.order_by('owner_id', 'slug', 'pk')
+            .values_list('pk', 'owner_id', 'slug')
+            .iterator(chunk_size=chunk_size))
+
+    pending = []
+    pending_size = 0
+    for _key, block in groupby(rows, key=lambda row: (row[1], row[2])):
+        block = [row[0] for row in block]
+        if len(block) < 2:
+            continue
+        pending.append(block)
+        pending_size += len(block)
+        if pending_size >= chunk_size:
+            yield from _score(pending, threshold)
+            pending, pending_size = [], 0
+    if pending:
+        yield from _score(pending, threshold)
+
+
+def _score(blocks, threshold):
+    candidates = _load_candidates([pk for block in blocks for pk in block])
+    for block in blocks:
+        yield from _cluster(block, candidates, threshold)
+
+
+# merging
+def merge_recipes(keep_id, duplicate_ids):
+    """Fold ``duplicate_ids`` into ``keep_id`` and delete the duplicates.
+
+    Favorites are moved over to the kept recipe unless the user already
+    favorited it. Returns the number of recipes deleted.
+    """
+    with transaction.atomic():
+        favorited = set(FavoriteRecipe.objects.filter(recipe_id=keep_id).values_list('user_id', flat=True))
+        FavoriteRecipe.objects.filter(recipe_id__in=duplicate_ids, user_id__in=favorited).delete()
+
+        # a user may have favorited several of the duplicates; keep one row each
+        for favorite_id, user_id in (FavoriteRecipe.objects.filter(recipe_id__in=duplicate_ids)
+                                     .order_by('added_on').values_list('pk', 'user_id')):
+            if user_id in favorited:
+                continue
+            FavoriteRecipe.objects.filter(pk=favorite_id).update(recipe_id=keep_id)
+            favorited.add(user_id)
+
+        _total, per_model = Recipe.objects.filter(pk__in=duplicate_ids).delete()
+        return per_model.get(Recipe._meta.label, 0)
@@ -0,0 +1,260 @@
+"""
+Activity log: who created, edited, deleted or favorited what.
+
+``record`` never touches the database. It appends the event to an
+in-process buffer, and a daemon thread writes the buffer out in one batch
+every ``EVENT_LOG_FLUSH_INTERVAL`` seconds, or as soon as it holds
+``EVENT_LOG_BATCH_SIZE`` events. The batch goes to ``EVENT_LOG_SINK``:
+
+* ``'db'``: one ``bulk_create`` into ``Event``,
+* ``'jsonl'``: appended to an append-only file per day in ``EVENT_LOG_DIR``.
+
+Either way the log is split by day: ``prune`` drops whole days older than
+``EVENT_LOG_RETENTION_DAYS``. A day is a file with the ``'jsonl'`` sink; in
+the table (SQLite has no partitions) it is a ``created_at`` range, deleted
+oldest day first and at most ``PRUNE_BATCH`` rows per statement, so no single
+delete holds the table for long. Events still in the buffer when the process
+exits are written by an ``atexit`` hook; a hard kill loses at most one
+interval. ``EVENT_LOG_EAGER`` writes every event at once, for tests.
+
+``recipe_feed`` returns a recipe's events newest first, including the ones
+of this process that are not written yet. From the files it reads the days
+of the last ``EVENT_LOG_FEED_DAYS`` that exist, newest first, and stops as
+soon as it has enough.
+
+Views log through ``EventLogMixin`` (generic create/update/delete views) or
+by calling ``record`` themselves.
+"""
+import atexit
+import json
+import logging
+import os
+import threading
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.utils import timezone
+from django.views.generic.edit import CreateView, DeletionMixin
+
+from .models import Event, FavoriteRecipe, Ingredient, Recipe, Step
+
+logger = logging.getLogger(__name__)
+
+PRUNE_BATCH = 10_000
+# the field naming an object in the log, str() for anything else
+LABEL_FIELDS = {
+    'recipe': 'title',
+    'ingredient': 'name',
+    'step': 'step',
+    'category': 'name',
+    'ingreadientmeasure': 'measure',
+    'customuser': 'username',
+}
+
+
+def _setting(name, default):
+    return getattr(settings, f"EVENT_LOG_{name}", default)
+
+
+def describe(obj):
+    """The object fields of an event for a model instance."""
+    if isinstance(obj, Recipe):
+        recipe_id = obj.pk
+    elif isinstance(obj, (Ingredient, Step, FavoriteRecipe)):
+        recipe_id = obj.recipe_id
+    else:
+        recipe_id = None
+    model_name = obj._meta.model_name
+    label = getattr(obj, LABEL_FIELDS[model_name]) if model_name in LABEL_FIELDS else str(obj)
+    return {'object_type': model_name, 'object_id': obj.pk, 'recipe_id': recipe_id, 'label': str(label)[:200]}
+
+
+def actor(user):
+    """The actor fields of an event; take them before deleting the user's own account."""
+    if user is None or not user.is_authenticated:
+        return {'actor_id': None, 'actor_name': ''}
+    return {'actor_id': user.pk, 'actor_name': user.get_username()}
+
+
+def log(actor_fields, action, object_fields, data=None):
+    event = {'created_at': timezone.now(), **actor_fields, 'action': action, **object_fields, 'data': data or {}}
+    if _setting('EAGER', False):
+        write([event])
+    else:
+        buffer.add(event)
+
+
+def record(user, action, obj, **data):
+    """Log that ``user`` did ``action`` to ``obj``; ``data`` is stored alongside."""
+    log(actor(user), action, describe(obj), data)
+
+
+# sinks
+def _day_path(day):
+    return Path(_setting('DIR', settings.BASE_DIR / 'event_log')) / f"{day:%Y-%m-%d}.jsonl"
+
+
+def write(events):
+    """Write a batch of event dicts to the configured sink."""
+    if _setting('SINK', 'db') == 'jsonl':
+        by_day = {}
+        for event in events:
+            by_day.setdefault(event['created_at'].date(), []).append(event)
+        for day, day_events in by_day.items():
+            path = _day_path(day)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with path.open('a', encoding='utf-8') as out:
+                out.write(''.join(json.dumps(e, cls=DjangoJSONEncoder) + '\n' for e in day_events))
+    else:
+        Event.objects.bulk_create([Event(**event) for event in events])
+
+
+class EventBuffer:
+    """Events waiting for the flusher thread; one per process."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        # held while a batch is written, so a flush at exit waits for the thread's batch
+        self.write_lock = threading.Lock()
+        self.pending = []
+        self.wakeup = threading.Event()
+        self.pid = None
+
+    def add(self, event):
+        with self.lock:
+            if self.pid != os.getpid():
+                self._start()
+            self.pending.append(event)
+            full = len(self.pending) >= _setting('BATCH_SIZE', 100)
+        if full:
+            self.wakeup.set()
+
+    def _start(self):
+        # first event of this process; after a fork the parent's events are the parent's to write
+        self.pid = os.getpid()
+        self.pending = []
+        threading.Thread(target=self._run, name='event-log-flusher', daemon=True).start()
+
+    def _run(self):
+        while True:
+            self.wakeup.wait(_setting('FLUSH_INTERVAL', 5))
+            self.wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                # never let a failed batch stop the thread, later ones would pile up
+                logger.exception("Could not write a batch of events")
+            finally:
+                # the thread's own connection, not kept open between batches
+                connections.close_all()
+
+    def flush(self):
+        with self.write_lock:
+            with self.lock:
+                batch, self.pending = self.pending, []
+            if batch:
+                write(batch)
+
+    def snapshot(self):
+        with self.lock:
+            return list(self.pending)
+
+
+buffer = EventBuffer()
+atexit.register(buffer.flush)
+
+
+# queries
+def _read_day(path):
+    with path.open(encoding='utf-8') as lines:
+        return [json.loads(line) for line in lines if line.strip()]
+
+
+def _day_files(since):
+    """The day files from ``since`` on, newest first; one directory listing."""
+    folder = _day_path(since).parent
+    files = []
+    for path in folder.glob('*.jsonl') if folder.exists() else []:
+        try:
+            day = date.fromisoformat(path.stem)
+        except ValueError:
+            continue
+        if day >= since:
+            files.append((day, path))
+    return [path for _day, path in sorted(files, reverse=True)]
+
+
+def _as_event(values):
+    values = dict(values)
+    if isinstance(values['created_at'], str):
+        values['created_at'] = datetime.fromisoformat(values['created_at'])
+    return Event(**values)
+
+
+def recipe_feed(recipe_id, limit=50):
+    """A recipe's most recent events, newest first."""
+    events = [_as_event(e) for e in buffer.snapshot() if e['recipe_id'] == recipe_id]
+    if _setting('SINK', 'db') == 'jsonl':
+        days = min(_setting('FEED_DAYS', 30), _setting('RETENTION_DAYS', 180))
+        for path in _day_files(timezone.now().date() - timedelta(days=days)):
+            if len(events) >= limit:
+                break
+            events += [_as_event(e) for e in _read_day(path) if e['recipe_id'] == recipe_id]
+    else:
+        events += list(Event.objects.filter(recipe_id=recipe_id).order_by('-created_at')[:limit])
+    events.sort(key=lambda event: event.created_at, reverse=True)
+    return events[:limit]
+
+
+# retention
+def prune(days=None):
+    """Drop the days older than the retention period; returns how many events went."""
+    days = _setting('RETENTION_DAYS', 180) if days is None else days
+    cutoff = timezone.now() - timedelta(days=days)
+    removed = 0
+    if _setting('SINK', 'db') == 'jsonl':
+        folder = _day_path(cutoff.date()).parent
+        for path in sorted(folder.glob('*.jsonl')) if folder.exists() else []:
+            try:
+                day = date.fromisoformat(path.stem)
+            except ValueError:
+                continue
+            if day < cutoff.date():
+                with path.open(encoding='utf-8') as lines:
+                    removed += sum(1 for _ in lines)
+                path.unlink()
+        return removed
+    while True:
+        # a day at a time through the created_at index, like dropping a partition
+        start = (Event.objects.filter(created_at__lt=cutoff).order_by('created_at')
+                 .values_list('created_at', flat=True).first())
+        if start is None:
+            return removed
+        day = Event.objects.filter(created_at__gte=start, created_at__lt=min(start + timedelta(days=1), cutoff))
+        while True:
+            # small deletes keep the table available to the flusher
+            deleted = Event.objects.filter(pk__in=list(day.values_list('pk', flat=True)[:PRUNE_BATCH])).delete()[0]
+            removed += deleted
+            if deleted < PRUNE_BATCH:
+                break
+
+
+# views
+class EventLogMixin:
+    """Log the object a generic create, update or delete view saved or deleted."""
+    event_action = None
+
+    def form_valid(self, form):
+        deleting = isinstance(self, DeletionMixin)
+        if deleting:
+            action = self.event_action or Event.DELETE
+        else:
+            action = self.event_action or (Event.CREATE if isinstance(self, CreateView) else Event.UPDATE)
+        # taken first: deleting clears the pk (and DelUserView deletes request.user itself)
+        actor_fields = actor(self.request.user)
+        object_fields = describe(self.object) if deleting else None
+        response = super().form_valid(form)
+        log(actor_fields, action, object_fields or describe(self.object))
+        return response
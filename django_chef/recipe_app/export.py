@@ -0,0 +1,206 @@
+"""
+Printable cookbook export (HTML or PDF) of a user's recipes or favorites.
+
+Recipes are read with ``.iterator(chunk_size=EXPORT_CHUNK_SIZE)``, which
+runs the ingredient and step prefetches once per chunk, so only one chunk is
+in memory at a time. They come ordered by category and are written chapter
+by chapter as they are read:
+
+* ``chunks`` feeds a ``StreamingHttpResponse`` for books of up to
+  ``EXPORT_STREAM_MAX`` recipes, exported while the user waits;
+* bigger books are written to storage by the ``export_cookbook`` task
+  (``request_export``), and ``ExportCookbook`` serves the file once it is
+  there. The file name is derived from the book's contents, so an unchanged
+  book is never exported twice.
+
+Images are embedded as JPEG renditions at most ``EXPORT_IMAGE_SIZE`` pixels
+on their longest side, made once and kept in storage under ``renditions/``.
+"""
+import base64
+import io
+import tempfile
+from itertools import groupby
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db.models import Count, Max, Sum
+from django.template.loader import get_template
+from django.utils import timezone
+from django.utils.crypto import salted_hmac
+from PIL import Image, UnidentifiedImageError
+
+from . import pdf
+from .models import Recipe, Task
+from .tasks import export_cookbook
+
+SCOPES = {'book': 'Recipe Book', 'favorites': 'Favorite Recipes'}
+CONTENT_TYPES = {'html': 'text/html; charset=utf-8', 'pdf': 'application/pdf'}
+UNCATEGORIZED = 'Uncategorized'
+
+
+def export_queryset(user, scope):
+    recipes = Recipe.objects.filter(favoriterecipe__user=user) if scope == 'favorites' else user.recipes.all()
+    return (recipes.select_related('category')
+            .prefetch_related('ingredients__measure', 'steps')
+            .order_by('category__name', 'title', 'pk'))
+
+
+def iterate(recipes):
+    return recipes.iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+
+
+def chapters(recipes):
+    """``(category name, recipes)`` pairs in the queryset's category order."""
+    return groupby(iterate(recipes), key=lambda recipe: recipe.category.name if recipe.category else UNCATEGORIZED)
+
+
+def filename(scope, fmt):
+    return f"django-chef-{scope}.{fmt}"
+
+
+def title(user, scope):
+    return f"{user.username}'s {SCOPES[scope]}"
+
+
+# images
+def rendition_name(name):
+    return f"renditions/{settings.EXPORT_IMAGE_SIZE}/{name}.jpg"
+
+
+def rendition(image):
+    """``(jpeg bytes, width, height)`` of a downscaled copy of ``image``, None without a usable file."""
+    if not image:
+        return None
+    name = rendition_name(image.name)
+    try:
+        if default_storage.exists(name):
+            with default_storage.open(name, 'rb') as stored:
+                data = stored.read()
+            with Image.open(io.BytesIO(data)) as picture:
+                return data, picture.width, picture.height
+        with default_storage.open(image.name, 'rb') as original, Image.open(original) as picture:
+            picture.thumbnail((settings.EXPORT_IMAGE_SIZE, settings.EXPORT_IMAGE_SIZE))
+            picture = picture.convert('RGB')
+            buffer = io.BytesIO()
+            picture.save(buffer, 'JPEG', quality=75, optimize=True)
+            buffer.seek(0)
+    except (OSError, UnidentifiedImageError):
+        # missing or broken upload, export the recipe without it
+        return None
+    default_storage.save(name, buffer)
+    return buffer.getvalue(), picture.width, picture.height
+
+
+# html
+def html_chunks(user, scope, recipes):
+    start = get_template('recipe_app/export/cookbook_start.html')
+    chapter = get_template('recipe_app/export/cookbook_chapter.html')
+    recipe_template = get_template('recipe_app/export/cookbook_recipe.html')
+    end = get_template('recipe_app/export/cookbook_end.html')
+
+    yield start.render({'title': title(user, scope), 'exported_on': timezone.now()})
+    for category, group in chapters(recipes):
+        yield chapter.render({'category': category})
+        for recipe in group:
+            image = rendition(recipe.image)
+            image_src = f"data:image/jpeg;base64,{base64.b64encode(image[0]).decode()}" if image else None
+            yield recipe_template.render({'recipe': recipe, 'image_src': image_src})
+    yield end.render({})
+
+
+# pdf
+def pdf_chunks(user, scope, recipes):
+    buffer = []
+    doc = pdf.Document(pdf.PdfWriter(buffer.append, title=title(user, scope)))
+    # an image used by several recipes is embedded once
+    image_ids = {}
+
+    doc.space(220)
+    doc.text('Django Chef', 32, bold=True, center=True)
+    doc.space(12)
+    doc.text(title(user, scope), 18, center=True)
+    doc.text(f"Exported on {timezone.now():%B %d, %Y}", 11, center=True)
+    for category, group in chapters(recipes):
+        doc.new_page()
+        doc.space(300)
+        doc.text(category, 28, bold=True, center=True)
+        for recipe in group:
+            doc.new_page()
+            _pdf_recipe(doc, recipe, image_ids)
+            yield b''.join(buffer)
+            buffer.clear()
+    doc.close()
+    yield b''.join(buffer)
+
+
+def _pdf_recipe(doc, recipe, image_ids):
+    category = recipe.category.name if recipe.category else UNCATEGORIZED
+    doc.text(recipe.title, 20, bold=True)
+    doc.text(f"{category} | Prep: {recipe.get_prep_display()} | Cook: {recipe.get_cook_display()} "
+             f"| Spice Level: {recipe.spice_level} of 5", 10)
+    doc.space(10)
+    if recipe.image and recipe.image.name not in image_ids:
+        image = rendition(recipe.image)
+        image_ids[recipe.image.name] = (doc.writer.image(*image), *image[1:]) if image else None
+    if recipe.image and image_ids[recipe.image.name]:
+        doc.image(*image_ids[recipe.image.name])
+        doc.space(10)
+    doc.text(recipe.description)
+    doc.space(10)
+    doc.text('Ingredients', 14, bold=True)
+    for ingredient in recipe.ingredients.all():
+        amount = f"{ingredient.quantity or ''} {ingredient.measure or ''}".strip()
+        doc.text(f"- {ingredient.name}{': ' + amount if amount else ''}", indent=12)
+    doc.space(10)
+    doc.text('Instructions', 14, bold=True)
+    for number, step in enumerate(recipe.steps.all(), 1):
+        doc.text(f"{number}. {step.step}", indent=12)
+
+
+def chunks(fmt, user, scope, recipes):
+    return html_chunks(user, scope, recipes) if fmt == 'html' else pdf_chunks(user, scope, recipes)
+
+
+# background exports
+def export_name(user, scope, fmt, recipes):
+    """Storage name of the export of ``recipes``; changes whenever the book does."""
+    state = recipes.order_by().aggregate(count=Count('pk'), changed=Max('updated_at'), ids=Sum('pk'))
+    digest = salted_hmac('recipe_app.export', f"{user.pk}:{scope}:{state}").hexdigest()[:20]
+    return f"exports/{user.pk}/cookbook-{scope}-{digest}.{fmt}"
+
+
+def request_export(user, scope, fmt, recipes, retry=False):
+    """Return ``(storage name, task)``; the task is None once the file exists.
+
+    A failed export stays failed (and is reported) until ``retry`` is set.
+    """
+    name = export_name(user, scope, fmt, recipes)
+    if default_storage.exists(name):
+        return name, None
+    # a finished task whose file has been deleted since runs again
+    Task.objects.filter(idempotency_key=name, status__in=[Task.DONE, Task.FAILED] if retry else [Task.DONE]).delete()
+    task = export_cookbook.enqueue(user.pk, scope, fmt, name, idempotency_key=name)
+    if default_storage.exists(name):
+        # TASK_ALWAYS_EAGER
+        return name, None
+    return name, task
+
+
+def write_export(user, scope, fmt, name):
+    """Write the cookbook to storage under ``name`` through a temporary file."""
+    recipes = export_queryset(user, scope)
+    with tempfile.TemporaryFile() as tmp:
+        for chunk in chunks(fmt, user, scope, recipes):
+            tmp.write(chunk.encode() if isinstance(chunk, str) else chunk)
+        tmp.seek(0)
+        if default_storage.exists(name):
+            default_storage.delete(name)
+        default_storage.save(name, File(tmp))
+
+    # older exports of the same book and format are superseded
+    folder, _, current = name.rpartition('/')
+    prefix = f"cookbook-{scope}-"
+    for old in default_storage.listdir(folder)[1]:
+        if old.startswith(prefix) and old.endswith(f".{fmt}") and old != current:
+            default_storage.delete(f"{folder}/{old}")
@@ -12,8 +12,12 @@ class RecipeForm(forms.ModelForm):
             'cook_time', 'cook_time_unit',
             'spice_level',
             'category',
-            'image'
+            'image',
+            'is_public',
         ]
+        labels = {
+            'is_public': 'Share publicly',
+        }
         widgets = {
             'title': forms.TextInput(attrs={
                 'class': 'form-control',
@@ -49,6 +53,9 @@ class RecipeForm(forms.ModelForm):
             'image': forms.ClearableFileInput(attrs={
                 'class': 'form-control'
             }),
+            'is_public': forms.CheckboxInput(attrs={
+                'class': 'form-check-input'
+            }),
         }
     
     def __init__(self, *args, **kwargs):
@@ -78,12 +85,21 @@ class IngredientsForm(forms.ModelForm):
 class StepsForm(forms.ModelForm):
     class Meta:
         model = Step
-        fields = ['step_number', 'step']
+        fields = ['step']
         widgets = {
-            'step_number': forms.NumberInput(attrs={'class': 'form-control', 'placeholder': '1 or 2 etc...'}),
             'step': forms.Textarea(attrs={'class': 'form-control', 'rows': 3, 'placeholder': 'Instruction'}),
         }
 
+# a step added to an existing recipe: where it goes, step_number is its ordering key (see step_order.py)
+class InstructionForm(StepsForm):
+    position = forms.IntegerField(
+        min_value=1, required=False, label='Step number',
+        help_text='Leave empty to add it as the last step.',
+        widget=forms.NumberInput(attrs={'class': 'form-control', 'placeholder': '1 or 2 etc...'}),
+    )
+
+    field_order = ['position', 'step']
+
 class CustomUserCreation(UserCreationForm):
     class Meta:
         model = CustomUser
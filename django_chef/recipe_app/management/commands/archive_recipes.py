@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from recipe_app import archive
+
+
+class Command(BaseCommand):
+    help = ("Move recipes untouched for ARCHIVE_AFTER_MONTHS (and their ingredients, steps, favorites and "
+            "versions) into the archive, a batch per transaction (run daily, e.g. from cron).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months', type=int, help="Archive recipes untouched for this many months.")
+        parser.add_argument('--batch-size', type=int, help="Recipes moved per transaction.")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        moved = 0
+        for moved in archive.archive_stale(options['months'], options['batch_size']):
+            if options['verbosity'] > 1:
+                self.stdout.write(f"{moved:,} recipes archived...")
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {moved:,} recipes in {time.perf_counter() - started:.1f}s (into '{archive.archive_database()}')."))
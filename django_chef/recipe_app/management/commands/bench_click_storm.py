@@ -0,0 +1,82 @@
+import logging
+import random
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from recipe_app import throttling
+from recipe_app.models import CustomUser, Recipe
+
+WRITES = ('INSERT', 'UPDATE', 'DELETE')
+
+
+class Command(BaseCommand):
+    help = "Count DB writes under a synthetic click-storm with and without throttling (rolled back)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10, help="Users clicking.")
+        parser.add_argument('--storms', type=int, default=10, help="Click bursts per user.")
+        parser.add_argument('--max-clicks', type=int, default=5, help="Most clicks in one burst.")
+        parser.add_argument('--script-posts', type=int, default=200,
+                            help="Favorite toggles fired by one scripted client.")
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        # every rejected request would log a "Too Many Requests" warning
+        logging.getLogger('django.request').setLevel(logging.ERROR)
+        results = {}
+        for label, enabled in (('unthrottled', False), ('throttled', True)):
+            throttling.get_cache().clear()
+            with override_settings(THROTTLE_ENABLED=enabled), transaction.atomic():
+                results[label] = self.storm(options)
+                transaction.set_rollback(True)
+        throttling.get_cache().clear()
+
+        self.stdout.write(f"{'':12} {'requests':>9} {'db writes':>10} {'429s':>6}")
+        for label, (requests, writes, limited) in results.items():
+            self.stdout.write(f"{label:12} {requests:>9} {writes:>10} {limited:>6}")
+        saved = 1 - results['throttled'][1] / results['unthrottled'][1]
+        self.stdout.write(f"writes saved: {saved:.1%}")
+
+    def storm(self, options):
+        rng = random.Random(options['seed'])
+        users = []
+        for i in range(options['users']):
+            user = CustomUser.objects.create_user(f"storm_{i}", f"storm_{i}@example.com", 'bench-password')
+            recipes = Recipe.objects.bulk_create(
+                Recipe(title=f"Storm Recipe {i}-{n}", slug=f"storm-recipe-{i}-{n}", description="Storm.",
+                       prep_time=5, cook_time=10, owner=user)
+                for n in range(5)
+            )
+            client = Client(HTTP_HOST='localhost')
+            client.force_login(user)
+            users.append((user, recipes, client))
+
+        requests = limited = 0
+        with CaptureQueriesContext(connection) as queries:
+            for storm in range(options['storms']):
+                for user, recipes, client in users:
+                    # impatient double/triple clicks on one favorite button
+                    url = reverse('toggle_favorite', args=[rng.choice(recipes).pk])
+                    for _ in range(rng.randint(1, options['max_clicks'])):
+                        limited += client.post(url).status_code == 429
+                        requests += 1
+                    # a create form submitted twice
+                    for _ in range(2):
+                        response = client.post(reverse('create_category'), {'name': f"Storm {user.pk}-{storm}"})
+                        limited += response.status_code == 429
+                        requests += 1
+
+            # a script toggling every recipe it can see, as fast as it can
+            all_recipes = [recipe for _user, recipes, _client in users for recipe in recipes]
+            client = users[0][2]
+            for n in range(options['script_posts']):
+                url = reverse('toggle_favorite', args=[all_recipes[n % len(all_recipes)].pk])
+                limited += client.post(url).status_code == 429
+                requests += 1
+
+        writes = sum(q['sql'].lstrip().upper().startswith(WRITES) for q in queries.captured_queries)
+        return requests, writes, limited
@@ -0,0 +1,73 @@
+import gc
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipe_app import read_models
+from recipe_app.models import Category, CustomUser, FavoriteRecipe, Ingredient, Recipe
+
+
+class Command(BaseCommand):
+    help = ("Compare memory and latency of building the recipe list and favorites cards from model instances "
+            "and from read models (rolled back afterwards).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cards', type=int, default=10_000, help="Recipes (and favorites) to list.")
+        parser.add_argument('--ingredients', type=int, default=8, help="Ingredients per recipe.")
+        parser.add_argument('--repeat', type=int, default=5, help="Timed runs per variant, the best one counts.")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.run(options)
+            transaction.set_rollback(True)
+
+    def run(self, options):
+        user = CustomUser.objects.create_user('bench_cards', 'bench_cards@example.com', 'bench')
+        categories = [Category.objects.get_or_create(name=f"Bench Category {i}")[0] for i in range(10)]
+        recipes = Recipe.objects.bulk_create(
+            Recipe(title=f"Bench Recipe {i:05}", slug=f"bench-recipe-{i:05}", description="A long description. " * 40,
+                   prep_time=5 + i % 40, cook_time=10 + i % 90, prep_time_unit='min', cook_time_unit='min',
+                   spice_level=i % 6, category=categories[i % 10], owner=user, image=f"recipe_images/bench_{i}.jpg")
+            for i in range(options['cards'])
+        )
+        Ingredient.objects.bulk_create(
+            Ingredient(recipe=recipe, name=f"Ingredient {n}", quantity=str(n))
+            for recipe in recipes for n in range(options['ingredients'])
+        )
+        FavoriteRecipe.objects.bulk_create(FavoriteRecipe(user=user, recipe=recipe) for recipe in recipes)
+
+        def own_recipes():
+            return Recipe.objects.for_user(user).with_is_fav(user).order_by('title')
+
+        variants = [
+            ("recipe list, model instances", lambda: list(
+                own_recipes().select_related('category').prefetch_related('ingredients'))),
+            ("recipe list, read models", lambda: read_models.recipe_cards(own_recipes(), with_ingredients=True)),
+            ("favorites, model instances", lambda: list(
+                FavoriteRecipe.objects.filter(user=user).select_related('recipe__category'))),
+            ("favorites, read models", lambda: read_models.favorite_cards(user)),
+        ]
+        self.stdout.write(f"{options['cards']:,} cards, {options['ingredients']} ingredients each")
+        self.stdout.write(f"{'':32} {'best':>9} {'retained':>10} {'peak':>10}")
+        for name, build in variants:
+            best = min(self.timed(build) for _ in range(options['repeat']))
+            retained, peak = self.traced(build)
+            self.stdout.write(f"{name:32} {best * 1000:7.1f}ms {retained / 2**20:8.1f}MB {peak / 2**20:8.1f}MB")
+
+    def timed(self, build):
+        gc.collect()
+        started = time.perf_counter()
+        build()
+        return time.perf_counter() - started
+
+    def traced(self, build):
+        """Bytes still held by the built cards, and the most held while building them."""
+        gc.collect()
+        tracemalloc.start()
+        cards = build()
+        retained, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del cards
+        return retained, peak
@@ -0,0 +1,44 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from recipe_app import pantry
+from recipe_app.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = "Measure pantry search latency over random pantries drawn from the built index."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--searches', type=int, default=200, help="Searches to time.")
+        parser.add_argument('--items', type=int, default=8, help="Ingredients per pantry.")
+        parser.add_argument('--user', help="Username to search as (default: the first user).")
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        index = pantry.get_index()
+        if index is None:
+            raise CommandError("No pantry index yet, run build_pantry_index first.")
+        users = CustomUser.objects.order_by('pk')
+        user = users.get(username=options['user']) if options['user'] else users.first()
+        if user is None:
+            raise CommandError("There are no users to search as.")
+
+        rng = random.Random(options['seed'])
+        vocabulary = sorted(index.vocabulary)
+        timings = []
+        for _ in range(options['searches']):
+            items = frozenset(rng.sample(vocabulary, min(options['items'], len(vocabulary))))
+            started = time.perf_counter()
+            pantry.search(items, user)
+            timings.append((time.perf_counter() - started) * 1000)
+
+        timings.sort()
+        self.stdout.write(f"engine:          {'numpy' if pantry.numpy is not None else 'pure python'}")
+        self.stdout.write(f"indexed recipes: {len(index.doc_ids):,} ({len(vocabulary):,} ingredients, "
+                          f"{len(index.postings):,} postings, {len(index.changes):,} replayed changes)")
+        self.stdout.write(f"search p50:      {statistics.median(timings):.2f} ms")
+        self.stdout.write(f"search p95:      {timings[int(len(timings) * 0.95) - 1]:.2f} ms")
+        self.stdout.write(f"search max:      {timings[-1]:.2f} ms")
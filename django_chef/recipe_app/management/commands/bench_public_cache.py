@@ -0,0 +1,60 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from recipe_app import public_cache
+from recipe_app.models import Recipe, Ingredient, Step
+
+
+class Command(BaseCommand):
+    help = "Measure the shared-cache hit rate of public recipe pages under anonymous traffic (rolled back afterwards)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=1000, help="Anonymous page views to simulate.")
+        parser.add_argument('--recipes', type=int, default=20, help="Public recipes to spread the views over.")
+        parser.add_argument('--update-every', type=int, default=100,
+                            help="Edit one recipe every N views to exercise purging.")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.run(options)
+            transaction.set_rollback(True)
+
+    def run(self, options):
+        recipes = []
+        for i in range(options['recipes']):
+            recipe = Recipe.objects.create(
+                title=f"Shared Recipe {i}", description="Shared with everyone.",
+                prep_time=10, cook_time=20, is_public=True,
+            )
+            Ingredient.objects.create(recipe=recipe, name="Salt", quantity="1")
+            Step.objects.create(recipe=recipe, step_number=1, step="Cook it.")
+            recipes.append(recipe)
+
+        public_cache.get_cache().clear()
+        client = Client(HTTP_HOST='localhost')
+        session_queries = 0
+        vary_cookie = 0
+        started = time.perf_counter()
+        for n in range(options['requests']):
+            recipe = recipes[n % len(recipes)]
+            if options['update_every'] and n and n % options['update_every'] == 0:
+                recipe.description += " Updated."
+                recipe.save()
+
+            with CaptureQueriesContext(connection) as queries:
+                response = client.get(reverse('public_recipe', args=[recipe.pk, recipe.slug]))
+            session_queries += sum('django_session' in q['sql'] for q in queries.captured_queries)
+            vary_cookie += 'cookie' in response.get('Vary', '').lower()
+        elapsed = time.perf_counter() - started
+
+        stats = public_cache.stats()
+        self.stdout.write(f"requests:          {options['requests']}")
+        self.stdout.write(f"cache hits/misses: {stats['hits']}/{stats['misses']} ({stats['hit_rate']:.1%} hit rate)")
+        self.stdout.write(f"session queries:   {session_queries}")
+        self.stdout.write(f"Vary: Cookie:      {vary_cookie}")
+        self.stdout.write(f"mean latency:      {elapsed / options['requests'] * 1000:.2f} ms")
@@ -0,0 +1,128 @@
+import multiprocessing
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from recipe_app.models import Category, CustomUser, FavoriteRecipe, Recipe
+from recipe_app.replicas import ReplicationLagSimulator, replicas, sync_replicas
+
+USERNAME = 'replica_bench'
+
+
+class Command(BaseCommand):
+    help = ("Check read-your-writes and measure read throughput with and without replicas "
+            "(needs DJANGO_CHEF_SQLITE_REPLICA=1; the bench user is deleted afterwards).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lag', type=float, default=0.5, help="Simulated replication lag in seconds.")
+        parser.add_argument('--toggles', type=int, default=20, help="Favorite toggles per consistency check.")
+        parser.add_argument('--readers', type=int, default=4, help="Concurrent reader processes.")
+        parser.add_argument('--seconds', type=float, default=5.0, help="Duration of each throughput run.")
+        parser.add_argument('--recipes', type=int, default=30, help="Recipes owned by the bench user.")
+        parser.add_argument('--write-pause', type=float, default=0.05,
+                            help="Seconds the writer waits between write transactions.")
+
+    def handle(self, *args, **options):
+        if not replicas():
+            raise CommandError("No DATABASE_REPLICAS configured, set DJANGO_CHEF_SQLITE_REPLICA=1.")
+
+        CustomUser.objects.filter(username=USERNAME).delete()
+        self.user = CustomUser.objects.create_user(USERNAME, f"{USERNAME}@example.com", 'bench-password')
+        self.category = Category.objects.create(name='Replica Bench')
+        self.recipes = Recipe.objects.bulk_create(
+            Recipe(title=f"Replica Recipe {i}", slug=f"replica-recipe-{i}", description="Bench.",
+                   prep_time=5, cook_time=10, owner=self.user, category=self.category)
+            for i in range(options['recipes'])
+        )
+        sync_replicas()
+
+        simulator = ReplicationLagSimulator(lag=options['lag'])
+        simulator.start()
+        # repeated toggles must all reach the database here
+        throttling = override_settings(THROTTLE_ENABLED=False)
+        throttling.enable()
+        try:
+            sticky = self.stale_reads(options['toggles'])
+            with override_settings(REPLICA_PIN_SECONDS=0):
+                unsticky = self.stale_reads(options['toggles'])
+            with override_settings(DATABASE_REPLICAS=[]):
+                primary_rps = self.throughput(options['readers'], options['seconds'], options['write_pause'])
+            replica_rps = self.throughput(options['readers'], options['seconds'], options['write_pause'])
+        finally:
+            throttling.disable()
+            simulator.stop()
+            self.user.delete()
+            self.category.delete()
+            sync_replicas()
+
+        self.stdout.write(f"lag {options['lag']}s, stale favorite lists after {options['toggles']} toggles:")
+        self.stdout.write(f"  without stickiness: {unsticky}")
+        self.stdout.write(f"  with stickiness:    {sticky}")
+        self.stdout.write(f"read throughput, {options['readers']} readers + 1 writer:")
+        self.stdout.write(f"  primary only:  {primary_rps:.0f} req/s")
+        self.stdout.write(f"  with replicas: {replica_rps:.0f} req/s ({replica_rps / primary_rps - 1:+.0%})")
+
+    def stale_reads(self, toggles):
+        """Toggle a favorite, then read the favorites list right away; count stale lists."""
+        FavoriteRecipe.objects.filter(user=self.user).delete()
+        client = Client(HTTP_HOST='localhost')
+        client.force_login(self.user)
+        stale = 0
+        for n in range(toggles):
+            recipe = self.recipes[n % len(self.recipes)]
+            toggle_url = reverse('toggle_favorite', args=[recipe.pk])
+            client.post(toggle_url)
+            favorited = FavoriteRecipe.objects.filter(user=self.user, recipe=recipe).exists()
+            response = client.get(reverse('favorites_list', args=[self.user.username]))
+            # every listed favorite has an "unfavorite" form posting to its toggle url
+            listed = f'action="{toggle_url}"' in response.content.decode()
+            stale += listed != favorited
+        return stale
+
+    def throughput(self, readers, seconds, write_pause):
+        """Requests/second served by ``readers`` processes while one process keeps writing."""
+        recipe = self.recipes[0]
+        paths = [
+            reverse('recipe_list'),
+            reverse('read_recipe', args=[recipe.pk, recipe.slug]),
+            reverse('favorites_list', args=[self.user.username]),
+            reverse('list_category'),
+            reverse('list_measurement'),
+        ]
+        counts = multiprocessing.Queue()
+
+        def read(deadline):
+            client = Client(HTTP_HOST='localhost')
+            client.force_login(self.user)
+            # logging in is a write; start unpinned like a returning visitor
+            client.cookies.pop('pin_primary', None)
+            done = 0
+            while time.monotonic() < deadline:
+                client.get(paths[done % len(paths)])
+                done += 1
+            counts.put(done)
+
+        def write(deadline):
+            n = 0
+            while time.monotonic() < deadline:
+                with transaction.atomic():
+                    for other in self.recipes:
+                        Recipe.objects.filter(pk=other.pk).update(description=f"Bench write {n}.")
+                n += 1
+                time.sleep(write_pause)
+
+        # separate processes, not threads: the GIL would serialize the readers
+        connections.close_all()
+        deadline = time.monotonic() + seconds
+        context = multiprocessing.get_context('fork')
+        processes = [context.Process(target=read, args=(deadline,)) for _ in range(readers)]
+        processes.append(context.Process(target=write, args=(deadline,)))
+        for process in processes:
+            process.start()
+        total = sum(counts.get() for _ in range(readers))
+        for process in processes:
+            process.join()
+        return total / seconds
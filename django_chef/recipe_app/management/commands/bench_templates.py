@@ -0,0 +1,73 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.template import Engine, RequestContext, engines
+from django.test import RequestFactory
+
+from recipe_app.middleware import minify_html
+from recipe_app.models import CustomUser, Category, Recipe, Ingredient
+
+TEMPLATE = 'recipe_app/recipe/list_recipe.html'
+
+
+class Command(BaseCommand):
+    help = "Render-benchmark list_recipe.html with N recipe cards: recompiled vs cached loader vs minified (rolled back)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cards', type=int, default=1000, help="Recipe cards on the page.")
+        parser.add_argument('--repeat', type=int, default=5, help="Renders per mode.")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.run(options)
+            transaction.set_rollback(True)
+
+    def run(self, options):
+        user = CustomUser.objects.create_user('template_bench', 'template_bench@example.com', 'bench-password')
+        category = Category.objects.create(name='Template Bench')
+        Recipe.objects.bulk_create(
+            Recipe(title=f"Bench Recipe {i}", slug=f"bench-recipe-{i}", description="Benchmark recipe.",
+                   prep_time=10, cook_time=20, category=category, owner=user)
+            for i in range(options['cards'])
+        )
+        recipes = list(Recipe.objects.filter(owner=user).order_by('title')
+                       .select_related('category').prefetch_related('ingredients'))
+        Ingredient.objects.bulk_create(Ingredient(recipe=r, name="Salt", quantity="1") for r in recipes)
+        recipes = list(Recipe.objects.filter(owner=user).order_by('title')
+                       .select_related('category').prefetch_related('ingredients'))
+
+        request = RequestFactory().get('/recipe_list/', HTTP_HOST='localhost')
+        request.user = user
+        context = {'recipes': recipes}
+
+        django_engine = engines['django'].engine
+        # same template dirs and context processors, but no cached loader
+        uncached_engine = Engine(
+            dirs=django_engine.dirs,
+            context_processors=django_engine.context_processors,
+            libraries=django_engine.libraries,
+            loaders=[
+                'django.template.loaders.filesystem.Loader',
+                'django.template.loaders.app_directories.Loader',
+            ],
+        )
+
+        def uncached():
+            return uncached_engine.get_template(TEMPLATE).render(RequestContext(request, context))
+
+        cached_template = django_engine.get_template(TEMPLATE)
+
+        def cached():
+            return cached_template.render(RequestContext(request, context))
+
+        def minified():
+            return minify_html(cached())
+
+        for label, render in (("recompiled", uncached), ("cached loader", cached), ("cached + minified", minified)):
+            html = render()
+            started = time.perf_counter()
+            for _ in range(options['repeat']):
+                render()
+            elapsed = (time.perf_counter() - started) / options['repeat']
+            self.stdout.write(f"{label:<18} {elapsed * 1000:8.1f} ms/render  {len(html.encode()):>9} bytes")
@@ -0,0 +1,72 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipe_app.models import Recipe, Ingredient, Step, RecipeVersion
+from recipe_app.versioning import snapshot, record_version, reconstruct
+
+
+class Command(BaseCommand):
+    help = "Benchmark recipe version storage overhead and reconstruction latency (rolled back afterwards)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--edits', type=int, default=200, help="Number of edits to record.")
+        parser.add_argument('--ingredients', type=int, default=15, help="Ingredients on the test recipe.")
+        parser.add_argument('--steps', type=int, default=10, help="Steps on the test recipe.")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.run(options)
+            # nothing from the benchmark is kept
+            transaction.set_rollback(True)
+
+    def run(self, options):
+        recipe = Recipe.objects.create(
+            title="Benchmark Stew", description="A long simmering stew. " * 20,
+            prep_time=20, cook_time=90,
+        )
+        Ingredient.objects.bulk_create(
+            Ingredient(recipe=recipe, name=f"Ingredient {i}", quantity=str(i)) for i in range(options['ingredients'])
+        )
+        Step.objects.bulk_create(
+            Step(recipe=recipe, step_number=i + 1, step=f"Do step {i + 1} carefully. " * 5) for i in range(options['steps'])
+        )
+        record_version(recipe)
+
+        full_bytes = 0
+        write_time = 0.0
+        for edit in range(options['edits']):
+            # rotate through the kinds of edits the views make
+            kind = edit % 3
+            if kind == 0:
+                recipe.cook_time += 1
+                recipe.save()
+            elif kind == 1:
+                ingredient = recipe.ingredients.order_by('?').first()
+                ingredient.quantity = str(edit)
+                ingredient.save()
+            else:
+                step = recipe.steps.order_by('?').first()
+                step.step = f"Edited at {edit}. " + step.step[:80]
+                step.save()
+
+            full_bytes += len(json.dumps(snapshot(recipe)))
+            started = time.perf_counter()
+            record_version(recipe)
+            write_time += time.perf_counter() - started
+
+        versions = list(RecipeVersion.objects.filter(recipe=recipe).values_list('number', 'data'))
+        stored_bytes = sum(len(json.dumps(data)) for _number, data in versions)
+
+        started = time.perf_counter()
+        for number, _data in versions:
+            reconstruct(recipe, number)
+        read_time = time.perf_counter() - started
+
+        self.stdout.write(f"versions stored:        {len(versions)}")
+        self.stdout.write(f"full snapshots (bytes): {full_bytes}")
+        self.stdout.write(f"stored deltas (bytes):  {stored_bytes} ({stored_bytes / full_bytes:.1%} of full)")
+        self.stdout.write(f"record latency:         {write_time / options['edits'] * 1000:.2f} ms/version")
+        self.stdout.write(f"reconstruct latency:    {read_time / len(versions) * 1000:.2f} ms/version")
@@ -0,0 +1,90 @@
+from unittest import mock
+
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from recipe_app.models import CustomUser, Category, IngreadientMeasure, Recipe
+from recipe_app.views import WizForm
+
+WRITES = ('INSERT', 'UPDATE', 'DELETE')
+
+BEFORE = {
+    'session_engine': 'django.contrib.sessions.backends.db',
+    'message_storage': 'django.contrib.messages.storage.fallback.FallbackStorage',
+    'wizard_storage': 'formtools.wizard.storage.session.SessionStorage',
+}
+
+
+class Command(BaseCommand):
+    help = "Count DB writes per recipe created through the wizard, before/after cache-backed storage (rolled back)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=20, help="Recipes to create per configuration.")
+
+    def handle(self, *args, **options):
+        before = self.measure(options['recipes'], **BEFORE)
+        after = self.measure(options['recipes'])
+
+        self.stdout.write("DB writes per created recipe (total / django_session):")
+        self.stdout.write(f"  before: {before[0]:.1f} / {before[1]:.1f}")
+        self.stdout.write(f"  after:  {after[0]:.1f} / {after[1]:.1f}")
+
+    def measure(self, recipes, session_engine=None, message_storage=None, wizard_storage=None):
+        # 3 POSTs per recipe would quickly hit the create_recipe rate limit
+        overrides = {'THROTTLE_ENABLED': False}
+        if session_engine:
+            overrides['SESSION_ENGINE'] = session_engine
+        if message_storage:
+            overrides['MESSAGE_STORAGE'] = message_storage
+
+        with transaction.atomic(), override_settings(**overrides), \
+                mock.patch.object(WizForm, 'storage_name', wizard_storage or WizForm.storage_name):
+            user = CustomUser.objects.create_user('wizard_bench', 'wizard_bench@example.com', 'bench-password')
+            category = Category.objects.create(name='Wizard Bench')
+            measure = IngreadientMeasure.objects.create(measure='wizard bench cup')
+            client = Client(HTTP_HOST='localhost')
+            client.force_login(user)
+
+            with CaptureQueriesContext(connection) as queries:
+                for i in range(recipes):
+                    self.create_recipe(client, i, category, measure)
+            # the session cache is shared with the running site: drop only this session
+            client.logout()
+            transaction.set_rollback(True)
+
+        caches['default'].clear()
+
+        writes = [q['sql'] for q in queries.captured_queries if q['sql'].lstrip().upper().startswith(WRITES)]
+        session_writes = [sql for sql in writes if 'django_session' in sql]
+        return len(writes) / recipes, len(session_writes) / recipes
+
+    def create_recipe(self, client, i, category, measure):
+        url = reverse('create_recipe')
+        client.get(url)
+        client.post(url, {
+            'wiz_form-current_step': 'recipe',
+            'recipe-title': f"Wizard Bench {i}",
+            'recipe-description': "Created by the wizard benchmark.",
+            'recipe-prep_time': 10,
+            'recipe-prep_time_unit': 'min',
+            'recipe-cook_time': 20,
+            'recipe-cook_time_unit': 'min',
+            'recipe-spice_level': 1,
+            'recipe-category': category.pk,
+        })
+        client.post(url, {
+            'wiz_form-current_step': 'ingredients',
+            'ingredients-name': "Salt",
+            'ingredients-quantity': 1,
+            'ingredients-measure': measure.pk,
+        })
+        response = client.post(url, {
+            'wiz_form-current_step': 'steps',
+            'steps-step': "Cook it.",
+        })
+        assert response.status_code == 302, "wizard did not finish"
+        assert Recipe.objects.filter(title=f"Wizard Bench {i}").exists()
@@ -0,0 +1,41 @@
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+# always fetched with the first page (bootstrap-icons' font)
+FIRST_LOAD_EXTRA = ['css/fonts/bootstrap-icons.woff2']
+
+
+class Command(BaseCommand):
+    help = ("Build the static assets (bundled, purged, hashed and precompressed) into STATIC_ROOT "
+            "and report bytes per first page load before and after.")
+
+    def handle(self, *args, **options):
+        storages = {**settings.STORAGES, 'staticfiles': {
+            'BACKEND': 'recipe_app.static_assets.BundledManifestStorage',
+        }}
+        # build with the bundling storage even while DEBUG serves the raw files
+        with override_settings(STORAGES=storages):
+            call_command('collectstatic', interactive=False, clear=True, verbosity=0)
+            from django.contrib.staticfiles.storage import staticfiles_storage
+            hashed = dict(staticfiles_storage.hashed_files)
+
+        before = [*settings.STATIC_BUNDLES_CSS, *settings.STATIC_BUNDLES_JS, *FIRST_LOAD_EXTRA]
+        before_bytes = sum(Path(finders.find(name)).stat().st_size for name in before)
+
+        after = [settings.STATIC_BUNDLE_CSS_NAME, settings.STATIC_BUNDLE_JS_NAME, *FIRST_LOAD_EXTRA]
+        self.stdout.write("First page load (css + js + icon font):")
+        after_bytes = 0
+        for name in after:
+            path = Path(settings.STATIC_ROOT) / hashed[name]
+            served = min((p for p in (path, Path(f"{path}.br"), Path(f"{path}.gz")) if p.exists()),
+                         key=lambda p: p.stat().st_size)
+            after_bytes += served.stat().st_size
+            self.stdout.write(f"  {served.relative_to(settings.STATIC_ROOT)}: {served.stat().st_size} bytes")
+
+        self.stdout.write(f"before: {before_bytes} bytes in {len(before)} requests")
+        self.stdout.write(f"after:  {after_bytes} bytes in {len(after)} requests")
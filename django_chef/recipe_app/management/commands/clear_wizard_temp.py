@@ -0,0 +1,33 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from recipe_app.views import WizForm
+
+
+class Command(BaseCommand):
+    help = "Delete wizard upload temp files older than WIZARD_STORAGE_TIMEOUT (their step data has expired)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, default=None,
+                            help="Age in seconds; defaults to WIZARD_STORAGE_TIMEOUT.")
+
+    def handle(self, *args, **options):
+        max_age = options['older_than']
+        if max_age is None:
+            max_age = getattr(settings, 'WIZARD_STORAGE_TIMEOUT', 60 * 60 * 24)
+        storage = WizForm.file_storage
+        cutoff = time.time() - max_age
+
+        try:
+            _dirs, files = storage.listdir('')
+        except FileNotFoundError:
+            files = []
+
+        removed = 0
+        for name in files:
+            if storage.get_modified_time(name).timestamp() < cutoff:
+                storage.delete(name)
+                removed += 1
+        self.stdout.write(self.style.SUCCESS(f"Removed {removed} expired wizard temp files."))
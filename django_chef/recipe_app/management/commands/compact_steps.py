@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from recipe_app import step_order
+from recipe_app.models import Recipe
+
+
+class Command(BaseCommand):
+    help = "Spread out the step keys of recipes whose steps were moved into crowded gaps (run daily, e.g. from cron)."
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.filter(pk__in=step_order.crowded_recipes())
+        compacted = changed = 0
+        for recipe in recipes.only('pk').iterator():
+            changed += step_order.compact(recipe)
+            compacted += 1
+        self.stdout.write(self.style.SUCCESS(f"Compacted {compacted:,} recipes ({changed:,} steps renumbered)."))
@@ -0,0 +1,108 @@
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from recipe_app import query_audit
+from recipe_app.models import CustomUser, Recipe
+
+# (label, url name, kwargs from the sample user/recipe)
+HOT_VIEWS = [
+    ('RecipeListView', 'recipe_list', lambda user, recipe: {}),
+    ('ReadRecipe', 'read_recipe', lambda user, recipe: {'pk': recipe.pk, 'slug': recipe.slug}),
+    ('FavoriteListView', 'favorites_list', lambda user, recipe: {'username': user.username}),
+    ('ListCategories', 'list_category', lambda user, recipe: {}),
+    ('ListMeasurement', 'list_measurement', lambda user, recipe: {}),
+    ('RecipeHistory', 'recipe_history', lambda user, recipe: {'pk': recipe.pk, 'slug': recipe.slug}),
+    ('UpdateRecipe', 'update_recipe', lambda user, recipe: {'pk': recipe.pk, 'slug': recipe.slug}),
+]
+MIN_RECIPES = 10_000
+
+
+class Command(BaseCommand):
+    help = ("Capture the queries of the hot views, EXPLAIN them, flag full scans and sorts "
+            "and propose composite indexes (run against a seeded database, see seed_chef).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help="Username to browse as (default: the user with the most recipes).")
+        parser.add_argument('--analyze', action='store_true',
+                            help="Run ANALYZE first so the planner has table statistics.")
+        parser.add_argument('--plans', action='store_true', help="Print every query plan, not only problems.")
+
+    def handle(self, *args, **options):
+        if connection.vendor not in ('sqlite', 'postgresql'):
+            raise CommandError(f"Query plans are only supported on SQLite and PostgreSQL, not {connection.vendor}.")
+        if Recipe.objects.count() < MIN_RECIPES:
+            self.stdout.write(self.style.WARNING(
+                f"Fewer than {MIN_RECIPES:,} recipes: plans for tiny tables are not representative, "
+                "run manage.py seed_chef first."
+            ))
+        if options['analyze']:
+            with connection.cursor() as cursor:
+                cursor.execute("ANALYZE")
+
+        user = self.sample_user(options['user'])
+        recipe = user.recipes.annotate(n=Count('ingredients')).order_by('-n').first()
+        if recipe is None:
+            raise CommandError(f"{user.username} has no recipes to browse.")
+
+        proposals = Counter()
+        with transaction.atomic():
+            client = Client(HTTP_HOST='localhost')
+            client.force_login(user)
+            for label, url_name, get_kwargs in HOT_VIEWS:
+                url = reverse(url_name, kwargs=get_kwargs(user, recipe))
+                with CaptureQueriesContext(connection) as queries:
+                    response = client.get(url)
+                self.stdout.write(self.style.MIGRATE_HEADING(
+                    f"{label} ({url}): {response.status_code}, {len(queries)} queries"
+                ))
+                for sql in dict.fromkeys(q['sql'] for q in queries.captured_queries):
+                    if sql.lstrip().upper().startswith('SELECT'):
+                        proposals.update(self.audit(sql, options['plans']))
+            transaction.set_rollback(True)
+
+        if not proposals:
+            self.stdout.write(self.style.SUCCESS("No missing indexes found."))
+            return
+        self.stdout.write(self.style.MIGRATE_HEADING("Proposed indexes:"))
+        for (model, fields), count in proposals.most_common():
+            name = query_audit.index_name(model, fields)
+            self.stdout.write(f"  {model.__name__}: models.Index(fields={list(fields)!r}, name={name!r})"
+                              f"  # {count} queries")
+
+    def sample_user(self, username):
+        if username:
+            try:
+                return CustomUser.objects.get(username=username)
+            except CustomUser.DoesNotExist:
+                raise CommandError(f"No user named {username!r}.")
+        user = CustomUser.objects.annotate(n=Count('recipes')).order_by('-n').first()
+        if user is None:
+            raise CommandError("No users, run manage.py seed_chef first.")
+        return user
+
+    def audit(self, sql, show_plan):
+        """Print the problems of one query; return the indexes proposed for it."""
+        lines, problems = query_audit.explain(sql)
+        if not problems and not show_plan:
+            return []
+        self.stdout.write(f"  {sql[:200]}{'...' if len(sql) > 200 else ''}")
+        for line in lines:
+            self.stdout.write(f"    | {line}")
+
+        found = []
+        for kind, table in dict.fromkeys(problems):
+            proposal = query_audit.propose_index(sql, table)
+            if proposal:
+                model, fields = proposal
+                found.append((model, tuple(fields)))
+                advice = f"index {model.__name__}({', '.join(fields)})"
+            else:
+                advice = "no useful index"
+            self.stdout.write(self.style.WARNING(f"    ! {kind} of {table}: {advice}"))
+        return found
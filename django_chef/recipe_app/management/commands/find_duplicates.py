@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+
+from recipe_app.duplicates import find_duplicates, merge_recipes
+from recipe_app.models import Recipe
+
+
+class Command(BaseCommand):
+    help = "Find near-duplicate recipes (same owner and slug, similar ingredients/steps) and optionally merge them."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threshold', type=float, default=0.8,
+                            help="Minimum ingredient/step similarity (0-1) to count as a duplicate.")
+        parser.add_argument('--chunk-size', type=int, default=2000,
+                            help="Recipes streamed and scored per batch.")
+        parser.add_argument('--owner', help="Only check recipes of this username.")
+        parser.add_argument('--merge', action='store_true',
+                            help="Merge each group into its richest recipe instead of only listing it.")
+
+    def handle(self, *args, **options):
+        queryset = Recipe.objects.all()
+        if options['owner']:
+            queryset = queryset.filter(owner__username=options['owner'])
+
+        groups = 0
+        removed = 0
+        for group in find_duplicates(queryset, options['threshold'], options['chunk_size']):
+            groups += 1
+            keep, *duplicates = group
+            if options['merge']:
+                # merges are written after the scan has moved past this block
+                removed += merge_recipes(keep, duplicates)
+            else:
+                self.stdout.write(f"keep {keep}, duplicates: {', '.join(map(str, duplicates))}")
+
+        if options['merge']:
+            self.stdout.write(self.style.SUCCESS(f"Merged {groups} groups, removed {removed} duplicate recipes."))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Found {groups} duplicate groups."))
@@ -0,0 +1,69 @@
+import json
+import re
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand, CommandError
+
+# what a server process runs before its first request, in a fresh interpreter
+STARTUP = """
+import json, os, time
+os.environ.setdefault('DJANGO_CHEF_SERVER', '1')
+started = time.perf_counter()
+from django.core.servers.basehttp import get_internal_wsgi_application
+import django
+django.setup()
+get_internal_wsgi_application()
+from recipe_app import warmup
+timings = warmup.warm_app()
+print(json.dumps({'seconds': time.perf_counter() - started, 'phases': timings}))
+"""
+IMPORT_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$")
+
+
+def parse_importtime(text):
+    """``(module, self µs, cumulative µs, depth)`` of each line of a ``-X importtime`` report."""
+    modules = []
+    for line in text.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match:
+            own, cumulative, indent, module = match.groups()
+            modules.append((module, int(own), int(cumulative), len(indent) // 2))
+    return modules
+
+
+class Command(BaseCommand):
+    help = ("Profile the start-up of a server process: import time per package (python -X importtime) "
+            "and the warm-up phases (see recipe_app/warmup.py).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=15, help="Packages and modules to list.")
+
+    def handle(self, *args, **options):
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', STARTUP],
+                                capture_output=True, text=True)
+        if result.returncode:
+            raise CommandError(f"Start-up failed:\n{result.stderr[-2000:]}")
+        startup = json.loads(result.stdout.strip().splitlines()[-1])
+        modules = parse_importtime(result.stderr)
+
+        packages = defaultdict(lambda: [0, 0])
+        for module, own, _cumulative, _depth in modules:
+            package = packages[module.partition('.')[0]]
+            package[0] += 1
+            package[1] += own
+        total = sum(own for _module, own, _cumulative, _depth in modules)
+
+        self.stdout.write(f"Start-up: {startup['seconds'] * 1000:.0f}ms, of which imports "
+                          f"{total / 1000:.0f}ms ({len(modules):,} modules)")
+        self.stdout.write(f"\n{'package':32} {'modules':>8} {'self':>9} {'share':>6}")
+        for name, (count, own) in sorted(packages.items(), key=lambda item: -item[1][1])[:options['top']]:
+            self.stdout.write(f"{name:32} {count:8,} {own / 1000:7.1f}ms {own / total:6.1%}")
+        self.stdout.write(f"\n{'slowest imports (with their own imports)':48} {'cumulative':>11}")
+        top_level = [entry for entry in modules if entry[3] == 0]
+        for module, _own, cumulative, _depth in sorted(top_level, key=lambda entry: -entry[2])[:options['top']]:
+            self.stdout.write(f"{module:48} {cumulative / 1000:9.1f}ms")
+        self.stdout.write(f"\n{'warm-up phase':32} {'items':>8} {'time':>9}")
+        for name, (count, seconds) in startup['phases'].items():
+            self.stdout.write(f"{name:32} {count:8,} {seconds * 1000:7.1f}ms")
@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from recipe_app import events
+
+
+class Command(BaseCommand):
+    help = "Drop activity log events older than the retention period (run daily, e.g. from cron)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.EVENT_LOG_RETENTION_DAYS,
+                            help="Keep this many days of events (default: EVENT_LOG_RETENTION_DAYS).")
+
+    def handle(self, *args, **options):
+        removed = events.prune(options['days'])
+        self.stdout.write(self.style.SUCCESS(f"Removed {removed:,} events older than {options['days']} days."))
@@ -0,0 +1,12 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from recipe_app.task_queue import metrics
+
+
+class Command(BaseCommand):
+    help = "Print background task queue depth and latency metrics as JSON."
+
+    def handle(self, *args, **options):
+        self.stdout.write(json.dumps(metrics(), indent=2))
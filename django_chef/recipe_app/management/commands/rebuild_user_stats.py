@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipe_app import dashboard
+from recipe_app.models import CustomUser
+
+BATCH = 500
+
+
+class Command(BaseCommand):
+    help = "Recompute every user's dashboard statistics from their recipes and favorites (after deploys or bulk imports)."
+
+    def handle(self, *args, **options):
+        user_ids = list(CustomUser.objects.order_by('pk').values_list('pk', flat=True))
+        rebuilt = 0
+        for start in range(0, len(user_ids), BATCH):
+            with transaction.atomic():
+                rebuilt += dashboard.rebuild_all(user_ids[start:start + BATCH])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt the stats of {rebuilt:,} users."))
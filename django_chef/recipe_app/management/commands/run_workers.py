@@ -0,0 +1,76 @@
+import logging
+import multiprocessing
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from recipe_app.task_queue import metrics, work
+
+logger = logging.getLogger(__name__)
+
+
+def worker_main(stop_event, poll_interval):
+    # connections inherited from the parent must not be shared
+    connections.close_all()
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    work(stop_event, poll_interval)
+
+
+class Command(BaseCommand):
+    help = "Run N background task worker processes until interrupted."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2, help="Number of worker processes.")
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help="Seconds an idle worker waits before polling again.")
+        parser.add_argument('--metrics-interval', type=float, default=30.0,
+                            help="Seconds between queue depth/latency reports.")
+
+    def handle(self, *args, **options):
+        stop_event = multiprocessing.Event()
+        connections.close_all()
+
+        def start_worker():
+            process = multiprocessing.Process(target=worker_main, args=(stop_event, options['poll_interval']), daemon=True)
+            process.start()
+            return process
+
+        workers = [start_worker() for _ in range(options['workers'])]
+        self.stdout.write(self.style.SUCCESS(f"Started {len(workers)} workers, Ctrl+C to stop."))
+
+        # only flip a flag here: setting the multiprocessing Event from a
+        # signal handler can deadlock with a wait() on the same Event
+        stopping = []
+
+        def stop(signum, frame):
+            stopping.append(signum)
+
+        signal.signal(signal.SIGINT, stop)
+        signal.signal(signal.SIGTERM, stop)
+
+        last_metrics = 0.0
+        while not stopping:
+            # replace workers that crashed
+            for i, process in enumerate(workers):
+                if not process.is_alive():
+                    logger.warning("Worker %s exited with %s, restarting.", process.pid, process.exitcode)
+                    workers[i] = start_worker()
+
+            if time.monotonic() - last_metrics >= options['metrics_interval']:
+                data = metrics()
+                self.stdout.write(
+                    f"depth={data['depth']} wait={data['mean_wait_seconds']:.2f}s "
+                    f"run={data['mean_run_seconds']:.2f}s oldest={data['oldest_queued_seconds']:.0f}s"
+                )
+                last_metrics = time.monotonic()
+            time.sleep(1.0)
+
+        self.stdout.write("Stopping workers...")
+        stop_event.set()
+        for process in workers:
+            # running tasks finish first; a killed one is retried after its visibility timeout
+            process.join(timeout=30)
+            if process.is_alive():
+                process.terminate()
@@ -0,0 +1,104 @@
+import multiprocessing
+import os
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.db.models import Max
+
+from recipe_app import seeding
+from recipe_app.models import Category, CustomUser, FavoriteRecipe, IngreadientMeasure, Ingredient, Recipe, Step
+
+MODELS = {'recipe': Recipe, 'ingredient': Ingredient, 'step': Step, 'favorite': FavoriteRecipe}
+GENERATORS = {
+    'user': seeding.users_chunk,
+    'recipe': seeding.recipes_chunk,
+    'favorite': seeding.favorites_chunk,
+}
+
+
+def generate(job):
+    kind, args = job
+    return kind, GENERATORS[kind](*args)
+
+
+class Command(BaseCommand):
+    help = "Fill the database with deterministic synthetic users, recipes, ingredients, steps and favorites."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100_000, help="Approximate total rows to create (1k-10M).")
+        parser.add_argument('--seed', type=int, default=42, help="Same seed and rows on an empty db give the same data.")
+        parser.add_argument('--processes', type=int, default=os.cpu_count() or 1,
+                            help="Processes generating rows while the main process inserts them.")
+        parser.add_argument('--password', default='chef-password', help="Password of every generated user.")
+
+    def handle(self, *args, **options):
+        if not 1_000 <= options['rows'] <= 10_000_000:
+            raise CommandError("--rows must be between 1,000 and 10,000,000.")
+
+        seed = options['seed']
+        users, recipes = seeding.plan(options['rows'])
+        category_ids = self.lookup(Category, 'name', seeding.CATEGORIES)
+        measure_ids = self.lookup(IngreadientMeasure, 'measure', seeding.MEASURES)
+        first_user = (CustomUser.objects.aggregate(m=Max('id'))['m'] or 0) + 1
+        first_recipe = (Recipe.objects.aggregate(m=Max('id'))['m'] or 0) + 1
+        self.password = make_password(options['password'])
+
+        # fixed chunk sizes: the rows depend on them, the process count must not change the data
+        size = seeding.CHUNK_SIZE
+        user_size = size * seeding.RECIPES_PER_USER
+        jobs = [('user', (seed, n, start, min(user_size, users - start), first_user))
+                for n, start in enumerate(range(0, users, user_size))]
+        jobs += [('recipe', (seed, n, start, min(size, recipes - start), first_recipe, first_user, users,
+                             category_ids, measure_ids))
+                 for n, start in enumerate(range(0, recipes, size))]
+        jobs += [('favorite', (seed, n, start, min(size, users - start), first_user, first_recipe, recipes))
+                 for n, start in enumerate(range(0, users, size))]
+
+        self.stdout.write(f"Seeding ~{options['rows']:,} rows: {users:,} users, {recipes:,} recipes "
+                          f"({options['processes']} processes, seed {seed})...")
+        counts = dict.fromkeys(['user', *MODELS], 0)
+        started = time.perf_counter()
+        with seeding.loading_pragmas():
+            if options['processes'] > 1:
+                # forked workers must not share the parent's db connection; the reconnection gets the pragmas too
+                connections.close_all()
+                context = multiprocessing.get_context('fork')
+                with context.Pool(options['processes']) as pool:
+                    # imap keeps job order, so parents are always inserted before children
+                    for kind, rows in pool.imap(generate, jobs):
+                        self.insert(kind, rows, counts)
+            else:
+                for job in jobs:
+                    self.insert(*generate(job), counts)
+        elapsed = time.perf_counter() - started
+
+        total = sum(counts.values())
+        for kind, count in counts.items():
+            self.stdout.write(f"  {kind + 's':12} {count:>12,}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Inserted {total:,} rows in {elapsed:.1f}s ({total / elapsed:,.0f} rows/s)."
+        ))
+
+    def lookup(self, model, field, names):
+        """Create whichever ``names`` are missing and return the ids of all of them."""
+        model.objects.bulk_create([model(**{field: name}) for name in names], ignore_conflicts=True)
+        return list(model.objects.filter(**{f"{field}__in": names}).order_by('pk').values_list('pk', flat=True))
+
+    def insert(self, kind, rows, counts):
+        with transaction.atomic():
+            if kind == 'user':
+                CustomUser.objects.bulk_create(
+                    [CustomUser(id=pk, username=username, email=email, first_name=first_name,
+                                joined_at=joined, date_joined=joined, password=self.password)
+                     for pk, username, email, first_name, joined in rows],
+                    batch_size=500,
+                )
+                counts['user'] += len(rows)
+                return
+            # bulk_create tops out far below executemany for the big tables
+            batches = rows if kind == 'recipe' else {kind: rows}
+            for name, batch in batches.items():
+                seeding.insert_rows(MODELS[name], seeding.COLUMNS[name], batch)
+                counts[name] += len(batch)
@@ -0,0 +1,35 @@
+import gc
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.core.servers.basehttp import get_internal_wsgi_application
+
+from recipe_app import prefork, warmup
+
+
+class Command(BaseCommand):
+    help = ("Serve the site from preforked worker processes that start warm "
+            "(SIGHUP reloads without dropping requests, SIGTERM stops).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1', help="Address to listen on.")
+        parser.add_argument('--port', type=int, default=8000, help="Port to listen on.")
+        parser.add_argument('--workers', type=int, default=2, help="Number of worker processes.")
+        parser.add_argument('--backlog', type=int, default=2048,
+                            help="Connections waiting to be accepted before new ones are refused.")
+        parser.add_argument('--pidfile', help="File to write the pid of the serving master to.")
+
+    def handle(self, *args, **options):
+        # no collection while the application loads, see recipe_app/prefork.py
+        gc.disable()
+        os.environ.setdefault(warmup.SERVER_ENV, '1')
+        sock = prefork.listen(options['host'], options['port'], options['backlog'])
+        app = get_internal_wsgi_application()
+        if settings.STARTUP_WARMUP:
+            timings = warmup.warm_app()
+            self.stdout.write("Warmed up: " + ", ".join(f"{name} {count} in {seconds * 1000:.0f}ms"
+                                                       for name, (count, seconds) in timings.items()))
+        master = prefork.Master(sock, app, options['workers'], options['pidfile'], log=self.stdout.write)
+        if master.run():
+            raise CommandError("A worker failed to start.")
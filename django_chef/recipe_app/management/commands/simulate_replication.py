@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from recipe_app.replicas import ReplicationLagSimulator, replicas, sync_replicas
+
+
+class Command(BaseCommand):
+    help = "Copy the primary SQLite database to the replica files with an artificial lag, until interrupted."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lag', type=float, default=1.0, help="Replication lag in seconds.")
+        parser.add_argument('--once', action='store_true', help="Sync the replicas once and exit.")
+
+    def handle(self, *args, **options):
+        if not replicas():
+            raise CommandError("No DATABASE_REPLICAS configured, set DJANGO_CHEF_SQLITE_REPLICA=1.")
+
+        sync_replicas()
+        if options['once']:
+            self.stdout.write(self.style.SUCCESS(f"Synced {', '.join(replicas())}."))
+            return
+
+        simulator = ReplicationLagSimulator(lag=options['lag'])
+        simulator.start()
+        self.stdout.write(self.style.SUCCESS(f"Replicating to {', '.join(replicas())} with {options['lag']}s lag, Ctrl+C to stop."))
+        try:
+            while simulator.is_alive():
+                time.sleep(1.0)
+        except KeyboardInterrupt:
+            simulator.stop()
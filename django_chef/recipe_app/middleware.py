@@ -0,0 +1,43 @@
+import re
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+# content of these tags is whitespace sensitive (or user text) and kept as is
+PRESERVE_RE = re.compile(r"(<(pre|textarea|script|style)\b.*?</\2\s*>)", re.IGNORECASE | re.DOTALL)
+# any whitespace run holding a newline renders like a single newline
+INDENT_RE = re.compile(r"\s*\n\s*")
+COMMENT_RE = re.compile(r"<!--(?!\[if).*?-->", re.DOTALL)
+
+
+def minify_html(html):
+    """Strip comments, indentation and blank lines outside whitespace-sensitive tags."""
+    parts = PRESERVE_RE.split(html)
+    out = []
+    # split() yields: text, whole preserved block, tag name, text, ...
+    for i in range(0, len(parts), 3):
+        text = COMMENT_RE.sub('', parts[i])
+        text = INDENT_RE.sub('\n', text)
+        out.append(text)
+        if i + 1 < len(parts):
+            out.append(parts[i + 1])
+    return ''.join(out).strip()
+
+
+class HTMLMinifyMiddleware:
+    """Minify HTML responses when ``HTML_MINIFY`` is on (off while debugging)."""
+    def __init__(self, get_response):
+        if not getattr(settings, 'HTML_MINIFY', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if (response.streaming or response.has_header('Content-Encoding')
+                or not response.get('Content-Type', '').startswith('text/html')):
+            return response
+
+        response.content = minify_html(response.content.decode(response.charset)).encode(response.charset)
+        if response.has_header('Content-Length'):
+            response['Content-Length'] = str(len(response.content))
+        return response
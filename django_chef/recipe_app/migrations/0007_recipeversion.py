@@ -0,0 +1,32 @@
+# Generated by Django 5.2.7 on 2026-10-19 15:57
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe_app', '0006_recipe_owner_favoriterecipe'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.PositiveIntegerField()),
+                ('is_checkpoint', models.BooleanField(default=False)),
+                ('data', models.JSONField()),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('author', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='versions', to='recipe_app.recipe')),
+            ],
+            options={
+                'ordering': ['-number'],
+                'constraints': [models.UniqueConstraint(fields=('recipe', 'number'), name='unique_recipe_version')],
+            },
+        ),
+    ]
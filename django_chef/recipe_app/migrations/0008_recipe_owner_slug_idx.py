@@ -0,0 +1,17 @@
+# Generated by Django 5.2.7 on 2026-10-19 15:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe_app', '0007_recipeversion'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['owner', 'slug'], name='recipe_owner_slug_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-19 16:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe_app', '0008_recipe_owner_slug_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='is_public',
+            field=models.BooleanField(default=False),
+        ),
+    ]
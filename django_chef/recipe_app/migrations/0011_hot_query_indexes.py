@@ -0,0 +1,21 @@
+# Generated by Django 5.2.7 on 2026-10-19 16:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe_app', '0010_task'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['owner', 'title'], name='recipe_owner_title_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='step',
+            index=models.Index(fields=['recipe', 'step_number'], name='step_recipe_number_idx'),
+        ),
+    ]
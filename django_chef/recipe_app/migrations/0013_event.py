@@ -0,0 +1,35 @@
+# Generated by Django 5.2.7 on 2026-10-19 16:38
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe_app', '0012_recipe_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Event',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('actor_name', models.CharField(blank=True, max_length=150)),
+                ('action', models.CharField(choices=[('create', 'Created'), ('update', 'Updated'), ('delete', 'Deleted'), ('restore', 'Restored'), ('favorite', 'Favorited'), ('unfavorite', 'Unfavorited')], max_length=20)),
+                ('object_type', models.CharField(max_length=50)),
+                ('object_id', models.BigIntegerField(blank=True, null=True)),
+                ('recipe_id', models.BigIntegerField(blank=True, null=True)),
+                ('label', models.CharField(blank=True, max_length=200)),
+                ('data', models.JSONField(blank=True, default=dict)),
+                ('actor', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['recipe_id', '-created_at'], name='event_recipe_created_idx'), models.Index(fields=['created_at'], name='event_created_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.7 on 2026-10-19 16:57
+
+from django.db import migrations, models
+
+STEP_GAP = 1024
+BATCH = 1000
+
+
+def spread_step_numbers(apps, schema_editor):
+    """Give every recipe's steps keys STEP_GAP apart in their current order (duplicates by pk)."""
+    Step = apps.get_model('recipe_app', 'Step')
+    recipe_ids = sorted(set(Step.objects.values_list('recipe_id', flat=True)))
+    for start in range(0, len(recipe_ids), BATCH):
+        chunk = recipe_ids[start:start + BATCH]
+        steps = Step.objects.filter(recipe_id__in=chunk).order_by('recipe_id', 'step_number', 'pk')
+        # one UPDATE per position: the first steps of the chunk's recipes, the second ones...
+        by_number, recipe_id, number = {}, None, 0
+        for pk, step_recipe_id in steps.values_list('pk', 'recipe_id'):
+            number = number + 1 if step_recipe_id == recipe_id else 1
+            recipe_id = step_recipe_id
+            by_number.setdefault(number, []).append(pk)
+        for number, pks in by_number.items():
+            Step.objects.filter(pk__in=pks).update(step_number=number * STEP_GAP)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe_app', '0013_event'),
+    ]
+
+    operations = [
+        migrations.RunPython(spread_step_numbers, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='step',
+            name='step_recipe_number_idx',
+        ),
+        migrations.AddConstraint(
+            model_name='step',
+            constraint=models.UniqueConstraint(fields=('recipe', 'step_number'), name='unique_recipe_step_number'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.7 on 2026-10-19 17:10
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe_app', '0014_step_order_keys'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('recipe_count', models.PositiveIntegerField(default=0)),
+                ('spice_total', models.PositiveIntegerField(default=0)),
+                ('favorite_count', models.PositiveIntegerField(default=0)),
+                ('category_counts', models.JSONField(default=dict)),
+                ('recent', models.JSONField(default=list)),
+                ('quickest', models.JSONField(default=list)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
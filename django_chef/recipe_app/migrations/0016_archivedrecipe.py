@@ -0,0 +1,30 @@
+# Generated by Django 5.2.7 on 2026-10-19 17:23
+
+import django.core.serializers.json
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe_app', '0015_userstats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedRecipe',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('owner_id', models.BigIntegerField(null=True)),
+                ('title', models.CharField(max_length=200)),
+                ('slug', models.SlugField(db_index=False, max_length=250)),
+                ('updated_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('data', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['owner_id', 'slug'], name='archived_owner_slug_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.7 on 2026-10-19 17:56
+
+import django.db.models.deletion
+from django.db import migrations, models, router
+
+LOOKED_UP = ['ingredients', 'steps']
+
+
+def index_archived_children(apps, schema_editor):
+    """Index the ingredient and step ids of the recipes archived so far."""
+    ArchivedRecipe = apps.get_model('recipe_app', 'ArchivedRecipe')
+    ArchivedChild = apps.get_model('recipe_app', 'ArchivedChild')
+    db = schema_editor.connection.alias
+    # the archive may be another database
+    if not router.allow_migrate_model(db, ArchivedChild):
+        return
+    for pk, data in ArchivedRecipe.objects.using(db).values_list('pk', 'data').iterator():
+        ArchivedChild.objects.using(db).bulk_create(
+            ArchivedChild(archived_id=pk, kind=name, child_id=row['id']) for name in LOOKED_UP for row in data[name]
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe_app', '0016_archivedrecipe'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedChild',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=20)),
+                ('child_id', models.BigIntegerField()),
+                ('archived', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='children', to='recipe_app.archivedrecipe')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['kind', 'child_id'], name='archived_child_idx')],
+            },
+        ),
+        migrations.RunPython(index_archived_children, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,9 @@
+from functools import lru_cache
+
 from django.contrib.auth.models import AbstractUser
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
+from django.db.models import Exists, OuterRef
 from django.utils import timezone
 from django.conf import settings
 from django.utils.text import slugify
@@ -24,6 +28,18 @@ class Category(models.Model):
     def __str__(self):
         return self.name
 
+# recipe queryset: Recipe.objects.for_user(user) is what a user may read, edit and delete
+class RecipeQuerySet(models.QuerySet):
+    def for_user(self, user):
+        """The recipes ``user`` owns; none for anonymous users."""
+        if not user.is_authenticated:
+            return self.none()
+        return self.filter(owner=user)
+
+    def with_is_fav(self, user):
+        """Annotate ``is_fav`` (in ``user``'s favorites) in the same query."""
+        return self.annotate(is_fav=Exists(FavoriteRecipe.objects.filter(user=user, recipe=OuterRef('pk'))))
+
 # recipe model
 class Recipe(models.Model):
     TIME_UNITS = [
@@ -33,6 +49,7 @@ class Recipe(models.Model):
         ('wk', 'Weeks'),
         ('mo', 'Months'),
     ]
+    TIME_UNIT_NAMES = dict(TIME_UNITS)
 
     SPICE_LEVELS = [(i, str(i)) for i in range(6)]
 
@@ -53,6 +70,35 @@ class Recipe(models.Model):
         null=True,
         blank=True
     )
+    # opt-in public sharing, see PublicRecipe
+    is_public = models.BooleanField(default=False)
+    # bumped on every change to the recipe or its children, the offline snapshot syncs by it
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = RecipeQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # duplicate detection streams recipes grouped by owner and slug
+            models.Index(fields=['owner', 'slug'], name='recipe_owner_slug_idx'),
+            # RecipeListView lists a user's recipes ordered by title (see explain_hot_queries)
+            models.Index(fields=['owner', 'title'], name='recipe_owner_title_idx'),
+            # offline snapshot deltas: a user's recipes changed since a version stamp
+            models.Index(fields=['owner', 'updated_at'], name='recipe_owner_updated_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # the values as loaded, so a save knows what changed without reading the row again
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        deferred = self.get_deferred_fields()
+        self._loaded_values = {field.attname: getattr(self, field.attname) for field in self._meta.concrete_fields
+                               if field.attname not in deferred}
 
     def save(self, *args, **kwargs):
         self.slug = slugify(self.title)
@@ -63,18 +109,18 @@ class Recipe(models.Model):
         return self.title
     
     def pluralize_unit(self, count, unit_code):
-        unit_name = dict(self.TIME_UNITS).get(unit_code, "")
+        unit_name = self.TIME_UNIT_NAMES.get(unit_code, "")
         if count == 1:
             return unit_name
         return f"{unit_name}s" 
     
     def get_prep_display(self):
         """Return human-readable prep time, e.g., '2 Hours'."""
-        return f"{self.prep_time} {dict(self.TIME_UNITS).get(self.prep_time_unit)}"
+        return time_display(self.prep_time, self.prep_time_unit)
 
     def get_cook_display(self):
         """Return human-readable cook time, e.g., '45 Minutes'."""
-        return f"{self.cook_time} {dict(self.TIME_UNITS).get(self.cook_time_unit)}"
+        return time_display(self.cook_time, self.cook_time_unit)
     
     def is_favorite(self, user):
         """Return True if this recipe is in the user's favorites."""
@@ -82,6 +128,19 @@ class Recipe(models.Model):
             return False
         return self.favoriterecipe_set.filter(user=user).exists()
 
+# '2 Hours': few distinct times, each string is made once and shared (see read_models.py)
+@lru_cache(maxsize=1024)
+def time_display(amount, unit):
+    return f"{amount} {Recipe.TIME_UNIT_NAMES.get(unit)}"
+
+# ingredient and step queryset: the children of a user's own recipes
+class RecipeChildQuerySet(models.QuerySet):
+    def for_user(self, user):
+        """Children of the recipes ``user`` owns, with the recipe loaded in the same query."""
+        if not user.is_authenticated:
+            return self.none()
+        return self.filter(recipe__owner=user).select_related('recipe')
+
 # ingredient measure model
 class IngreadientMeasure(models.Model):
     measure = models.CharField(max_length=100, unique=True)
@@ -96,20 +155,34 @@ class Ingredient(models.Model):
     quantity = models.CharField(max_length=50, blank=True, null=True)
     measure = models.ForeignKey(IngreadientMeasure, null=True, blank=True, on_delete=models.SET_NULL)
 
+    objects = RecipeChildQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.name} - {self.quantity or ''} - {self.measure}"
 
 # recipe step model
 class Step(models.Model):
     recipe = models.ForeignKey(Recipe, related_name='steps', on_delete=models.CASCADE)
+    # ordering key with gaps, not the number shown (see step_order.py)
     step_number = models.PositiveIntegerField()
     step = models.TextField()
 
+    objects = RecipeChildQuerySet.as_manager()
+
     class Meta:
         ordering = ['step_number']
+        constraints = [
+            # also the index a recipe's steps are read in order through
+            models.UniqueConstraint(fields=['recipe', 'step_number'], name='unique_recipe_step_number'),
+        ]
 
     def __str__(self):
-        return f"{self.step_number}. { self.step }"
+        return self.step
+
+    @property
+    def position(self):
+        """The number shown for this step: 1 for the first of its recipe."""
+        return self.recipe.steps.filter(step_number__lt=self.step_number).count() + 1
     
 # favorite recipe model
 class FavoriteRecipe(models.Model):
@@ -124,3 +197,159 @@ class FavoriteRecipe(models.Model):
     
     def __str__(self):
         return f"{self.user.username}\s favorite recipe: {self.recipe.name}"
+
+# recipe version model (revision history)
+class RecipeVersion(models.Model):
+    """One saved revision of a recipe with its ingredients and steps.
+
+    Checkpoints hold a full snapshot in ``data``; every other version holds a
+    compact diff against the version right before it (see ``versioning.py``).
+    """
+    recipe = models.ForeignKey(Recipe, related_name='versions', on_delete=models.CASCADE)
+    number = models.PositiveIntegerField()
+    is_checkpoint = models.BooleanField(default=False)
+    data = models.JSONField()
+    author = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['-number']
+        constraints = [
+            models.UniqueConstraint(fields=['recipe', 'number'], name='unique_recipe_version')
+        ]
+
+    def __str__(self):
+        return f"{self.recipe} - v{self.number}"
+
+# background task model (queue rows, see task_queue.py)
+class Task(models.Model):
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    name = models.CharField(max_length=200)
+    args = models.JSONField(default=list)
+    kwargs = models.JSONField(default=dict)
+    priority = models.SmallIntegerField(default=0)
+    status = models.CharField(max_length=10, choices=STATUSES, default=QUEUED)
+    idempotency_key = models.CharField(max_length=200, unique=True, null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            # workers pick the next due task by status, priority and run_at
+            models.Index(fields=['status', '-priority', 'run_at'], name='task_next_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.status})"
+
+# activity log entry (buffered, batched writes, see events.py)
+class Event(models.Model):
+    CREATE = 'create'
+    UPDATE = 'update'
+    DELETE = 'delete'
+    RESTORE = 'restore'
+    FAVORITE = 'favorite'
+    UNFAVORITE = 'unfavorite'
+    ACTIONS = [
+        (CREATE, 'Created'),
+        (UPDATE, 'Updated'),
+        (DELETE, 'Deleted'),
+        (RESTORE, 'Restored'),
+        (FAVORITE, 'Favorited'),
+        (UNFAVORITE, 'Unfavorited'),
+    ]
+
+    created_at = models.DateTimeField(default=timezone.now)
+    # no constraints: the log outlives the users and recipes it mentions
+    actor = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.DO_NOTHING,
+                              db_constraint=False, related_name='+')
+    actor_name = models.CharField(max_length=150, blank=True)
+    action = models.CharField(max_length=20, choices=ACTIONS)
+    object_type = models.CharField(max_length=50)
+    object_id = models.BigIntegerField(null=True, blank=True)
+    recipe_id = models.BigIntegerField(null=True, blank=True)
+    label = models.CharField(max_length=200, blank=True)
+    data = models.JSONField(default=dict, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            # per-recipe activity feeds, newest first
+            models.Index(fields=['recipe_id', '-created_at'], name='event_recipe_created_idx'),
+            # retention pruning deletes by age
+            models.Index(fields=['created_at'], name='event_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.actor_name} {self.action} {self.object_type} {self.label}"
+
+# materialized dashboard statistics of one user, kept current by signals (see dashboard.py)
+class UserStats(models.Model):
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, primary_key=True, related_name='stats',
+                                on_delete=models.CASCADE)
+    recipe_count = models.PositiveIntegerField(default=0)
+    # the average spice level is spice_total / recipe_count
+    spice_total = models.PositiveIntegerField(default=0)
+    favorite_count = models.PositiveIntegerField(default=0)
+    # {category id ('' for none): recipes}
+    category_counts = models.JSONField(default=dict)
+    # [[id, title, slug], ...] newest first
+    recent = models.JSONField(default=list)
+    # [[id, title, slug, minutes, cook time], ...] quickest first
+    quickest = models.JSONField(default=list)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.user} stats"
+
+# a recipe moved out of the hot tables with its children, in ARCHIVE_DATABASE (see archive.py)
+class ArchivedRecipe(models.Model):
+    # the recipe's own id, kept when it moves back
+    id = models.BigIntegerField(primary_key=True)
+    # plain ids, not foreign keys: the archive may be another database
+    owner_id = models.BigIntegerField(null=True)
+    title = models.CharField(max_length=200)
+    slug = models.SlugField(max_length=250, db_index=False)
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(default=timezone.now)
+    # {'recipe': {...}, 'ingredients': [...], 'steps': [...], 'favorites': [...], 'versions': [...]}
+    data = models.JSONField(encoder=DjangoJSONEncoder)
+
+    class Meta:
+        indexes = [
+            # found by the url's owner and slug, listed by title
+            models.Index(fields=['owner_id', 'slug'], name='archived_owner_slug_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.title} (archived)"
+
+
+# an ingredient or step id of an archived recipe: child urls find the recipe by it,
+# without reading every archived blob
+class ArchivedChild(models.Model):
+    archived = models.ForeignKey(ArchivedRecipe, on_delete=models.CASCADE, related_name='children')
+    # the payload key: 'ingredients' or 'steps'
+    kind = models.CharField(max_length=20)
+    child_id = models.BigIntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['kind', 'child_id'], name='archived_child_idx'),
+        ]
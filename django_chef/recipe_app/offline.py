@@ -0,0 +1,121 @@
+"""
+Offline recipe book (service worker + JSON snapshot).
+
+The service worker (``templates/recipe_app/offline/sw.js``) precaches the
+static assets and an offline shell page, and keeps the user's recipe book,
+their own recipes plus their favorites, as one JSON document in the browser
+cache. ``static/js/offline.js`` renders the recipe list, favorites and
+recipe pages from that document when the network is gone.
+
+``snapshot`` builds the document:
+
+* without ``since`` it holds every recipe of the book (``full`` is true);
+* with ``since``, the ``version`` of the client's copy, it only holds the
+  recipes changed or favorited after it, plus the ids of the whole book and
+  of the favorites so the worker can drop deleted and unfavorited recipes.
+
+``version`` is taken before querying, in milliseconds since the epoch, and
+deltas reach back ``OVERLAP`` further so a recipe saved while the previous
+snapshot was being built is sent again rather than missed.
+"""
+import hashlib
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db.models import Q
+from django.templatetags.static import static
+from django.utils import timezone
+
+from .models import FavoriteRecipe, Recipe
+
+OVERLAP = timedelta(seconds=2)
+# besides the page assets; the icon font is referenced from bootstrap-icons.css
+PRECACHE_EXTRA = ['css/fonts/bootstrap-icons.woff2', 'img/default_meal.png', 'img/icon-192.png', 'img/icon-512.png']
+
+
+def precache_urls():
+    """Static URLs the service worker stores on install (hashed names when collected)."""
+    if settings.STATIC_BUNDLES:
+        names = [settings.STATIC_BUNDLE_CSS_NAME, settings.STATIC_BUNDLE_JS_NAME]
+    else:
+        names = [*settings.STATIC_BUNDLES_CSS, *settings.STATIC_BUNDLES_JS]
+    return [static(name) for name in [*names, *PRECACHE_EXTRA]]
+
+
+def cache_version(urls):
+    """Changes whenever a precached URL does, which makes browsers install the new worker."""
+    return hashlib.md5('\n'.join(urls).encode()).hexdigest()[:12]
+
+
+def parse_version(value):
+    """``'1760896923123'`` -> aware datetime, None for a missing or bad stamp."""
+    try:
+        stamp = int(value)
+    except (TypeError, ValueError):
+        return None
+    if stamp <= 0:
+        return None
+    return datetime.fromtimestamp(stamp / 1000, tz=dt_timezone.utc)
+
+
+def version_of(moment):
+    return int(moment.timestamp() * 1000)
+
+
+def _favorites(user):
+    return FavoriteRecipe.objects.filter(user=user)
+
+
+def _book(user):
+    # a subquery rather than a join: no duplicates, no DISTINCT
+    return Recipe.objects.filter(Q(owner=user) | Q(pk__in=_favorites(user).values('recipe_id')))
+
+
+def serialize(recipe, user_id):
+    """Compact form of one recipe: ingredients and steps as short lists."""
+    return {
+        'id': recipe.pk,
+        'title': recipe.title,
+        'slug': recipe.slug,
+        'description': recipe.description,
+        'prep': recipe.get_prep_display(),
+        'cook': recipe.get_cook_display(),
+        'spice': recipe.spice_level,
+        'category': recipe.category.name if recipe.category else None,
+        'image': recipe.image.url if recipe.image else static('img/default_meal.png'),
+        'mine': recipe.owner_id == user_id,
+        'ingredients': [
+            [i.name, i.quantity or '', i.measure.measure if i.measure else '']
+            for i in recipe.ingredients.all()
+        ],
+        'steps': [[number, s.step] for number, s in enumerate(recipe.steps.all(), 1)],
+    }
+
+
+def snapshot(user, since=None):
+    """The user's recipe book, or only what changed after the ``since`` datetime."""
+    now = timezone.now()
+    full = since is None
+    book = _book(user)
+    favorites = list(_favorites(user).order_by('recipe_id').values_list('recipe_id', flat=True))
+
+    changed = book
+    if not full:
+        cutoff = since - OVERLAP
+        # a newly favorited recipe may not have changed in ages
+        favorited = _favorites(user).filter(added_on__gt=cutoff).values('recipe_id')
+        changed = book.filter(Q(updated_at__gt=cutoff) | Q(pk__in=favorited))
+    changed = (changed.select_related('category')
+               .prefetch_related('ingredients__measure', 'steps')
+               .order_by('title'))
+
+    data = {
+        'version': version_of(now),
+        'user': user.pk,
+        'full': full,
+        'favorites': favorites,
+        'recipes': [serialize(recipe, user.pk) for recipe in changed],
+    }
+    if not full:
+        data['ids'] = list(book.order_by('pk').values_list('pk', flat=True))
+    return data
@@ -0,0 +1,416 @@
+"""
+"What can I cook?": recipes ranked by how much of a pantry they use.
+
+An inverted index maps every normalized ingredient name (``normalize``) to
+the sorted doc numbers of the recipes using it. Public recipes are numbered
+first and private ones grouped by owner, so what a user can read is two
+ranges of doc numbers. ``search`` cuts those ranges out of the postings of
+the pantry's ingredients and adds them up into one counter per recipe
+(numpy fancy-index adds when numpy is installed, a ``Counter`` otherwise):
+a query never touches the ``Ingredient`` table nor recipes the user cannot
+see. Recipes rank by fewest missing ingredients, then most used.
+
+The index lives in ``PANTRY_INDEX_DIR``:
+
+* ``base-<n>.idx``: every recipe as of generation ``n``, written by ``build``
+  (``manage.py build_pantry_index``). Its arrays are memory-mapped, so
+  worker processes share the pages and nothing is loaded up front;
+* ``changes-<n>.log``: one JSON line per recipe changed during generation
+  ``n``, holding its whole ingredient set (or just its id once deleted),
+  appended after commit by the Recipe/Ingredient signals. Replaying a line
+  twice is harmless;
+* ``generation``: the generation changes are appended to.
+
+``build`` moves writers to the next generation before it reads the
+database, so every change is in the new base, the new log or both.
+Searches read the newest base and replay the logs of its generation and
+the one before. The logs only grow until the next build, which is also
+needed after bulk loads that skip signals (``seed_chef``).
+"""
+import heapq
+import json
+import mmap
+import os
+import re
+import struct
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from itertools import groupby
+from pathlib import Path
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from .models import Ingredient, Recipe, Task
+from .tasks import build_pantry_index
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+MAGIC = b'CHEFPAN1'
+# magic, length of the json meta that follows; the arrays start at the next multiple of 8
+HEADER = struct.Struct('<8sQ')
+NO_OWNER = -1
+BUILD_KEY = 'pantry-index-build'
+# the same ingredient however it is prepared: "chopped onions" is an onion
+PREPARATION_WORDS = {'chopped', 'diced', 'dried', 'fresh', 'frozen', 'grated', 'large', 'minced',
+                     'organic', 'sliced', 'small', 'whole'}
+WORD_RE = re.compile(r"[a-z]+")
+PANTRY_SPLIT_RE = re.compile(r"[,;\n]+")
+
+
+# tokens
+def _singular(word):
+    if len(word) > 4 and word.endswith('ies'):
+        return word[:-3] + 'y'
+    if len(word) > 4 and word.endswith('oes'):
+        return word[:-2]
+    if len(word) > 3 and word.endswith('s') and not word.endswith(('ss', 'us')):
+        return word[:-1]
+    return word
+
+
+def normalize(name):
+    """The index token of an ingredient name, e.g. 'Chopped Tomatoes' -> 'tomato'."""
+    return ' '.join(_singular(word) for word in WORD_RE.findall(name.lower()) if word not in PREPARATION_WORDS)
+
+
+def tokens(names):
+    return {token for token in map(normalize, names) if token}
+
+
+def parse_pantry(text):
+    """The tokens of a comma or line separated list of ingredients."""
+    return tokens(PANTRY_SPLIT_RE.split(text))
+
+
+# files
+def _dir():
+    return Path(settings.PANTRY_INDEX_DIR)
+
+
+def _base_path(generation):
+    return _dir() / f"base-{generation}.idx"
+
+
+def _log_path(generation):
+    return _dir() / f"changes-{generation}.log"
+
+
+def _generation_of(path):
+    return int(path.stem.rpartition('-')[2])
+
+
+def current_generation():
+    try:
+        return int((_dir() / 'generation').read_text())
+    except (FileNotFoundError, ValueError):
+        return 0
+
+
+def _newest_base():
+    bases = sorted(_dir().glob('base-*.idx'), key=_generation_of)
+    return bases[-1] if bases else None
+
+
+def _replace(path, data):
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+# changes
+def recipe_state(recipe_id):
+    """A recipe's log line: owner, visibility and ingredient tokens, only the id once it is gone."""
+    recipe = Recipe.objects.filter(pk=recipe_id).values('owner_id', 'is_public').first()
+    if recipe is None:
+        return {'id': recipe_id}
+    names = Ingredient.objects.filter(recipe_id=recipe_id).values_list('name', flat=True)
+    return {'id': recipe_id, 'owner': recipe['owner_id'], 'public': recipe['is_public'], 'tokens': sorted(tokens(names))}
+
+
+def log_change(recipe_id):
+    generation = current_generation()
+    if not generation:
+        # nothing to keep up to date before the first build
+        return
+    path = _log_path(generation)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    line = json.dumps(recipe_state(recipe_id)) + '\n'
+    with path.open('a', encoding='utf-8') as log:
+        log.write(line)
+
+
+_pending = threading.local()
+
+
+def recipe_changed(recipe_id):
+    """Log the recipe's state after the current transaction commits, once per transaction."""
+    pending = _pending.__dict__.setdefault('ids', set())
+    pending.add(recipe_id)
+
+    def flush():
+        # the first callback of the transaction writes, the recipe's later ones find it done
+        if recipe_id in pending:
+            pending.discard(recipe_id)
+            log_change(recipe_id)
+
+    transaction.on_commit(flush)
+
+
+# build
+def write_base(generation, rows):
+    """Write ``base-<generation>.idx`` from ``(recipe id, owner id, is public, ingredient name)`` rows.
+
+    The rows come grouped by recipe, public recipes first and private ones
+    ordered by owner; returns ``(recipes, tokens)``.
+    """
+    doc_ids, owners, sizes = array('q'), array('q'), array('i')
+    public_docs = 0
+    doc_postings = {}
+    for (recipe_id, owner_id, is_public), group in groupby(rows, key=lambda row: row[:3]):
+        recipe_tokens = tokens(row[3] for row in group)
+        if not recipe_tokens:
+            continue
+        doc = len(doc_ids)
+        doc_ids.append(recipe_id)
+        owners.append(NO_OWNER if owner_id is None else owner_id)
+        sizes.append(len(recipe_tokens))
+        public_docs += is_public
+        for token in recipe_tokens:
+            doc_postings.setdefault(token, array('i')).append(doc)
+
+    # recipe id -> doc lookups, for the changes replayed over the base
+    by_id = sorted(range(len(doc_ids)), key=doc_ids.__getitem__)
+    sorted_ids, sorted_docs = array('q', (doc_ids[doc] for doc in by_id)), array('i', by_id)
+
+    vocabulary, postings = {}, array('i')
+    for token, docs in doc_postings.items():
+        vocabulary[token] = [len(postings), len(docs)]
+        postings.extend(docs)
+    meta = json.dumps({'generation': generation, 'docs': len(doc_ids), 'public_docs': public_docs,
+                       'postings': len(postings), 'vocabulary': vocabulary}).encode()
+
+    tmp = _base_path(generation).with_name(f"base-{generation}.{os.getpid()}.tmp")
+    with tmp.open('wb') as out:
+        out.write(HEADER.pack(MAGIC, len(meta)) + meta)
+        out.write(b'\0' * (-out.tell() % 8))
+        # native byte order, 8 byte items first so every array stays aligned
+        for values in (doc_ids, owners, sorted_ids, sizes, sorted_docs, postings):
+            values.tofile(out)
+    os.replace(tmp, _base_path(generation))
+    return len(doc_ids), len(vocabulary)
+
+
+def build(chunk_size=20_000):
+    """Write a new base of every recipe with ingredients; returns ``(generation, recipes, tokens)``."""
+    folder = _dir()
+    folder.mkdir(parents=True, exist_ok=True)
+    generation = current_generation() + 1
+    # changes from here on go to the new log, before the database is read
+    _replace(folder / 'generation', str(generation).encode())
+
+    rows = (Ingredient.objects.exclude(recipe__owner=None, recipe__is_public=False)
+            .order_by('-recipe__is_public', 'recipe__owner_id', 'recipe_id')
+            .values_list('recipe_id', 'recipe__owner_id', 'recipe__is_public', 'name')
+            .iterator(chunk_size=chunk_size))
+    recipes, vocabulary = write_base(generation, rows)
+
+    # the previous log is still replayed: a write that read the old generation may land there late
+    for path in [*folder.glob('base-*.idx'), *folder.glob('changes-*.log')]:
+        oldest_kept = generation if path.suffix == '.idx' else generation - 1
+        if _generation_of(path) < oldest_kept:
+            try:
+                path.unlink()
+            except OSError:
+                # still mapped by a process on platforms that refuse that; the next build retries
+                pass
+    return generation, recipes, vocabulary
+
+
+# search
+def _rank(result):
+    recipe_id, used, missing = result
+    return missing, -used, -recipe_id
+
+
+class PantryIndex:
+    """One memory-mapped base and the changes replayed over it."""
+    def __init__(self, path):
+        with open(path, 'rb') as base:
+            self.map = mmap.mmap(base.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, meta_length = HEADER.unpack_from(self.map)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a pantry index")
+        meta = json.loads(self.map[HEADER.size:HEADER.size + meta_length])
+        self.generation = meta['generation']
+        self.vocabulary = meta['vocabulary']
+        self.public_docs = meta['public_docs']
+        docs = meta['docs']
+        self.offset = HEADER.size + meta_length
+        self.offset += -self.offset % 8
+        self.doc_ids = self._array('q', docs)
+        self.owners = self._array('q', docs)
+        self.sorted_ids = self._array('q', docs)
+        self.sizes = self._array('i', docs)
+        self.sorted_docs = self._array('i', docs)
+        self.postings = self._array('i', meta['postings'])
+        # recipe id -> (owner, public, tokens) of the replayed changes, no tokens once deleted
+        self.changes = {}
+        # base docs of the changed recipes, left out of the base's scores
+        self.changed_docs = set()
+        self.log_offsets = {}
+
+    def _array(self, typecode, count):
+        start = self.offset
+        self.offset += array(typecode).itemsize * count
+        if numpy is not None:
+            return numpy.frombuffer(self.map, dtype=typecode, count=count, offset=start)
+        return memoryview(self.map)[start:self.offset].cast(typecode)
+
+    def refresh(self, generation):
+        """Replay the log lines appended since the last refresh."""
+        for log_generation in range(self.generation - 1, generation + 1):
+            start = self.log_offsets.get(log_generation, 0)
+            try:
+                with _log_path(log_generation).open('rb') as log:
+                    log.seek(start)
+                    data = log.read()
+            except FileNotFoundError:
+                continue
+            # a line still being appended waits for the next refresh
+            end = data.rfind(b'\n') + 1
+            for line in data[:end].splitlines():
+                self._apply(json.loads(line))
+            self.log_offsets[log_generation] = start + end
+
+    def _apply(self, state):
+        recipe_id = state['id']
+        owner = state.get('owner')
+        self.changes[recipe_id] = (NO_OWNER if owner is None else owner, state.get('public', False),
+                                   frozenset(state.get('tokens', ())))
+        position = bisect_left(self.sorted_ids, recipe_id)
+        if position < len(self.sorted_ids) and self.sorted_ids[position] == recipe_id:
+            self.changed_docs.add(int(self.sorted_docs[position]))
+
+    def visible(self, user_id):
+        """The doc ranges ``user_id`` can read: every public recipe, then their private ones."""
+        start = bisect_left(self.owners, user_id, self.public_docs)
+        stop = bisect_right(self.owners, user_id, start)
+        return [(0, self.public_docs), (start, stop)]
+
+    def search(self, pantry, user_id, limit):
+        """``(recipe id, used, missing)`` of the ``limit`` best recipes for ``pantry`` that ``user_id`` can read."""
+        postings = []
+        for token in pantry:
+            if token in self.vocabulary:
+                start, count = self.vocabulary[token]
+                postings.append(self.postings[start:start + count])
+        score = self._score_vectorized if numpy is not None else self._score
+        results = score(postings, user_id, limit) if postings else []
+        for recipe_id, (owner, public, recipe_tokens) in self.changes.items():
+            used = len(recipe_tokens & pantry)
+            if used and (owner == user_id or public):
+                results.append((recipe_id, used, len(recipe_tokens) - used))
+        return heapq.nsmallest(limit, results, key=_rank)
+
+    def _score_vectorized(self, postings, user_id, limit):
+        all_docs, all_used = [], []
+        for start, stop in self.visible(user_id):
+            if start == stop:
+                continue
+            # a recipe is in a posting at most once, so these adds count the shared ingredients
+            counts = numpy.zeros(stop - start, dtype=numpy.int16)
+            for docs in postings:
+                counts[docs[docs.searchsorted(start):docs.searchsorted(stop)] - start] += 1
+            changed = [doc - start for doc in self.changed_docs if start <= doc < stop]
+            counts[changed] = 0
+            docs = numpy.flatnonzero(counts)
+            all_used.append(counts[docs])
+            all_docs.append(docs + start)
+        if not all_docs:
+            return []
+        docs = numpy.concatenate(all_docs)
+        used = numpy.concatenate(all_used).astype(numpy.int64)
+        missing = self.sizes[docs] - used
+        if len(docs) > limit:
+            # fewest missing, then most used: only the docs up to the limit-th key (and its ties) are sorted
+            key = missing * (len(postings) + 1) - used
+            top = key <= numpy.partition(key, limit - 1)[limit - 1]
+            docs, used, missing = docs[top], used[top], missing[top]
+        recipe_ids = self.doc_ids[docs]
+        order = numpy.lexsort((-recipe_ids, -used, missing))[:limit]
+        return list(zip(recipe_ids[order].tolist(), used[order].tolist(), missing[order].tolist()))
+
+    def _score(self, postings, user_id, limit):
+        counts = Counter()
+        for start, stop in self.visible(user_id):
+            for docs in postings:
+                counts.update(docs[bisect_left(docs, start):bisect_left(docs, stop)])
+        results = [(self.doc_ids[doc], used, self.sizes[doc] - used)
+                   for doc, used in counts.items() if doc not in self.changed_docs]
+        return heapq.nsmallest(limit, results, key=_rank)
+
+
+_lock = threading.Lock()
+_index = None
+
+
+def get_index():
+    """The newest base with the changes logged so far; None before the first build."""
+    global _index
+    with _lock:
+        generation = current_generation()
+        if _index is None or (generation != _index.generation and _base_path(generation).exists()):
+            base = _newest_base() if _dir().exists() else None
+            if base is None:
+                return None
+            _index = PantryIndex(base)
+        _index.refresh(generation)
+        return _index
+
+
+def search(pantry, user, limit=None):
+    """``(recipe id, used, missing)`` of the best recipes ``user`` can read; None until the index is built."""
+    index = get_index()
+    if index is None:
+        return None
+    return index.search(frozenset(pantry), user.pk, limit or settings.PANTRY_RESULTS)
+
+
+def request_build():
+    """Queue the first build (inline with ``TASK_ALWAYS_EAGER``)."""
+    # a finished build whose files have been removed since runs again
+    Task.objects.filter(idempotency_key=BUILD_KEY, status__in=[Task.DONE, Task.FAILED]).delete()
+    build_pantry_index.enqueue(idempotency_key=BUILD_KEY)
+
+
+def suggest(user, pantry):
+    """The recipes for ``pantry`` (tokens) as dicts for the template; None while the index is being built."""
+    results = search(pantry, user)
+    if results is None:
+        request_build()
+        results = search(pantry, user)
+    if results is None:
+        return None
+    # the index can lag a visibility change by a moment, the rows can't
+    recipes = (Recipe.objects.filter(Q(owner=user) | Q(is_public=True), pk__in=[result[0] for result in results])
+               .select_related('category').prefetch_related('ingredients').in_bulk())
+    suggestions = []
+    for recipe_id, used, missing in results:
+        recipe = recipes.get(recipe_id)
+        if recipe is None:
+            continue
+        suggestions.append({
+            'recipe': recipe,
+            'used': used,
+            'total': used + missing,
+            'missing': sorted({i.name for i in recipe.ingredients.all() if normalize(i.name) not in pantry}),
+            'own': recipe.owner_id == user.pk,
+        })
+    return suggestions
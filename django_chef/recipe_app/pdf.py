@@ -0,0 +1,188 @@
+"""
+Minimal streaming PDF writer for the cookbook export (see export.py).
+
+PDF objects can be written in any order as long as the cross-reference
+table at the end knows their byte offsets, so ``PdfWriter`` hands every
+object to ``write`` as soon as it is complete and only remembers offsets and
+page ids. Text uses the standard Helvetica fonts (nothing to embed, wrapped
+with their AFM widths) and images are JPEG bytes embedded as they are.
+
+``Document`` lays out headings, wrapped paragraphs and images top to bottom
+on A4 pages and starts a new page when one is full.
+"""
+import zlib
+
+PAGE_WIDTH, PAGE_HEIGHT = 595, 842  # A4 in points
+MARGIN = 56
+LINE_SPACING = 1.35
+
+# AFM widths (1/1000 em) of Helvetica and Helvetica-Bold for ' ' to '~'; others use DEFAULT_WIDTH
+HELVETICA = [
+    278, 278, 355, 556, 556, 889, 667, 191, 333, 333, 389, 584, 278, 333, 278, 278, 556, 556, 556, 556,
+    556, 556, 556, 556, 556, 556, 278, 278, 584, 584, 584, 556, 1015, 667, 667, 722, 722, 667, 611, 778,
+    722, 278, 500, 667, 556, 833, 722, 778, 667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 278,
+    278, 278, 469, 556, 333, 556, 556, 500, 556, 556, 278, 556, 556, 222, 222, 500, 222, 833, 556, 556,
+    556, 556, 333, 500, 278, 556, 500, 722, 500, 500, 500, 334, 260, 334, 584,
+]
+HELVETICA_BOLD = [
+    278, 333, 474, 556, 556, 889, 722, 238, 333, 333, 389, 584, 278, 333, 278, 278, 556, 556, 556, 556,
+    556, 556, 556, 556, 556, 556, 333, 333, 584, 584, 584, 611, 975, 722, 722, 722, 722, 667, 611, 778,
+    722, 278, 556, 722, 611, 833, 722, 778, 667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 333,
+    278, 333, 584, 556, 333, 556, 611, 556, 611, 556, 333, 611, 611, 278, 278, 556, 278, 889, 611, 611,
+    611, 611, 389, 556, 333, 611, 556, 778, 556, 556, 500, 389, 280, 389, 584,
+]
+DEFAULT_WIDTH = 556
+FONTS = {False: ('F1', HELVETICA), True: ('F2', HELVETICA_BOLD)}
+
+# fixed object numbers, everything else is numbered from FIRST_FREE_ID
+CATALOG_ID, PAGES_ID, FONT_ID, BOLD_FONT_ID = 1, 2, 3, 4
+FIRST_FREE_ID = 5
+
+
+def text_width(text, size, bold=False):
+    widths = FONTS[bold][1]
+    total = 0
+    for char in text:
+        code = ord(char) - 32
+        total += widths[code] if 0 <= code < len(widths) else DEFAULT_WIDTH
+    return total * size / 1000
+
+
+def wrap(text, size, width, bold=False):
+    """Split ``text`` into lines no wider than ``width`` points."""
+    lines = []
+    for paragraph in text.splitlines() or ['']:
+        line = ''
+        for word in paragraph.split():
+            candidate = f"{line} {word}" if line else word
+            if line and text_width(candidate, size, bold) > width:
+                lines.append(line)
+                line = word
+            else:
+                line = candidate
+        lines.append(line)
+    return lines
+
+
+def _literal(text):
+    """A PDF string literal in the fonts' WinAnsi encoding."""
+    data = text.encode('cp1252', errors='replace')
+    return b'(' + data.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)') + b')'
+
+
+class PdfWriter:
+    """Writes PDF objects to ``write`` (a callable taking bytes) as they are added."""
+    def __init__(self, write, title=''):
+        self._write = write
+        self.title = title
+        self.offset = 0
+        self.offsets = {}
+        self.next_id = FIRST_FREE_ID
+        self.page_ids = []
+        self._emit(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+
+    def _emit(self, data):
+        self._write(data)
+        self.offset += len(data)
+
+    def _object(self, body, obj_id=None):
+        if obj_id is None:
+            obj_id = self.next_id
+            self.next_id += 1
+        self.offsets[obj_id] = self.offset
+        self._emit(b'%d 0 obj\n' % obj_id + body + b'\nendobj\n')
+        return obj_id
+
+    def _stream(self, data, extra=b''):
+        return self._object(b'<< /Length %d %s>>\nstream\n' % (len(data), extra) + data + b'\nendstream')
+
+    def image(self, jpeg, width, height):
+        """Embed JPEG bytes; returns the object id to draw it with."""
+        return self._stream(jpeg, b'/Type /XObject /Subtype /Image /Width %d /Height %d '
+                                  b'/ColorSpace /DeviceRGB /BitsPerComponent 8 /Filter /DCTDecode ' % (width, height))
+
+    def page(self, content, image_ids=()):
+        content_id = self._stream(zlib.compress(content), b'/Filter /FlateDecode ')
+        xobjects = b' '.join(b'/Im%d %d 0 R' % (i, i) for i in image_ids)
+        self.page_ids.append(self._object(
+            b'<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %d %d] /Contents %d 0 R '
+            b'/Resources << /Font << /F1 %d 0 R /F2 %d 0 R >> /XObject << %s >> >> >>'
+            % (PAGES_ID, PAGE_WIDTH, PAGE_HEIGHT, content_id, FONT_ID, BOLD_FONT_ID, xobjects)
+        ))
+
+    def close(self):
+        self._object(b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>', FONT_ID)
+        self._object(b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>',
+                     BOLD_FONT_ID)
+        kids = b' '.join(b'%d 0 R' % i for i in self.page_ids)
+        self._object(b'<< /Type /Pages /Kids [%s] /Count %d >>' % (kids, len(self.page_ids)), PAGES_ID)
+        self._object(b'<< /Type /Catalog /Pages %d 0 R >>' % PAGES_ID, CATALOG_ID)
+        info_id = self._object(b'<< /Title %s /Producer (Django Chef) >>' % _literal(self.title))
+
+        xref_offset = self.offset
+        size = self.next_id
+        rows = [b'xref\n0 %d\n' % size, b'0000000000 65535 f \n']
+        for obj_id in range(1, size):
+            if obj_id in self.offsets:
+                rows.append(b'%010d 00000 n \n' % self.offsets[obj_id])
+            else:
+                rows.append(b'0000000000 65535 f \n')
+        rows.append(b'trailer\n<< /Size %d /Root %d 0 R /Info %d 0 R >>\nstartxref\n%d\n%%%%EOF\n'
+                    % (size, CATALOG_ID, info_id, xref_offset))
+        self._emit(b''.join(rows))
+
+
+class Document:
+    """Top-to-bottom page layout on top of a ``PdfWriter``."""
+    def __init__(self, writer):
+        self.writer = writer
+        self.content = []
+        self.images = []
+        self.y = PAGE_HEIGHT - MARGIN
+        self.width = PAGE_WIDTH - 2 * MARGIN
+
+    @property
+    def blank(self):
+        return not self.content
+
+    def new_page(self):
+        if self.content:
+            self.writer.page(b'\n'.join(self.content), self.images)
+        self.content, self.images = [], []
+        self.y = PAGE_HEIGHT - MARGIN
+
+    def _room(self, height):
+        if self.y - height < MARGIN and not self.blank:
+            self.new_page()
+
+    def space(self, points):
+        self.y -= points
+
+    def text(self, text, size=11, bold=False, indent=0, center=False):
+        font = FONTS[bold][0].encode()
+        leading = size * LINE_SPACING
+        for line in wrap(text, size, self.width - indent, bold):
+            self._room(leading)
+            self.y -= leading
+            x = MARGIN + indent
+            if center:
+                x = (PAGE_WIDTH - text_width(line, size, bold)) / 2
+            self.content.append(b'BT /%s %d Tf %.2f %.2f Td %s Tj ET' % (font, size, x, self.y, _literal(line)))
+
+    def image(self, image_id, width, height, max_height=260):
+        """Draw an embedded image centered, scaled to fit the text width and ``max_height``."""
+        scale = min(self.width / width, max_height / height, 1)
+        drawn_width, drawn_height = width * scale, height * scale
+        self._room(drawn_height)
+        self.y -= drawn_height
+        x = (PAGE_WIDTH - drawn_width) / 2
+        self.content.append(b'q %.2f 0 0 %.2f %.2f %.2f cm /Im%d Do Q' % (drawn_width, drawn_height, x, self.y, image_id))
+        if image_id not in self.images:
+            self.images.append(image_id)
+
+    def close(self):
+        self.new_page()
+        if not self.writer.page_ids:
+            # a PDF needs at least one page
+            self.writer.page(b'')
+        self.writer.close()
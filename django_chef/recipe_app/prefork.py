@@ -0,0 +1,257 @@
+"""
+Preforking HTTP server behind ``manage.py serve``.
+
+The master process loads the WSGI application and warms it up (warmup.py)
+once, then forks the workers: they start with everything imported and
+compiled and share those memory pages with the master instead of each
+building its own copy. The garbage collector is disabled while the
+application loads and ``gc.freeze`` moves all of it into the permanent
+generation before a fork, so collections in the workers never write to
+(and so copy) the shared objects; each worker turns the collector back on.
+
+A worker connects to the databases (``prime_database``), tells the master it
+is ready and serves requests one at a time from the shared listening socket
+with wsgiref. One that dies is replaced.
+
+Signals to the master: SIGTERM or SIGINT stop gracefully (workers finish the
+request they are serving), SIGHUP reloads. A reload starts a new master, on
+the same socket and with the code read again from disk; once all its workers
+are ready the old workers stop accepting, finish their requests and exit,
+and the old master with them. The socket stays open throughout, so requests
+arriving meanwhile wait in its backlog and none is refused. If the new
+master fails to start, the old one keeps serving. With a pidfile, each
+master writes its pid there once its workers are ready.
+"""
+import gc
+import logging
+import os
+import select
+import signal
+import socket
+import subprocess
+import sys
+import time
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer
+
+from django.conf import settings
+from django.db import connections
+
+from . import events, warmup
+
+logger = logging.getLogger(__name__)
+
+# how a reloading master hands the socket and a ready pipe to the new one
+LISTEN_FD_ENV = 'DJANGO_CHEF_LISTEN_FD'
+READY_FD_ENV = 'DJANGO_CHEF_READY_FD'
+# seconds between the checks of the master loop and of an idle worker
+POLL_INTERVAL = 0.5
+
+
+def _setting(name, default):
+    return getattr(settings, f"SERVE_{name}", default)
+
+
+def listen(host, port, backlog=2048):
+    """The listening socket: inherited from a reloading master, or a new one."""
+    inherited = os.environ.pop(LISTEN_FD_ENV, None)
+    if inherited:
+        sock = socket.socket(fileno=int(inherited))
+    else:
+        sock = socket.create_server((host, port), backlog=backlog)
+    # every worker waits on it, only one accepts each connection
+    sock.setblocking(False)
+    return sock
+
+
+class RequestHandler(WSGIRequestHandler):
+    # a client that stops sending must not hold the worker
+    timeout = 30
+
+    def log_message(self, format, *args):
+        logger.info("%s %s", self.address_string(), format % args)
+
+
+class WorkerServer(WSGIServer):
+    """wsgiref's server on the shared listening socket."""
+    def __init__(self, sock, app):
+        super().__init__(sock.getsockname()[:2], RequestHandler, bind_and_activate=False)
+        self.socket.close()
+        self.socket = sock
+        self.server_address = sock.getsockname()
+        self.server_name, self.server_port = self.server_address[:2]
+        self.setup_environ()
+        self.set_app(app)
+        self.timeout = POLL_INTERVAL
+
+    def get_request(self):
+        conn, address = self.socket.accept()
+        conn.setblocking(True)
+        return conn, address
+
+    def server_close(self):
+        # the socket is the master's
+        pass
+
+
+def serve_worker(sock, app, ready_fd, master_pid):
+    stopping = []
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.append(signum))
+    # Ctrl+C and hangups reach the whole process group: the master decides
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    gc.enable()
+    warmup.prime_database()
+    server = WorkerServer(sock, app)
+    os.write(ready_fd, b'.')
+    os.close(ready_fd)
+    # an orphaned worker stops too
+    while not stopping and os.getppid() == master_pid:
+        server.handle_request()
+    # no atexit hooks after a fork
+    events.buffer.flush()
+    connections.close_all()
+
+
+class Master:
+    def __init__(self, sock, app, workers, pidfile=None, log=logger.info):
+        self.sock = sock
+        self.app = app
+        self.count = workers
+        self.pidfile = pidfile
+        self.log = log
+        self.workers = set()
+        self.ready = 0
+        self.announced = False
+        self.signals = []
+        self.reloading = None
+        # a reloading master waits on this for our workers to be ready
+        notify = os.environ.pop(READY_FD_ENV, None)
+        self.notify_fd = int(notify) if notify else None
+
+    def run(self):
+        """Serve until stopped or replaced by a reload; return the exit status."""
+        for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+            signal.signal(signum, lambda signum, frame: self.signals.append(signum))
+        self.ready_r, self.ready_w = os.pipe()
+        os.set_blocking(self.ready_r, False)
+        for _ in range(self.count):
+            self.spawn()
+        while True:
+            waiting = [self.ready_r] + ([self.reloading[1]] if self.reloading else [])
+            readable, _, _ = select.select(waiting, [], [], POLL_INTERVAL)
+            if self.ready_r in readable:
+                self.ready += len(os.read(self.ready_r, 1024))
+                if not self.announced and self.ready >= self.count:
+                    self.announce()
+            if self.reloading and (self.reloading[1] in readable or time.monotonic() > self.reloading[2]):
+                if self.reloaded(readable):
+                    break
+            if not self.reap():
+                self.stop()
+                return 1
+            if self.signals:
+                signum = self.signals.pop(0)
+                if signum != signal.SIGHUP:
+                    break
+                self.reload()
+        self.stop()
+        return 0
+
+    def spawn(self):
+        connections.close_all()
+        gc.freeze()
+        pid = os.fork()
+        if pid == 0:
+            status = 0
+            try:
+                os.close(self.ready_r)
+                if self.notify_fd is not None:
+                    os.close(self.notify_fd)
+                serve_worker(self.sock, self.app, self.ready_w, os.getppid())
+            except BaseException:
+                logger.exception("Worker %s failed", os.getpid())
+                status = 1
+            finally:
+                os._exit(status)
+        self.workers.add(pid)
+
+    def _exited(self):
+        for pid in list(self.workers):
+            done, status = os.waitpid(pid, os.WNOHANG)
+            if done:
+                self.workers.discard(pid)
+                yield pid, os.waitstatus_to_exitcode(status)
+
+    def reap(self):
+        """Replace workers that died; False when one died before the server was up."""
+        for pid, code in self._exited():
+            if not self.announced:
+                logger.error("Worker %s exited with %s while starting.", pid, code)
+                return False
+            logger.warning("Worker %s exited with %s, restarting.", pid, code)
+            self.spawn()
+        return True
+
+    def announce(self):
+        self.announced = True
+        if self.pidfile:
+            with open(self.pidfile, 'w') as out:
+                out.write(f"{os.getpid()}\n")
+        if self.notify_fd is not None:
+            os.write(self.notify_fd, b'.')
+            os.close(self.notify_fd)
+            self.notify_fd = None
+        host, port = self.sock.getsockname()[:2]
+        self.log(f"Serving on http://{host}:{port}/ with {self.count} workers (master {os.getpid()}).")
+
+    def reload(self):
+        if self.reloading:
+            return
+        self.log("Reloading: starting a new server.")
+        read_fd, write_fd = os.pipe()
+        env = dict(os.environ, **{LISTEN_FD_ENV: str(self.sock.fileno()), READY_FD_ENV: str(write_fd)})
+        process = subprocess.Popen([sys.executable, *sys.argv], env=env, pass_fds=(self.sock.fileno(), write_fd))
+        os.close(write_fd)
+        self.reloading = (process, read_fd, time.monotonic() + _setting('READY_TIMEOUT', 60))
+
+    def reloaded(self, readable):
+        """Hand over to the new server if it is ready; True when this one should stop."""
+        process, read_fd, _deadline = self.reloading
+        self.reloading = None
+        ready = read_fd in readable and os.read(read_fd, 1) == b'.'
+        os.close(read_fd)
+        if ready:
+            self.log(f"Reloaded: server {process.pid} is ready, stopping this one.")
+            return True
+        logger.error("The reloaded server did not start, still serving with this one.")
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        return False
+
+    def stop(self):
+        """Let the workers finish their requests; kill those that take too long."""
+        for pid in self.workers:
+            os.kill(pid, signal.SIGTERM)
+        deadline = time.monotonic() + _setting('GRACEFUL_TIMEOUT', 30)
+        while self.workers and time.monotonic() < deadline:
+            list(self._exited())
+            time.sleep(0.1)
+        for pid in self.workers:
+            logger.warning("Worker %s did not stop in time, killing it.", pid)
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+        self.workers.clear()
+        if self.reloading:
+            # stopped while a reload was starting: stop the new server too
+            self.reloading[0].terminate()
+            self.reloading[0].wait()
+        if self.pidfile and self._owns_pidfile():
+            os.remove(self.pidfile)
+
+    def _owns_pidfile(self):
+        try:
+            with open(self.pidfile) as pidfile:
+                return pidfile.read().strip() == str(os.getpid())
+        except (FileNotFoundError, ValueError):
+            return False
@@ -0,0 +1,148 @@
+"""
+Edge caching for public recipe pages.
+
+Public views mark their responses ``Cache-Control: public, s-maxage=...`` and
+tag them with a ``Surrogate-Key`` header. ``SharedCacheMiddleware`` is a small
+local stand-in for a reverse proxy/CDN: it stores those responses in the
+Django cache, serves them without running the rest of the stack, and keeps
+hit/miss counters. ``purge_tags`` drops every cached page carrying a tag and
+queues a task forwarding the purge to any ``PUBLIC_CACHE_PURGE_HOOKS`` (e.g. a
+real CDN).
+
+Pages are keyed on their path and the query parameters listed in
+``PUBLIC_CACHE_QUERY_PARAMS`` (none by default): other parameters (``?utm_*``,
+cache busters) get the same entry instead of one each. Every tag has a
+version in the cache; a page is stored with the versions of its tags and
+served only while they are still current, so a purge is a single ``set``
+per tag and no per-tag list of pages is kept or appended to.
+"""
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.cache import cc_delim_re
+from django.utils.http import urlencode
+
+from .tasks import run_purge_hooks
+
+KEY_PREFIX = 'public_cache'
+
+
+def get_cache():
+    return caches[getattr(settings, 'PUBLIC_CACHE_ALIAS', 'default')]
+
+
+def _page_key(request):
+    params = sorted((name, value) for name in getattr(settings, 'PUBLIC_CACHE_QUERY_PARAMS', [])
+                    for value in request.GET.getlist(name))
+    url = request.path + (f"?{urlencode(params)}" if params else '')
+    return f"{KEY_PREFIX}:page:{hashlib.md5(url.encode()).hexdigest()}"
+
+
+def _tag_key(tag):
+    return f"{KEY_PREFIX}:tag:{tag}"
+
+
+def _tag_versions(cache, tags, create=False):
+    """The current version of each of ``tags``; with ``create``, tags without one get one."""
+    keys = {_tag_key(tag): tag for tag in tags}
+    if create:
+        for key in keys:
+            # add() keeps the version a concurrent store or purge just set
+            cache.add(key, uuid.uuid4().hex, None)
+    return {keys[key]: version for key, version in cache.get_many(keys).items()}
+
+
+def _shared_max_age(response):
+    """Return s-maxage if the response may be stored by a shared cache, else None."""
+    if response.status_code != 200 or response.cookies:
+        return None
+    if 'cookie' in response.get('Vary', '').lower():
+        return None
+    directives = {}
+    for directive in cc_delim_re.split(response.get('Cache-Control', '')):
+        name, _, value = directive.strip().partition('=')
+        directives[name.lower()] = value
+    if 'public' not in directives or 's-maxage' not in directives:
+        return None
+    try:
+        return int(directives['s-maxage'])
+    except ValueError:
+        return None
+
+
+# purging
+def purge_tags(*tags):
+    """Drop every cached page tagged with one of ``tags``."""
+    # pages stored with the old versions are no longer served
+    get_cache().set_many({_tag_key(tag): uuid.uuid4().hex for tag in tags}, None)
+    if getattr(settings, 'PUBLIC_CACHE_PURGE_HOOKS', []):
+        # CDN purge APIs are slow, keep them out of the request
+        run_purge_hooks.enqueue(list(tags))
+
+
+def recipe_tag(recipe_id):
+    return f"recipe-{recipe_id}"
+
+
+# stats
+def stats():
+    cache = get_cache()
+    hits = cache.get(f"{KEY_PREFIX}:hits", 0)
+    misses = cache.get(f"{KEY_PREFIX}:misses", 0)
+    total = hits + misses
+    return {'hits': hits, 'misses': misses, 'hit_rate': hits / total if total else 0.0}
+
+
+def reset_stats():
+    get_cache().delete_many([f"{KEY_PREFIX}:hits", f"{KEY_PREFIX}:misses"])
+
+
+def _count(name):
+    cache = get_cache()
+    key = f"{KEY_PREFIX}:{name}"
+    # add() is a no-op if the counter already exists
+    cache.add(key, 0, None)
+    cache.incr(key)
+
+
+class SharedCacheMiddleware:
+    """Reverse-proxy cache stand-in; list it first in MIDDLEWARE.
+
+    Hits never reach the session, auth or CSRF middleware, just like requests
+    answered by a CDN never reach the app server.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.method not in ('GET', 'HEAD'):
+            return self.get_response(request)
+
+        cache = get_cache()
+        key = _page_key(request)
+        entry = cache.get(key)
+        if entry is not None:
+            versions, response = entry
+            # a tag evicted from the cache counts as purged
+            if _tag_versions(cache, versions) == versions:
+                _count('hits')
+                response['X-Cache'] = 'HIT'
+                return response
+
+        response = self.get_response(request)
+        timeout = _shared_max_age(response)
+        if timeout:
+            _count('misses')
+            if hasattr(response, 'render') and not response.is_rendered:
+                response.add_post_render_callback(lambda r: self._store(key, r, timeout))
+            else:
+                self._store(key, response, timeout)
+            response['X-Cache'] = 'MISS'
+        return response
+
+    def _store(self, key, response, timeout):
+        cache = get_cache()
+        versions = _tag_versions(cache, response.get('Surrogate-Key', '').split(), create=True)
+        cache.set(key, (versions, response), timeout)
@@ -0,0 +1,134 @@
+"""
+Query plan auditing (``manage.py explain_hot_queries``).
+
+``explain`` runs ``EXPLAIN QUERY PLAN`` (SQLite) or ``EXPLAIN ANALYZE``
+(PostgreSQL) for a captured query and returns the plan lines plus the
+problems found in them: full table scans and sorts the database has to do
+itself (a temp B-tree on SQLite, a Sort node on PostgreSQL). A SQLite scan
+of a covering index reads the index alone, not the table, and is accepted.
+
+``propose_index`` turns such a problem into a composite index: the columns
+the query filters on by equality, then the columns it orders by (or a range
+column). Proposals an existing index already starts with are dropped, as are
+scans of queries that neither filter nor order (reading a whole lookup table
+is fine).
+"""
+import json
+import re
+
+from django.apps import apps
+from django.db import connection
+
+TABLE_RE = re.compile(r'(?:FROM|JOIN) "(\w+)"(?: (?:AS )?"?(\w+)"?)?(?= |$)')
+EQUALITY_RE = re.compile(r'"(\w+)"\."(\w+)" (?:= |IN \(|IS NULL)')
+RANGE_RE = re.compile(r'"(\w+)"\."(\w+)" (?:<|>|<=|>=|BETWEEN) ')
+ORDER_RE = re.compile(r'ORDER BY (.+?)(?: LIMIT | OFFSET |$)')
+ORDER_COLUMN_RE = re.compile(r'"(\w+)"\."(\w+)"')
+SQLITE_SCAN_RE = re.compile(r'^SCAN (\w+)')
+SQLITE_COVERING = 'USING COVERING INDEX'
+SQLITE_TEMP_SORT = 'USE TEMP B-TREE FOR'
+
+
+def _aliases(sql):
+    """Map every table alias (and table name) used in ``sql`` to its table."""
+    aliases = {}
+    for table, alias in TABLE_RE.findall(sql):
+        aliases[table] = table
+        if alias and alias not in ('ON', 'WHERE', 'INNER', 'LEFT', 'ORDER', 'GROUP', 'LIMIT'):
+            aliases[alias] = table
+    return aliases
+
+
+def _order_tables(sql, aliases):
+    match = ORDER_RE.search(sql)
+    if not match:
+        return []
+    return [aliases.get(alias, alias) for alias, _column in ORDER_COLUMN_RE.findall(match.group(1))]
+
+
+# plans
+def explain(sql):
+    """Return ``(plan lines, problems)``; a problem is ``(kind, table)``."""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+            return _sqlite_problems(sql, [row[-1] for row in cursor.fetchall()])
+        if connection.vendor == 'postgresql':
+            cursor.execute(f"EXPLAIN (ANALYZE, FORMAT JSON) {sql}")
+            plan = cursor.fetchone()[0]
+            plan = json.loads(plan) if isinstance(plan, str) else plan
+            return _postgres_problems(sql, plan[0]['Plan'])
+    raise NotImplementedError(f"No plan auditing for {connection.vendor}.")
+
+
+def _sqlite_problems(sql, lines):
+    aliases = _aliases(sql)
+    problems = []
+    for line in lines:
+        scan = SQLITE_SCAN_RE.match(line)
+        if scan and scan.group(1) in aliases and SQLITE_COVERING not in line:
+            problems.append(('full scan', aliases[scan.group(1)]))
+        elif line.startswith(SQLITE_TEMP_SORT):
+            problems += [('sort', table) for table in dict.fromkeys(_order_tables(sql, aliases))]
+    return lines, problems
+
+
+def _postgres_problems(sql, node, depth=0):
+    aliases = _aliases(sql)
+    label = node['Node Type']
+    if 'Relation Name' in node:
+        label += f" on {node['Relation Name']}"
+    lines = [f"{'  ' * depth}{label} (rows={node.get('Actual Rows')}, ms={node.get('Actual Total Time')})"]
+    problems = []
+    if node['Node Type'] == 'Seq Scan':
+        problems.append(('full scan', node['Relation Name']))
+    elif node['Node Type'] == 'Sort':
+        problems += [('sort', table) for table in dict.fromkeys(_order_tables(sql, aliases))]
+    for child in node.get('Plans', []):
+        child_lines, child_problems = _postgres_problems(sql, child, depth + 1)
+        lines += child_lines
+        problems += child_problems
+    return lines, problems
+
+
+# proposals
+def _model_for_table(table):
+    for model in apps.get_models():
+        if model._meta.db_table == table:
+            return model
+    return None
+
+
+def _existing_indexes(table):
+    with connection.cursor() as cursor:
+        constraints = connection.introspection.get_constraints(cursor, table)
+    return [c['columns'] for c in constraints.values() if (c['index'] or c['unique']) and c['columns']]
+
+
+def propose_index(sql, table):
+    """Return ``(model, field names)`` for an index that serves ``sql`` on ``table``, or None."""
+    aliases = _aliases(sql)
+    where = ORDER_RE.split(sql)[0]
+    equality = [column for alias, column in EQUALITY_RE.findall(where) if aliases.get(alias) == table]
+    ranges = [column for alias, column in RANGE_RE.findall(where) if aliases.get(alias) == table]
+    match = ORDER_RE.search(sql)
+    ordering = [column for alias, column in ORDER_COLUMN_RE.findall(match.group(1))
+                if aliases.get(alias) == table] if match else []
+
+    columns = list(dict.fromkeys(equality + (ordering or ranges[:1])))
+    if not columns or 'id' in equality:
+        # nothing to narrow down, or already a primary key lookup
+        return None
+    if any(existing[:len(columns)] == columns for existing in _existing_indexes(table)):
+        return None
+
+    model = _model_for_table(table)
+    if model is None:
+        return None
+    by_column = {field.column: field.name for field in model._meta.concrete_fields}
+    return model, [by_column.get(column, column) for column in columns]
+
+
+def index_name(model, fields):
+    """A Django-valid (<= 30 chars) name for a proposed index."""
+    return f"{model._meta.model_name[:8]}_{'_'.join(fields)}"[:26] + '_idx'
@@ -0,0 +1,79 @@
+"""
+Read models for the recipe card grids (recipe list and favorites).
+
+A card shows a handful of a recipe's columns. Instead of full ``Recipe``
+instances (every field, the description text, ``_state``, the related
+category object, and for favorites the ``FavoriteRecipe`` around it), the
+cards are built from ``values_list`` rows holding exactly those columns,
+category name joined in, into ``__slots__`` dataclasses whose display
+strings are made once when the card is built. Time strings come from
+``time_display``, shared between all cards with the same time.
+
+``recipe_cards`` and ``favorite_cards`` return lists of ``RecipeCard``;
+``with_ingredients`` adds the ingredient lines of the list page's modal
+with one more query.
+"""
+from dataclasses import dataclass
+
+from .models import FavoriteRecipe, Ingredient, Recipe, time_display
+
+UNCATEGORIZED = 'Uncategorized'
+CARD_FIELDS = ['pk', 'title', 'slug', 'owner', 'image', 'category__name', 'spice_level',
+               'prep_time', 'prep_time_unit', 'cook_time', 'cook_time_unit']
+
+_image_url = Recipe._meta.get_field('image').storage.url
+
+
+@dataclass(slots=True)
+class IngredientLine:
+    name: str
+    quantity: str
+
+
+@dataclass(slots=True)
+class RecipeCard:
+    pk: int
+    title: str
+    slug: str
+    owner_id: int | None
+    image_url: str | None
+    category: str
+    spice_level: int
+    prep: str
+    cook: str
+    is_fav: bool = False
+    ingredients: list = None
+
+    @classmethod
+    def from_row(cls, pk, title, slug, owner_id, image, category, spice_level, prep_time, prep_unit, cook_time,
+                 cook_unit, is_fav=False):
+        return cls(pk, title, slug, owner_id, _image_url(image) if image else None, category or UNCATEGORIZED,
+                   spice_level, time_display(prep_time, prep_unit), time_display(cook_time, cook_unit), is_fav)
+
+
+def recipe_cards(recipes, with_ingredients=False):
+    """Cards for a ``Recipe`` queryset, in its order; ``is_fav`` is read when annotated (``with_is_fav``)."""
+    fields = CARD_FIELDS + ['is_fav'] if 'is_fav' in recipes.query.annotations else CARD_FIELDS
+    cards = [RecipeCard.from_row(*row) for row in recipes.values_list(*fields)]
+    if with_ingredients:
+        add_ingredients(cards, recipes)
+    return cards
+
+
+def favorite_cards(user):
+    """Cards of ``user``'s favorites in the order they were added."""
+    favorites = FavoriteRecipe.objects.filter(user=user).order_by('pk')
+    rows = favorites.values_list(*(f"recipe__{field}" for field in CARD_FIELDS))
+    return [RecipeCard.from_row(*row, is_fav=True) for row in rows]
+
+
+def add_ingredients(cards, recipes):
+    """Fill ``card.ingredients`` of the cards of ``recipes`` with one query."""
+    lines = {card.pk: [] for card in cards}
+    # the recipes as a subquery, not thousands of ids as parameters; in the order of the
+    # recipe index (recipe_id, then the rowid), so the database does not sort them
+    ingredients = Ingredient.objects.filter(recipe__in=recipes.values('pk')).order_by('recipe_id', 'pk')
+    for recipe_id, name, quantity in ingredients.values_list('recipe_id', 'name', 'quantity'):
+        lines[recipe_id].append(IngredientLine(name, quantity))
+    for card in cards:
+        card.ingredients = lines[card.pk]
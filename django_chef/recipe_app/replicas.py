@@ -0,0 +1,145 @@
+"""
+Read replica routing.
+
+``PrimaryReplicaRouter`` sends writes to the primary (``default``) and reads
+to a random alias from ``DATABASE_REPLICAS``. Replicas lag behind the
+primary, so reads go to the primary instead when:
+
+* the request is not a safe method (read-modify-write must see the primary),
+* something was written earlier in the same request/thread,
+* the user wrote within the last ``REPLICA_PIN_SECONDS`` (a cookie set by
+  ``ReplicaPinMiddleware``), so they always read their own writes,
+* a transaction is open on the primary, or the model is primary-only.
+
+``ReplicationLagSimulator`` copies the primary SQLite file into the replica
+files a fixed delay late, for trying this out locally.
+"""
+import random
+import sqlite3
+import threading
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PIN_COOKIE = 'pin_primary'
+
+_pinned = ContextVar('replica_pinned', default=False)
+_wrote = ContextVar('replica_wrote', default=False)
+
+
+def replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+def pin_seconds():
+    return getattr(settings, 'REPLICA_PIN_SECONDS', 5)
+
+
+class PrimaryReplicaRouter:
+    """Writes to the primary, reads to a replica unless pinned to the primary."""
+    def db_for_read(self, model, **hints):
+        aliases = replicas()
+        if (not aliases or _pinned.get() or _wrote.get()
+                or model._meta.label_lower in getattr(settings, 'PRIMARY_ONLY_MODELS', [])
+                or connections[DEFAULT_DB_ALIAS].in_atomic_block):
+            return DEFAULT_DB_ALIAS
+        return random.choice(aliases)
+
+    def db_for_write(self, model, **hints):
+        _wrote.set(True)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # replicas are copies of the primary, never migrated on their own
+        return db not in replicas()
+
+
+class ReplicaPinMiddleware:
+    """Pin a user's reads to the primary for a while after they write."""
+    def __init__(self, get_response):
+        if not replicas():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            pinned_until = float(request.COOKIES.get(PIN_COOKIE, 0))
+        except ValueError:
+            pinned_until = 0
+        pinned = pinned_until > time.time() or request.method not in ('GET', 'HEAD', 'OPTIONS')
+        pinned_token = _pinned.set(pinned)
+        wrote_token = _wrote.set(False)
+        try:
+            response = self.get_response(request)
+            if _wrote.get() and pin_seconds():
+                response.set_cookie(PIN_COOKIE, f"{time.time() + pin_seconds():.0f}",
+                                    max_age=pin_seconds(), httponly=True, samesite='Lax')
+            return response
+        finally:
+            _pinned.reset(pinned_token)
+            _wrote.reset(wrote_token)
+
+
+# local replication
+def _sqlite_path(alias):
+    database = settings.DATABASES[alias]
+    if database['ENGINE'] != 'django.db.backends.sqlite3':
+        raise ValueError(f"Database {alias!r} is not SQLite.")
+    return str(database['NAME'])
+
+
+def snapshot_primary():
+    """Return an in-memory SQLite copy of the primary database."""
+    source = sqlite3.connect(_sqlite_path(DEFAULT_DB_ALIAS))
+    copy = sqlite3.connect(':memory:', check_same_thread=False)
+    source.backup(copy)
+    source.close()
+    return copy
+
+
+def apply_snapshot(copy, aliases=None):
+    """Overwrite the replica files with ``copy`` (from ``snapshot_primary``)."""
+    for alias in replicas() if aliases is None else aliases:
+        target = sqlite3.connect(_sqlite_path(alias), timeout=30)
+        copy.backup(target)
+        target.close()
+
+
+def sync_replicas(aliases=None):
+    """Bring the replica files up to date with the primary right now."""
+    copy = snapshot_primary()
+    apply_snapshot(copy, aliases)
+    copy.close()
+
+
+class ReplicationLagSimulator(threading.Thread):
+    """Replicate the primary SQLite file to the replicas ``lag`` seconds late.
+
+    Every ``lag`` seconds the replicas receive the snapshot taken at the
+    previous tick, so they are always between ``lag`` and ``2 * lag``
+    seconds behind.
+    """
+    def __init__(self, lag=1.0, aliases=None):
+        super().__init__(daemon=True)
+        self.lag = lag
+        self.aliases = aliases
+        self.stopped = threading.Event()
+
+    def run(self):
+        copy = snapshot_primary()
+        while not self.stopped.wait(self.lag):
+            apply_snapshot(copy, self.aliases)
+            copy.close()
+            copy = snapshot_primary()
+        copy.close()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
@@ -0,0 +1,229 @@
+"""
+Synthetic data for performance testing (``manage.py seed_chef``).
+
+Every chunk of rows is generated from its own ``random.Random`` seeded with
+``(seed, kind, chunk number)``, so the output only depends on the seed and
+the target size, never on how many processes generated it. Generators return
+plain tuples in the column order of ``COLUMNS`` so they are cheap to send
+between processes and can be inserted with a single ``executemany``.
+
+Shape of the data, per user on average: 20 recipes, each with 3-14
+ingredients and 2-9 steps, and 8 favorites. Ingredient names follow a Zipf
+distribution (a few staples like salt and onion appear everywhere, most
+names are rare), recipe ownership and favorites are skewed towards a few
+prolific users and popular recipes.
+"""
+import random
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+from django.db import DEFAULT_DB_ALIAS, connection
+from django.db.backends.signals import connection_created
+from django.utils.text import slugify
+
+from .step_order import STEP_GAP
+
+RECIPES_PER_USER = 20
+INGREDIENTS_PER_RECIPE = (3, 14)
+STEPS_PER_RECIPE = (2, 9)
+FAVORITES_PER_USER = 8
+ROWS_PER_USER = (1 + RECIPES_PER_USER * (1 + sum(INGREDIENTS_PER_RECIPE) / 2 + sum(STEPS_PER_RECIPE) / 2)
+                 + FAVORITES_PER_USER)
+ZIPF_EXPONENT = 1.07
+# recipes (or users, for favorites) generated per job
+CHUNK_SIZE = 1000
+
+CATEGORIES = [
+    'Breakfast', 'Brunch', 'Lunch', 'Dinner', 'Dessert', 'Snack', 'Appetizer', 'Soup', 'Salad',
+    'Side Dish', 'Bread', 'Baking', 'Drinks', 'Sauces', 'Vegetarian', 'Vegan', 'Seafood', 'Grill',
+    'Slow Cooker', 'Holiday',
+]
+MEASURES = [
+    'tsp', 'tbsp', 'cup', 'ml', 'l', 'g', 'kg', 'oz', 'lb', 'pinch', 'dash', 'clove', 'slice',
+    'can', 'piece', 'bunch', 'sprig', 'stick',
+]
+BASE_INGREDIENTS = [
+    'salt', 'black pepper', 'olive oil', 'onion', 'garlic', 'butter', 'sugar', 'flour', 'egg',
+    'milk', 'water', 'tomato', 'lemon', 'carrot', 'celery', 'potato', 'rice', 'chicken breast',
+    'chicken thigh', 'ground beef', 'pork shoulder', 'bacon', 'salmon', 'shrimp', 'tofu', 'cheddar',
+    'parmesan', 'mozzarella', 'cream', 'yogurt', 'honey', 'soy sauce', 'vinegar', 'mustard',
+    'paprika', 'cumin', 'coriander', 'turmeric', 'cinnamon', 'nutmeg', 'ginger', 'chili flakes',
+    'basil', 'parsley', 'cilantro', 'thyme', 'rosemary', 'oregano', 'bay leaf', 'spinach',
+    'kale', 'broccoli', 'zucchini', 'bell pepper', 'mushroom', 'corn', 'peas', 'black beans',
+    'chickpeas', 'lentils', 'pasta', 'noodles', 'bread crumbs', 'baking powder', 'baking soda',
+    'vanilla extract', 'cocoa powder', 'chocolate', 'walnuts', 'almonds', 'peanut butter',
+    'coconut milk', 'stock', 'white wine', 'red wine', 'maple syrup', 'apple', 'banana',
+    'strawberries', 'blueberries', 'avocado', 'lime', 'scallion', 'shallot', 'leek', 'cabbage',
+    'cauliflower', 'sweet potato', 'pumpkin', 'quinoa', 'oats', 'feta', 'ricotta', 'sesame oil',
+    'fish sauce', 'miso', 'tahini', 'capers', 'olives', 'anchovies', 'saffron', 'cardamom',
+]
+MAINS = BASE_INGREDIENTS[11:]
+MODIFIERS = ['', 'fresh', 'chopped', 'dried', 'ground', 'smoked', 'organic', 'minced', 'sliced', 'frozen']
+ADJECTIVES = [
+    'Classic', 'Spicy', 'Smoky', 'Creamy', 'Crispy', 'Easy', 'Rustic', 'Quick', 'Hearty', 'Zesty',
+    "Grandma's", 'One-Pot', 'Sheet-Pan', 'Garlicky', 'Honey', 'Lemon', 'Herbed', 'Roasted',
+]
+DISHES = [
+    'Curry', 'Stew', 'Soup', 'Salad', 'Pasta', 'Tacos', 'Stir Fry', 'Casserole', 'Pie', 'Risotto',
+    'Bowl', 'Sandwich', 'Skewers', 'Bake', 'Noodles', 'Pancakes', 'Muffins', 'Cake', 'Chili', 'Burger',
+]
+VERBS = ['Chop', 'Dice', 'Whisk', 'Stir', 'Simmer', 'Roast', 'Fold in', 'Season', 'Saute', 'Bake', 'Blend', 'Toss']
+MANNERS = [
+    'until golden', 'for 5 minutes', 'over medium heat', 'until soft', 'gently', 'until fragrant',
+    'for 20 minutes', 'until combined', 'and set aside', 'until bubbling',
+]
+OCCASIONS = ['weeknight', 'family', 'party', 'comforting', 'light', 'weekend', 'holiday']
+TIME_UNITS = ['min'] * 8 + ['hr'] * 2
+
+COLUMNS = {
+    'user': ['id', 'username', 'email', 'first_name', 'joined_at'],
+    'recipe': ['id', 'title', 'slug', 'description', 'prep_time', 'prep_time_unit', 'cook_time',
+               'cook_time_unit', 'spice_level', 'category_id', 'image', 'owner_id', 'is_public',
+               'updated_at'],
+    'ingredient': ['recipe_id', 'name', 'quantity', 'measure_id'],
+    'step': ['recipe_id', 'step_number', 'step'],
+    'favorite': ['user_id', 'recipe_id', 'added_on'],
+}
+
+EPOCH = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def plan(rows):
+    """Return ``(users, recipes)`` for roughly ``rows`` rows in total."""
+    users = max(1, round(rows / ROWS_PER_USER))
+    return users, users * RECIPES_PER_USER
+
+
+def _rng(seed, kind, chunk):
+    return random.Random(f"{seed}:{kind}:{chunk}")
+
+
+_vocabulary = {}
+
+
+def ingredient_vocabulary(seed):
+    """Ingredient names ranked by popularity and their Zipf cumulative weights."""
+    if seed not in _vocabulary:
+        names = [f"{modifier} {name}".strip() for name in BASE_INGREDIENTS for modifier in MODIFIERS]
+        # staples first, then the rest in a seed-dependent order
+        rng = _rng(seed, 'vocabulary', 0)
+        rest = names[len(BASE_INGREDIENTS):]
+        rng.shuffle(rest)
+        ranked = BASE_INGREDIENTS + [name for name in rest if name not in BASE_INGREDIENTS]
+        total, cum_weights = 0.0, []
+        for rank in range(1, len(ranked) + 1):
+            total += 1 / rank ** ZIPF_EXPONENT
+            cum_weights.append(total)
+        _vocabulary[seed] = (ranked, cum_weights)
+    return _vocabulary[seed]
+
+
+def _skewed(rng, n, power):
+    """An index in ``range(n)`` favoring small indexes, more so for a higher ``power``."""
+    return int(n * rng.random() ** power)
+
+
+def _moment(rng):
+    return EPOCH + timedelta(seconds=rng.randrange(60 * 60 * 24 * 365))
+
+
+# chunk generators
+def users_chunk(seed, chunk, start, count, first_id):
+    rng = _rng(seed, 'user', chunk)
+    rows = []
+    for i in range(start, start + count):
+        pk = first_id + i
+        rows.append((pk, f"chef_{pk}", f"chef_{pk}@example.com", rng.choice(ADJECTIVES), _moment(rng)))
+    return rows
+
+
+def recipes_chunk(seed, chunk, start, count, first_recipe_id, first_user_id, users, category_ids, measure_ids):
+    """Return ``{kind: rows}`` for recipes ``start``..``start + count`` and their children."""
+    rng = _rng(seed, 'recipe', chunk)
+    adapt = connection.ops.adapt_datetimefield_value
+    names, cum_weights = ingredient_vocabulary(seed)
+    recipes, ingredients, steps = [], [], []
+    for i in range(start, start + count):
+        pk = first_recipe_id + i
+        # staples (salt, oil, water...) are in everything but never the star of a dish
+        main = rng.choice(MAINS)
+        dish = rng.choice(DISHES)
+        title = f"{rng.choice(ADJECTIVES)} {main.title()} {dish}"
+        recipes.append((
+            pk, title, slugify(title), f"A {rng.choice(OCCASIONS)} {dish.lower()} built around {main}.",
+            rng.randint(5, 60), 'min', rng.randint(1, 12), rng.choice(TIME_UNITS), rng.randrange(6),
+            rng.choice(category_ids), '', first_user_id + _skewed(rng, users, 2), rng.random() < 0.1,
+            adapt(_moment(rng)),
+        ))
+        for name in rng.choices(names, cum_weights=cum_weights, k=rng.randint(*INGREDIENTS_PER_RECIPE)):
+            ingredients.append((pk, name, str(rng.randint(1, 8)), rng.choice(measure_ids)))
+        for number in range(1, rng.randint(*STEPS_PER_RECIPE) + 1):
+            ingredient = rng.choices(names, cum_weights=cum_weights)[0]
+            steps.append((pk, number * STEP_GAP, f"{rng.choice(VERBS)} the {ingredient} {rng.choice(MANNERS)}."))
+    return {'recipe': recipes, 'ingredient': ingredients, 'step': steps}
+
+
+def favorites_chunk(seed, chunk, start, count, first_user_id, first_recipe_id, recipes):
+    rng = _rng(seed, 'favorite', chunk)
+    # raw inserts need the value the backend would store
+    adapt = connection.ops.adapt_datetimefield_value
+    rows = []
+    for i in range(start, start + count):
+        picked = {_skewed(rng, recipes, 3) for _ in range(rng.randint(0, FAVORITES_PER_USER * 2))}
+        rows += [(first_user_id + i, first_recipe_id + r, adapt(_moment(rng))) for r in sorted(picked)]
+    return rows
+
+
+# loading
+def insert_rows(model, columns, rows):
+    """Insert ``rows`` (tuples in ``columns`` order) with one ``executemany``."""
+    if not rows:
+        return
+    quote = connection.ops.quote_name
+    sql = (f"INSERT INTO {quote(model._meta.db_table)} ({', '.join(quote(c) for c in columns)}) "
+           f"VALUES ({', '.join(['%s'] * len(columns))})")
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, rows)
+
+
+# durability traded for speed while loading
+LOADING_PRAGMAS = [
+    "PRAGMA journal_mode = MEMORY",
+    "PRAGMA synchronous = OFF",
+    "PRAGMA cache_size = -262144",
+    "PRAGMA temp_store = MEMORY",
+]
+
+
+def _set_loading_pragmas(sender, connection, **kwargs):
+    if connection.vendor == 'sqlite' and connection.alias == DEFAULT_DB_ALIAS:
+        with connection.cursor() as cursor:
+            for pragma in LOADING_PRAGMAS:
+                cursor.execute(pragma)
+
+
+@contextmanager
+def loading_pragmas():
+    """Trade durability for speed on SQLite while loading; restored afterwards.
+
+    The pragmas are per connection: every connection opened meanwhile (after
+    ``connections.close_all()`` before forking, or in a forked process) gets
+    them too.
+    """
+    if connection.vendor != 'sqlite':
+        yield
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("PRAGMA journal_mode")
+        journal_mode = cursor.fetchone()[0]
+        cursor.execute("PRAGMA synchronous")
+        synchronous = cursor.fetchone()[0]
+    _set_loading_pragmas(None, connection)
+    connection_created.connect(_set_loading_pragmas)
+    try:
+        yield
+    finally:
+        connection_created.disconnect(_set_loading_pragmas)
+        with connection.cursor() as cursor:
+            cursor.execute(f"PRAGMA journal_mode = {journal_mode}")
+            cursor.execute(f"PRAGMA synchronous = {synchronous}")
@@ -0,0 +1,127 @@
+from django.db.models.signals import post_save, post_delete, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import archive, dashboard
+from .models import CustomUser, FavoriteRecipe, Recipe, Ingredient, Step, UserStats
+from .export import rendition_name
+from .pantry import recipe_changed
+from .public_cache import purge_tags, recipe_tag
+from .tasks import delete_stored_file
+from .versioning import version_images
+
+
+# purge cached public pages whenever a recipe or one of its children changes
+@receiver([post_save, post_delete], sender=Recipe)
+def purge_public_recipe(sender, instance, **kwargs):
+    purge_tags(recipe_tag(instance.pk))
+
+
+@receiver([post_save, post_delete], sender=Ingredient)
+@receiver([post_save, post_delete], sender=Step)
+def purge_public_recipe_child(sender, instance, **kwargs):
+    if archive.is_moving():
+        # public recipes are never archived
+        return
+    purge_tags(recipe_tag(instance.recipe_id))
+
+
+# child edits count as recipe edits for the offline snapshot deltas
+@receiver([post_save, post_delete], sender=Ingredient)
+@receiver([post_save, post_delete], sender=Step)
+def touch_recipe(sender, instance, origin=None, **kwargs):
+    if isinstance(origin, Recipe) or archive.is_moving():
+        # deleted along with its recipe
+        return
+    Recipe.objects.filter(pk=instance.recipe_id).update(updated_at=timezone.now())
+
+
+# the pantry index logs a recipe's ingredients and visibility once the change commits
+@receiver([post_save, post_delete], sender=Ingredient)
+def reindex_recipe_ingredients(sender, instance, origin=None, **kwargs):
+    if isinstance(origin, Recipe) or archive.is_moving():
+        # deleted along with its recipe, which logs its removal
+        return
+    recipe_changed(instance.recipe_id)
+
+
+@receiver([post_save, post_delete], sender=Recipe)
+def reindex_recipe(sender, instance, **kwargs):
+    recipe_changed(instance.pk)
+
+
+# uploaded images, the recipe's and its versions', are removed by a background task
+# once their recipe is gone (an archived recipe keeps them, see archive.py)
+@receiver(pre_delete, sender=Recipe)
+def remember_recipe_images(sender, instance, **kwargs):
+    # the versions are deleted before the recipe
+    instance._images = set() if archive.is_moving() else version_images(instance)
+
+
+@receiver(post_delete, sender=Recipe)
+def delete_recipe_images(sender, instance, **kwargs):
+    if archive.is_moving():
+        return
+    names = getattr(instance, '_images', set())
+    if instance.image:
+        names.add(instance.image.name)
+    for name in sorted(names):
+        delete_stored_file.enqueue(name)
+        delete_stored_file.enqueue(rendition_name(name))
+
+
+# dashboard statistics follow recipes and favorites by deltas (see dashboard.py)
+@receiver(post_save, sender=CustomUser)
+def create_user_stats(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        UserStats.objects.get_or_create(user=instance)
+
+
+@receiver(pre_save, sender=Recipe)
+def remember_recipe_stats(sender, instance, raw=False, **kwargs):
+    # what the recipe counted for before this save: nothing when it is inserted, else
+    # the values it was loaded with (or last saved with); read again only when missing
+    instance._stats_before = None
+    if raw or not instance.pk:
+        return
+    loaded = getattr(instance, '_loaded_values', {})
+    # an unsaved instance given a pk may still be an update of an existing row
+    if not instance._state.adding and all(field in loaded for field in dashboard.RECIPE_FIELDS):
+        instance._stats_before = {field: loaded[field] for field in dashboard.RECIPE_FIELDS}
+    else:
+        instance._stats_before = Recipe.objects.filter(pk=instance.pk).values(*dashboard.RECIPE_FIELDS).first()
+
+
+@receiver(post_save, sender=Recipe)
+def update_recipe_stats(sender, instance, raw=False, **kwargs):
+    if not raw:
+        after = dashboard.recipe_state(instance)
+        dashboard.recipe_changed(instance.pk, getattr(instance, '_stats_before', None), after)
+        # the next save of this instance starts from here
+        instance._loaded_values = {**getattr(instance, '_loaded_values', {}), **after}
+
+
+@receiver(post_delete, sender=Recipe)
+def remove_recipe_stats(sender, instance, origin=None, **kwargs):
+    if isinstance(origin, CustomUser) or archive.is_moving():
+        # deleted along with its owner, whose stats go too; archiving rebuilds the stats per batch
+        return
+    dashboard.recipe_changed(instance.pk, dashboard.recipe_state(instance), None)
+
+
+@receiver(post_save, sender=FavoriteRecipe)
+def add_favorite_stats(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        dashboard.favorite_changed(instance.user_id, 1)
+
+
+@receiver(post_delete, sender=FavoriteRecipe)
+def remove_favorite_stats(sender, instance, origin=None, **kwargs):
+    if not isinstance(origin, CustomUser) and not archive.is_moving():
+        dashboard.favorite_changed(instance.user_id, -1)
+
+
+# archived recipes are not in the hot tables the user's deletion cascades to
+@receiver(post_delete, sender=CustomUser)
+def delete_archived_recipes(sender, instance, **kwargs):
+    archive.forget_owner(instance.pk)
@@ -0,0 +1,291 @@
+"""
+Static asset build and serving.
+
+``BundledManifestStorage`` is the static build step, run through
+``collectstatic`` (or ``manage.py build_static``). It:
+
+1. concatenates ``STATIC_BUNDLES_CSS``/``STATIC_BUNDLES_JS`` into one CSS and
+   one JS file, dropping CSS rules whose classes appear in no template,
+2. lets ``ManifestStaticFilesStorage`` give every file a content hash,
+3. writes precompressed ``.gz`` (and ``.br`` when ``brotli`` is installed)
+   siblings next to each hashed file.
+
+``StaticAssetMiddleware`` serves the result from Python, picking the best
+precompressed sibling and marking hashed files as immutable.
+"""
+import gzip
+import mimetypes
+import re
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, staticfiles_storage
+from django.core.exceptions import MiddlewareNotUsed, SuspiciousFileOperation
+from django.core.files.base import ContentFile
+from django.http import FileResponse, Http404
+from django.template import engines
+from django.template.utils import get_app_template_dirs
+from django.utils._os import safe_join
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE = ('.css', '.js', '.svg', '.txt', '.json', '.html', '.map')
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+SOURCE_MAP_RE = re.compile(r"^[/*#\s]*[#@] sourceMappingURL=.*$", re.MULTILINE)
+
+
+# used classes
+CLASS_ATTR_RE = re.compile(r"""class\s*=\s*(?:"([^"]*)"|'([^']*)')""")
+PY_CLASS_RE = re.compile(r"""['"]class['"]\s*:\s*['"]([^'"]*)['"]""")
+JS_STRING_RE = re.compile(r"""["'`]([\w\- .]{2,80})["'`]""")
+TOKEN_RE = re.compile(r"[A-Za-z_-][\w-]*")
+
+
+def used_classes():
+    """Collect every class name the templates, forms/views and scripts can use."""
+    texts = []
+    template_dirs = [*engines['django'].engine.dirs, *get_app_template_dirs('templates')]
+    for directory in template_dirs:
+        texts += [path.read_text(encoding='utf-8') for path in Path(directory).rglob('*.html')]
+    app_dir = Path(__file__).resolve().parent
+    texts += [path.read_text(encoding='utf-8') for path in app_dir.glob('*.py')]
+
+    used = set(getattr(settings, 'STATIC_PURGE_SAFELIST', []))
+    for text in texts:
+        for match in CLASS_ATTR_RE.finditer(text):
+            used.update(TOKEN_RE.findall(match.group(1) or match.group(2)))
+        for match in PY_CLASS_RE.finditer(text):
+            used.update(TOKEN_RE.findall(match.group(1)))
+
+    # classes toggled at runtime by bootstrap/htmx/custom scripts
+    for name in getattr(settings, 'STATIC_BUNDLES_JS', []):
+        script = Path(finders.find(name)).read_text(encoding='utf-8')
+        for match in JS_STRING_RE.finditer(script):
+            used.update(TOKEN_RE.findall(match.group(1)))
+    return used
+
+
+# css purging
+SELECTOR_CLASS_RE = re.compile(r"\.(-?[A-Za-z_][\w-]*)")
+NOT_RE = re.compile(r":not\([^()]*\)")
+NESTED_AT_RULES = ('@media', '@supports', '@container', '@layer')
+WHITESPACE_RE = re.compile(r"\s+")
+PLAIN_RE = re.compile(r"[^\"'/]+|/")
+PUNCTUATION_RE = re.compile(r"\s*([;{},>])\s*")
+
+
+def _skip_string(css, i):
+    quote = css[i]
+    i += 1
+    while i < len(css) and css[i] != quote:
+        i += 2 if css[i] == '\\' else 1
+    return i + 1
+
+
+def _parse(css):
+    """Split CSS into ``(prelude, body)`` blocks and ``(statement, None)``."""
+    nodes = []
+    i, start, depth = 0, 0, 0
+    block_start = None
+    while i < len(css):
+        char = css[i]
+        if css.startswith('/*', i):
+            end = css.find('*/', i + 2)
+            end = len(css) if end == -1 else end + 2
+            if depth == 0 and css.startswith('/*!', i):
+                # keep license comments
+                nodes.append((css[i:end], None))
+            if depth == 0 and start == i:
+                start = end
+            i = end
+            continue
+        if char in '"\'':
+            i = _skip_string(css, i)
+            continue
+        if char == '{':
+            if depth == 0:
+                block_start = i
+            depth += 1
+        elif char == '}':
+            depth -= 1
+            if depth == 0:
+                nodes.append((css[start:block_start].strip(), css[block_start + 1:i]))
+                start = i + 1
+        elif char == ';' and depth == 0:
+            nodes.append((css[start:i + 1].strip(), None))
+            start = i + 1
+        i += 1
+    return nodes
+
+
+def _compact(text):
+    """Drop comments and collapse whitespace outside of strings."""
+    out = []
+    i = 0
+    while i < len(text):
+        if text.startswith('/*', i):
+            end = text.find('*/', i + 2)
+            i = len(text) if end == -1 else end + 2
+            continue
+        if text[i] in '"\'':
+            end = _skip_string(text, i)
+            out.append(text[i:end])
+            i = end
+            continue
+        match = PLAIN_RE.match(text, i)
+        out.append(WHITESPACE_RE.sub(' ', match.group()))
+        i = match.end()
+    return PUNCTUATION_RE.sub(r"\1", ''.join(out)).strip()
+
+
+def _selector_used(selector, used):
+    classes = SELECTOR_CLASS_RE.findall(NOT_RE.sub('', selector))
+    return all(name in used for name in classes)
+
+
+def purge_css(css, used):
+    """Return minified ``css`` without rules that only match unused classes."""
+    out = []
+    for prelude, body in _parse(css):
+        if body is None:
+            out.append(prelude if prelude.startswith('/*!') else _compact(prelude))
+        elif prelude.startswith(NESTED_AT_RULES):
+            inner = purge_css(body, used)
+            if inner:
+                out.append(f"{_compact(prelude)}{{{inner}}}")
+        elif prelude.startswith('@'):
+            # @font-face, @keyframes, ... are kept whole
+            out.append(f"{_compact(prelude)}{{{_compact(body)}}}")
+        else:
+            selectors = [s for s in _compact(prelude).split(',') if _selector_used(s, used)]
+            if selectors:
+                out.append(f"{','.join(selectors)}{{{_compact(body)}}}")
+    return '\n'.join(out)
+
+
+# build
+def build_bundles():
+    """Return ``{bundle name: content}`` for the configured CSS and JS bundles."""
+    bundles = {}
+    css_files = getattr(settings, 'STATIC_BUNDLES_CSS', [])
+    if css_files:
+        used = used_classes()
+        css = '\n'.join(
+            # the bundle keeps one @charset at most, browsers ignore later ones
+            SOURCE_MAP_RE.sub('', Path(finders.find(name)).read_text(encoding='utf-8')).replace('@charset "UTF-8";', '')
+            for name in css_files
+        )
+        bundles[settings.STATIC_BUNDLE_CSS_NAME] = purge_css(css, used)
+
+    js_files = getattr(settings, 'STATIC_BUNDLES_JS', [])
+    if js_files:
+        bundles[settings.STATIC_BUNDLE_JS_NAME] = ';\n'.join(
+            SOURCE_MAP_RE.sub('', Path(finders.find(name)).read_text(encoding='utf-8')).strip()
+            for name in js_files
+        )
+    return bundles
+
+
+def compress_file(path):
+    """Write ``.gz``/``.br`` siblings of ``path``; return the sizes written."""
+    data = path.read_bytes()
+    sizes = {}
+    gz = gzip.compress(data, compresslevel=9, mtime=0)
+    if len(gz) < len(data):
+        Path(f"{path}.gz").write_bytes(gz)
+        sizes['gzip'] = len(gz)
+    if brotli is not None:
+        br = brotli.compress(data, quality=11)
+        if len(br) < len(data):
+            Path(f"{path}.br").write_bytes(br)
+            sizes['br'] = len(br)
+    return sizes
+
+
+class BundledManifestStorage(ManifestStaticFilesStorage):
+    """Manifest storage that also builds bundles and precompressed siblings."""
+    # the third-party css/js reference source maps that are not shipped
+    manifest_strict = False
+
+    def url_converter(self, name, hashed_files, template=None):
+        converter = super().url_converter(name, hashed_files, template)
+
+        def convert(matchobj):
+            if 'sourceMappingURL' in matchobj.group('matched'):
+                return ''
+            return converter(matchobj)
+
+        return convert
+
+    def post_process(self, paths, dry_run=False, **options):
+        if not dry_run:
+            for name, content in build_bundles().items():
+                if self.exists(name):
+                    self.delete(name)
+                self._save(name, ContentFile(content.encode('utf-8')))
+                paths[name] = (self, name)
+
+        hashed = []
+        for name, hashed_name, processed in super().post_process(paths, dry_run, **options):
+            if hashed_name and not isinstance(processed, Exception):
+                hashed.append(hashed_name)
+            yield name, hashed_name, processed
+
+        if not dry_run:
+            for hashed_name in hashed:
+                if hashed_name.endswith(COMPRESSIBLE):
+                    compress_file(Path(self.path(hashed_name)))
+
+
+# serving
+class StaticAssetMiddleware:
+    """Serve STATIC_ROOT from Python when ``STATIC_ASSETS_SERVE`` is on.
+
+    Precompressed ``.br``/``.gz`` siblings are used when the client accepts
+    them, and files with a content hash get a one year immutable lifetime.
+    """
+    def __init__(self, get_response):
+        if not getattr(settings, 'STATIC_ASSETS_SERVE', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.prefix = '/' + settings.STATIC_URL.lstrip('/')
+        self.hashed = None
+
+    def __call__(self, request):
+        if not request.path.startswith(self.prefix) or request.method not in ('GET', 'HEAD'):
+            return self.get_response(request)
+        return self.serve(request, request.path[len(self.prefix):])
+
+    def is_hashed(self, name):
+        if self.hashed is None:
+            self.hashed = set(getattr(staticfiles_storage, 'hashed_files', {}).values())
+        return name in self.hashed
+
+    def serve(self, request, name):
+        try:
+            path = Path(safe_join(settings.STATIC_ROOT, name))
+        except SuspiciousFileOperation:
+            # outside of STATIC_ROOT
+            raise Http404(name)
+        if not path.is_file():
+            raise Http404(name)
+
+        accepted = request.headers.get('Accept-Encoding', '')
+        encoding = None
+        for coding, suffix in (('br', '.br'), ('gzip', '.gz')):
+            if coding in accepted and Path(f"{path}{suffix}").is_file():
+                encoding, path = coding, Path(f"{path}{suffix}")
+                break
+
+        content_type, _ = mimetypes.guess_type(name)
+        response = FileResponse(path.open('rb'), content_type=content_type or 'application/octet-stream')
+        if encoding:
+            response['Content-Encoding'] = encoding
+        response['Vary'] = 'Accept-Encoding'
+        response['Cache-Control'] = IMMUTABLE if self.is_hashed(name) else 'public, max-age=60'
+        return response
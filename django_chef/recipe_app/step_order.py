@@ -0,0 +1,158 @@
+"""
+Step order with gap keys.
+
+``Step.step_number`` is an ordering key, not the number shown: steps are
+shown numbered 1, 2, 3... in key order, and keys are spaced ``STEP_GAP``
+apart so that a step can be put between two others by giving it a key in
+the gap. Adding or moving one step writes that one row; a key is unique per
+recipe (``unique_recipe_step_number``).
+
+* ``insert_key`` is the key of a new step at a position,
+* ``reorder`` applies a full new order (the drag-and-drop list) with one
+  ``bulk_update``: the longest run of steps already in the right order keeps
+  its keys and only the others get keys in the gaps around them,
+* ``compact`` spreads a recipe's keys out again, ``crowded_recipes`` finds
+  the recipes that need it (``manage.py compact_steps``).
+
+SQLite and PostgreSQL check the unique constraint row by row inside an
+UPDATE, so no new key is ever one that a step of the recipe holds already.
+"""
+from bisect import bisect_left
+
+from django.db import transaction
+from django.db.models import F, Window
+from django.db.models.functions import Lag
+from django.utils import timezone
+
+from .models import Recipe, Step
+from .public_cache import purge_tags, recipe_tag
+
+STEP_GAP = 1024
+# recipes with two keys closer than this are compacted
+STEP_MIN_GAP = 8
+
+
+def _keys(recipe):
+    """``[(pk, key), ...]`` of the recipe's steps in order, with the recipe row locked."""
+    Recipe.objects.select_for_update().filter(pk=recipe.pk).exists()
+    return list(Step.objects.filter(recipe=recipe).order_by('step_number').values_list('pk', 'step_number'))
+
+
+def _changed(recipe):
+    # bulk_update sends no signals: do what signals.py does for a saved step
+    Recipe.objects.filter(pk=recipe.pk).update(updated_at=timezone.now())
+    purge_tags(recipe_tag(recipe.pk))
+
+
+def _lattice(count, used):
+    """``count`` keys ``STEP_GAP`` apart, shifted off every key in ``used``."""
+    taken = {key % STEP_GAP for key in used if STEP_GAP <= key < (count + 1) * STEP_GAP}
+    offset = next(offset for offset in range(STEP_GAP) if offset not in taken)
+    return [(number + 1) * STEP_GAP + offset for number in range(count)]
+
+
+def _between(low, high, count, used):
+    """``count`` increasing keys strictly between ``low`` and ``high`` (None: no bound), or None."""
+    if high is None:
+        keys, key = [], low
+        while len(keys) < count:
+            key += STEP_GAP
+            if key not in used:
+                keys.append(key)
+        return keys
+    spacing = (high - low) // (count + 1)
+    keys = [low + spacing * number for number in range(1, count + 1)]
+    if spacing < 1 or used.intersection(keys):
+        return None
+    return keys
+
+
+def _kept(keys):
+    """Indexes of a longest increasing run in ``keys``."""
+    tails, tail_index, previous = [], [], [None] * len(keys)
+    for index, key in enumerate(keys):
+        at = bisect_left(tails, key)
+        previous[index] = tail_index[at - 1] if at else None
+        tails[at:at + 1] = [key]
+        tail_index[at:at + 1] = [index]
+    kept, index = set(), tail_index[-1] if tail_index else None
+    while index is not None:
+        kept.add(index)
+        index = previous[index]
+    return kept
+
+
+def _new_keys(order, keys):
+    """New key per step pk for ``order``, only for the steps whose key changes."""
+    current = [keys[pk] for pk in order]
+    used = set(current)
+    kept = _kept(current)
+    new, moved, low = {}, [], 0
+    for index, pk in enumerate(order + [None]):
+        if pk is not None and index not in kept:
+            moved.append(pk)
+            continue
+        high = keys[pk] if pk is not None else None
+        if moved:
+            gap_keys = _between(low, high, len(moved), used)
+            if gap_keys is None:
+                # no room left in this gap: renumber the whole recipe
+                return {pk: key for pk, key in zip(order, _lattice(len(order), used)) if key != keys[pk]}
+            new.update(zip(moved, gap_keys))
+            moved = []
+        low = high
+    return new
+
+
+def _apply(recipe, new):
+    if new:
+        Step.objects.bulk_update([Step(pk=pk, step_number=key) for pk, key in new.items()], ['step_number'])
+        _changed(recipe)
+    return len(new)
+
+
+def insert_key(recipe, position=None):
+    """Key for a new step at ``position`` (1 is first, None or past the end: last).
+
+    Call inside the transaction that saves the step: the recipe row stays
+    locked until then. A full gap is compacted first.
+    """
+    keys = [key for _pk, key in _keys(recipe)]
+    index = len(keys) if position is None else min(max(position, 1) - 1, len(keys))
+    low = keys[index - 1] if index else 0
+    high = keys[index] if index < len(keys) else None
+    if high is None:
+        return low + STEP_GAP
+    if high - low < 2:
+        compact(recipe)
+        return insert_key(recipe, position)
+    return (low + high) // 2
+
+
+def reorder(recipe, order):
+    """Put the recipe's steps in ``order`` (step pks); returns how many keys changed.
+
+    Raises ``ValueError`` unless ``order`` holds each of the recipe's steps once.
+    """
+    with transaction.atomic():
+        keys = dict(_keys(recipe))
+        if len(order) != len(keys) or set(order) != set(keys):
+            raise ValueError("The order must list every step of the recipe once.")
+        return _apply(recipe, _new_keys(list(order), keys))
+
+
+def compact(recipe):
+    """Spread the recipe's keys ``STEP_GAP`` apart again; returns how many changed."""
+    with transaction.atomic():
+        steps = _keys(recipe)
+        used = {key for _pk, key in steps}
+        new = {pk: key for (pk, old), key in zip(steps, _lattice(len(steps), used)) if key != old}
+        return _apply(recipe, new)
+
+
+def crowded_recipes():
+    """Ids of the recipes with two keys less than ``STEP_MIN_GAP`` apart."""
+    gaps = Step.objects.annotate(
+        gap=F('step_number') - Window(Lag('step_number'), partition_by=F('recipe'), order_by=F('step_number').asc()),
+    )
+    return set(gaps.filter(gap__lt=STEP_MIN_GAP).values_list('recipe_id', flat=True))
@@ -0,0 +1,201 @@
+"""
+Database-backed background task queue.
+
+Decorate a function with ``@task`` and call ``.enqueue(...)`` on it from a
+view or signal handler; ``manage.py run_workers`` runs it later in a worker
+process. Tasks are claimed with a conditional UPDATE, so any number of
+workers can share the table without row locks:
+
+* higher ``priority`` runs first, then oldest ``run_at``,
+* a claimed task is invisible for ``TASK_VISIBILITY_TIMEOUT`` seconds; if
+  its worker dies it becomes claimable again after that, unless that was its
+  last attempt: then it is marked failed,
+* failures are retried with exponential backoff up to ``max_attempts``,
+* a worker whose claim expired meanwhile no longer changes the row,
+* an ``idempotency_key`` makes repeated enqueues of the same work a no-op.
+
+Arguments must be JSON-serializable (pass ids, not model instances).
+"""
+import logging
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Avg, Count, F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Task
+
+logger = logging.getLogger(__name__)
+
+
+def visibility_timeout():
+    return getattr(settings, 'TASK_VISIBILITY_TIMEOUT', 300)
+
+
+class TaskFunction:
+    """Wrapper returned by ``@task``; call it directly or ``enqueue`` it."""
+    def __init__(self, func, priority=0, max_attempts=5, backoff=2.0):
+        self.func = func
+        self.name = f"{func.__module__}.{func.__name__}"
+        self.priority = priority
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.__doc__ = func.__doc__
+
+    def __call__(self, *args, **kwargs):
+        return self.func(*args, **kwargs)
+
+    def enqueue(self, *args, idempotency_key=None, priority=None, delay=0, **kwargs):
+        """Queue a run of this task; returns the ``Task`` row.
+
+        If ``idempotency_key`` was used before, the existing task is returned
+        and nothing new is queued. In ``TASK_ALWAYS_EAGER`` mode the task runs
+        inline instead.
+        """
+        if getattr(settings, 'TASK_ALWAYS_EAGER', False):
+            self.func(*args, **kwargs)
+            return None
+
+        fields = {
+            'name': self.name,
+            'args': list(args),
+            'kwargs': kwargs,
+            'priority': self.priority if priority is None else priority,
+            'max_attempts': self.max_attempts,
+            'run_at': timezone.now() + timedelta(seconds=delay),
+        }
+        if idempotency_key is None:
+            return Task.objects.create(**fields)
+        try:
+            with transaction.atomic():
+                return Task.objects.create(idempotency_key=idempotency_key, **fields)
+        except IntegrityError:
+            return Task.objects.get(idempotency_key=idempotency_key)
+
+
+def task(func=None, *, priority=0, max_attempts=5, backoff=2.0):
+    """Turn a function into a queueable task (``@task`` or ``@task(priority=5)``)."""
+    def wrap(func):
+        return TaskFunction(func, priority=priority, max_attempts=max_attempts, backoff=backoff)
+    return wrap(func) if func is not None else wrap
+
+
+# worker side
+ABANDONED_ERROR = "The worker running the last attempt stopped before it finished (its claim expired)."
+
+
+def _due():
+    now = timezone.now()
+    return (Q(status=Task.QUEUED, run_at__lte=now)
+            | Q(status=Task.RUNNING, locked_until__lt=now, attempts__lt=F('max_attempts')))
+
+
+def fail_abandoned():
+    """Mark failed the tasks whose worker died on their last attempt; return how many."""
+    now = timezone.now()
+    return Task.objects.filter(status=Task.RUNNING, locked_until__lt=now, attempts__gte=F('max_attempts')).update(
+        status=Task.FAILED, locked_until=None, last_error=ABANDONED_ERROR, finished_at=now,
+    )
+
+
+def claim_next():
+    """Claim the next due task for this worker, or return ``None``."""
+    candidates = list(Task.objects.filter(_due())
+                      .order_by('-priority', 'run_at')
+                      .values_list('pk', flat=True)[:10])
+    if not candidates:
+        # a task that kills its worker every time would otherwise stay running forever
+        fail_abandoned()
+    for pk in candidates:
+        now = timezone.now()
+        claimed = Task.objects.filter(_due(), pk=pk).update(
+            status=Task.RUNNING,
+            attempts=F('attempts') + 1,
+            locked_until=now + timedelta(seconds=visibility_timeout()),
+            started_at=now,
+        )
+        # another worker won the race for this row, try the next one
+        if claimed:
+            return Task.objects.get(pk=pk)
+    return None
+
+
+def _claim(task_row):
+    # the row while this worker's claim holds: once it expired and another worker
+    # claimed it again (one more attempt), this worker's outcome is not recorded
+    return Task.objects.filter(pk=task_row.pk, status=Task.RUNNING, attempts=task_row.attempts)
+
+
+def run_task(task_row):
+    """Execute a claimed task and record success, a retry or the failure."""
+    try:
+        func = import_string(task_row.name)
+        func = getattr(func, 'func', func)
+        func(*task_row.args, **task_row.kwargs)
+    except Exception:
+        error = traceback.format_exc()
+        logger.warning("Task %s #%s failed (attempt %s):\n%s", task_row.name, task_row.pk, task_row.attempts, error)
+        if task_row.attempts < task_row.max_attempts:
+            backoff = getattr(import_string(task_row.name), 'backoff', 2.0)
+            delay = backoff ** task_row.attempts
+            updated = _claim(task_row).update(
+                status=Task.QUEUED, locked_until=None, last_error=error,
+                run_at=timezone.now() + timedelta(seconds=delay),
+            )
+        else:
+            updated = _claim(task_row).update(
+                status=Task.FAILED, locked_until=None, last_error=error, finished_at=timezone.now(),
+            )
+        _warn_if_lost(task_row, updated)
+        return False
+
+    updated = _claim(task_row).update(status=Task.DONE, locked_until=None, finished_at=timezone.now())
+    _warn_if_lost(task_row, updated)
+    return True
+
+
+def _warn_if_lost(task_row, updated):
+    if not updated:
+        logger.warning("Task %s #%s ran past its claim (attempt %s); its outcome was not recorded.",
+                       task_row.name, task_row.pk, task_row.attempts)
+
+
+def work(stop_event=None, poll_interval=1.0, max_tasks=None):
+    """Worker loop: claim and run tasks until ``stop_event`` is set."""
+    done = 0
+    while not (stop_event and stop_event.is_set()):
+        task_row = claim_next()
+        if task_row is None:
+            if max_tasks is not None:
+                break
+            time.sleep(poll_interval)
+            continue
+        run_task(task_row)
+        done += 1
+        if max_tasks is not None and done >= max_tasks:
+            break
+    return done
+
+
+# metrics
+def metrics(window=timedelta(minutes=5)):
+    """Return queue depth per status and latencies (seconds) over ``window``."""
+    depth = dict(Task.objects.values_list('status').annotate(n=Count('pk')).order_by())
+    since = timezone.now() - window
+    recent = Task.objects.filter(status=Task.DONE, finished_at__gte=since)
+    latency = recent.aggregate(
+        wait=Avg(F('started_at') - F('created_at')),
+        run=Avg(F('finished_at') - F('started_at')),
+    )
+    oldest = Task.objects.filter(status=Task.QUEUED).order_by('created_at').values_list('created_at', flat=True).first()
+    return {
+        'depth': {status: depth.get(status, 0) for status, _label in Task.STATUSES},
+        'done_last_window': recent.count(),
+        'mean_wait_seconds': latency['wait'].total_seconds() if latency['wait'] else 0.0,
+        'mean_run_seconds': latency['run'].total_seconds() if latency['run'] else 0.0,
+        'oldest_queued_seconds': (timezone.now() - oldest).total_seconds() if oldest else 0.0,
+    }
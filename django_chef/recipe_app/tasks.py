@@ -0,0 +1,41 @@
+"""
+Background tasks, run by ``manage.py run_workers`` (see task_queue.py).
+"""
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.utils.module_loading import import_string
+
+from .task_queue import task
+
+
+@task(priority=5)
+def run_purge_hooks(tags):
+    """Forward a public page purge to the configured CDN hooks."""
+    for hook in getattr(settings, 'PUBLIC_CACHE_PURGE_HOOKS', []):
+        import_string(hook)(tags)
+
+
+@task
+def delete_stored_file(name):
+    """Remove an uploaded file that no row points at anymore."""
+    if name and default_storage.exists(name):
+        default_storage.delete(name)
+
+
+@task(max_attempts=3)
+def export_cookbook(user_id, scope, fmt, name):
+    """Write a cookbook too big to stream while the user waits (see export.py)."""
+    from .export import write_export
+    from .models import CustomUser
+
+    user = CustomUser.objects.filter(pk=user_id).first()
+    if user is not None:
+        write_export(user, scope, fmt, name)
+
+
+@task(max_attempts=1)
+def build_pantry_index():
+    """First build of the pantry index, queued by the first search (see pantry.py)."""
+    from .pantry import build
+
+    build()
@@ -0,0 +1,105 @@
+// Django Chef service worker (see recipe_app/offline.py)
+const STATIC_CACHE = "chef-static-{{ cache_version }}";
+const BOOK_CACHE = "chef-book";
+const SHELL_URL = "{% url 'offline_shell' %}";
+const SNAPSHOT_URL = "{% url 'offline_snapshot' %}";
+const STATIC_PREFIXES = ["{{ static_prefix|escapejs }}", "{{ media_prefix|escapejs }}"];
+const PRECACHE = [SHELL_URL, {% for url in precache %}"{{ url|escapejs }}"{% if not forloop.last %}, {% endif %}{% endfor %}];
+
+self.addEventListener("install", event => {
+  event.waitUntil(
+    caches.open(STATIC_CACHE)
+      .then(cache => cache.addAll(PRECACHE))
+      .then(() => self.skipWaiting())
+  );
+});
+
+// drop the assets of older versions, the recipe book is kept
+self.addEventListener("activate", event => {
+  event.waitUntil(
+    caches.keys()
+      .then(keys => Promise.all(
+        keys.filter(key => key.startsWith("chef-static-") && key !== STATIC_CACHE).map(key => caches.delete(key))
+      ))
+      .then(() => self.clients.claim())
+  );
+});
+
+self.addEventListener("fetch", event => {
+  const request = event.request;
+  const url = new URL(request.url);
+  if (request.method !== "GET" || url.origin !== self.location.origin) {
+    return;
+  }
+  if (request.mode === "navigate") {
+    // pages are always fresh when online, the shell renders the cached book otherwise
+    event.respondWith(fetch(request).catch(() => caches.match(SHELL_URL)));
+  } else if (STATIC_PREFIXES.some(prefix => url.pathname.startsWith(prefix))) {
+    event.respondWith(staleWhileRevalidate(event, request));
+  }
+});
+
+// serve from the cache at once, refresh it in the background
+function staleWhileRevalidate(event, request) {
+  return caches.open(STATIC_CACHE).then(cache =>
+    cache.match(request, {ignoreSearch: true}).then(cached => {
+      const refresh = fetch(request).then(response => {
+        if (response.ok) {
+          cache.put(request, response.clone());
+        }
+        return response;
+      });
+      if (cached) {
+        event.waitUntil(refresh.catch(() => null));
+        return cached;
+      }
+      return refresh;
+    })
+  );
+}
+
+self.addEventListener("message", event => {
+  const message = event.data || {};
+  if (message.type === "sync") {
+    event.waitUntil(syncBook(message.user));
+  } else if (message.type === "clear") {
+    event.waitUntil(caches.delete(BOOK_CACHE));
+  }
+});
+
+// fetch the changes since the cached version and merge them into the cached book
+async function syncBook(user) {
+  const cache = await caches.open(BOOK_CACHE);
+  const cachedResponse = await cache.match(SNAPSHOT_URL);
+  let book = cachedResponse ? await cachedResponse.json() : null;
+  if (book && book.user !== user) {
+    // someone else logged in on this device
+    book = null;
+  }
+
+  const url = book ? `${SNAPSHOT_URL}?since=${book.version}` : SNAPSHOT_URL;
+  let response;
+  try {
+    response = await fetch(url, {credentials: "same-origin", cache: "no-store"});
+  } catch (error) {
+    return;  // offline, keep what we have
+  }
+  if (!response.ok) {
+    return;
+  }
+  const snapshot = await response.json();
+
+  if (book && !snapshot.full) {
+    const changed = new Set(snapshot.recipes.map(recipe => recipe.id));
+    const keep = new Set(snapshot.ids);
+    snapshot.recipes = book.recipes
+      .filter(recipe => keep.has(recipe.id) && !changed.has(recipe.id))
+      .concat(snapshot.recipes)
+      .sort((a, b) => a.title.localeCompare(b.title));
+  }
+  delete snapshot.ids;
+  snapshot.full = true;
+  await cache.put(SNAPSHOT_URL, new Response(JSON.stringify(snapshot), {
+    headers: {"Content-Type": "application/json"},
+  }));
+}
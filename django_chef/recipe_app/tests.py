@@ -1,3 +1,1554 @@
-from django.test import TestCase
+import contextvars
+import gzip
+import io
+import json
+import os
+import random
+import re
+import shutil
+import tempfile
+import time
+import zlib
+from datetime import timedelta
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
\ No newline at end of file
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.sessions.backends.cached_db import SessionStore
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.cache import caches
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, connections
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.template import engines
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.text import slugify
+from PIL import Image
+
+from . import (archive, dashboard, duplicates, events, export, middleware, offline, pantry, pdf, public_cache,
+               query_audit, read_models, replicas, seeding, static_assets, step_order, task_queue, throttling,
+               versioning, warmup)
+from .management.commands.import_profile import parse_importtime
+from .models import (ArchivedChild, ArchivedRecipe, Category, CustomUser, Event, FavoriteRecipe, IngreadientMeasure,
+                     Ingredient, Recipe, RecipeVersion, Step, Task, UserStats)
+from .wizard_storage import CacheStorage
+
+# what the test tasks below were called with
+task_calls = []
+
+
+@task_queue.task(max_attempts=2, backoff=3.0)
+def sometimes_failing(fail):
+    task_calls.append(fail)
+    if fail:
+        raise ValueError("failed on purpose")
+
+
+def purge_hook(tags):
+    task_calls.append(tags)
+
+
+# recipe-scoped views: the recipe is read once, owner enforced, children come with it
+class RecipeScopeTests(TestCase):
+    """Query counts of the recipe, ingredient and step views.
+
+    Every logged-in request pays one query for the user. The throttle, cached
+    sessions and wizard storage only use the caches, and events go to a jsonl
+    file, so what is left is the view's own work.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.event_log_dir = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, cls.event_log_dir, ignore_errors=True)
+        cls.enterClassContext(override_settings(
+            EVENT_LOG_EAGER=True, EVENT_LOG_SINK='jsonl', EVENT_LOG_DIR=cls.event_log_dir,
+        ))
+        super().setUpClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = CustomUser.objects.create_user('owner', 'owner@example.com', 'pass')
+        cls.other = CustomUser.objects.create_user('other', 'other@example.com', 'pass')
+        cls.category = Category.objects.create(name='Soups')
+        cls.measure = IngreadientMeasure.objects.create(measure='cup')
+        cls.recipe = cls.make_recipe(cls.owner, 'Tomato Soup')
+        # versioned already: the counts below are those of every edit but the first
+        versioning.record_baseline(cls.recipe)
+        cls.foreign = cls.make_recipe(cls.other, 'Borscht')
+        FavoriteRecipe.objects.create(user=cls.owner, recipe=cls.recipe)
+
+    @classmethod
+    def make_recipe(cls, owner, title):
+        recipe = Recipe.objects.create(
+            title=title, description='Hot.', prep_time=10, cook_time=30, category=cls.category, owner=owner,
+        )
+        for number in (1, 2):
+            Ingredient.objects.create(recipe=recipe, name=f"Ingredient {number}", quantity='1', measure=cls.measure)
+            Step.objects.create(recipe=recipe, step_number=number * step_order.STEP_GAP, step=f"Step {number}.")
+        return recipe
+
+    def setUp(self):
+        # no throttle counters or coalesced responses from earlier tests
+        caches['default'].clear()
+        self.client.force_login(self.owner)
+
+    def url(self, name, obj, recipe=None):
+        return reverse(name, kwargs={'pk': obj.pk, 'slug': (recipe or obj).slug})
+
+    # recipes
+    def test_list_does_not_query_per_recipe(self):
+        for number in range(5):
+            self.make_recipe(self.owner, f"Stew {number}")
+        # user, recipes with category and is_fav, their ingredients, archived titles
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('recipe_list'))
+        self.assertEqual(len(response.context['recipes']), 6)
+        self.assertEqual([r.is_fav for r in response.context['recipes'] if r.pk == self.recipe.pk], [True])
+        self.assertEqual([i.name for i in response.context['recipes'][0].ingredients], ['Ingredient 1', 'Ingredient 2'])
+
+    def test_favorites_are_one_query(self):
+        FavoriteRecipe.objects.create(user=self.owner, recipe=self.foreign)
+        # user, favorites with their recipe and category
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('favorites_list', args=[self.owner.username]))
+        cards = response.context['favorites']
+        self.assertEqual([card.title for card in cards], ['Tomato Soup', 'Borscht'])
+        self.assertEqual((cards[0].category, cards[0].prep, cards[0].cook), ('Soups', '10 Minutes', '30 Minutes'))
+        self.assertContains(response, reverse('public_recipe', args=[self.foreign.pk, self.foreign.slug]))
+
+    def test_read_recipe(self):
+        # user, recipe with category and is_fav, ingredients, their measures, steps
+        with self.assertNumQueries(5):
+            response = self.client.get(self.url('read_recipe', self.recipe))
+        self.assertTrue(response.context['recipe'].is_fav)
+
+    def test_update_recipe_form(self):
+        # user, recipe, category choices
+        with self.assertNumQueries(3):
+            response = self.client.get(self.url('update_recipe', self.recipe))
+        self.assertEqual(response.status_code, 200)
+
+    def test_recipes_of_other_users_are_not_found(self):
+        for name in ('read_recipe', 'update_recipe', 'delete_recipe', 'recipe_history', 'recipe_activity',
+                     'add_ingredient', 'add_instruction'):
+            with self.subTest(name):
+                self.assertEqual(self.client.get(self.url(name, self.foreign)).status_code, 404)
+
+    def test_recipes_of_other_users_are_not_changed(self):
+        response = self.client.post(self.url('update_recipe', self.foreign), {'title': 'Mine now'})
+        self.assertEqual(response.status_code, 404)
+        response = self.client.post(self.url('delete_recipe', self.foreign))
+        self.assertEqual(response.status_code, 404)
+        self.assertTrue(Recipe.objects.filter(pk=self.foreign.pk, title='Borscht').exists())
+
+    def test_delete_recipe(self):
+        response = self.client.post(self.url('delete_recipe', self.recipe))
+        self.assertRedirects(response, reverse('recipe_list'), fetch_redirect_response=False)
+        self.assertFalse(Recipe.objects.filter(pk=self.recipe.pk).exists())
+
+    # ingredients and steps
+    def test_add_ingredient_form_reads_the_recipe_once(self):
+        # user, recipe, measure choices
+        with self.assertNumQueries(3):
+            response = self.client.get(self.url('add_ingredient', self.recipe))
+        self.assertEqual(response.context['recipe'], self.recipe)
+
+    def test_add_ingredient(self):
+        # user, measure choice and its validation, recipe, any version yet, insert, recipe updated_at,
+        # then record_version's savepoint, lock, ingredients, steps, last version, its rebuild, insert, release
+        with self.assertNumQueries(15):
+            response = self.client.post(self.url('add_ingredient', self.recipe),
+                                        {'name': 'Basil', 'quantity': '2', 'measure': self.measure.pk})
+        self.assertRedirects(response, self.url('read_recipe', self.recipe), fetch_redirect_response=False)
+        self.assertTrue(self.recipe.ingredients.filter(name='Basil').exists())
+
+    def test_update_ingredient_form_loads_the_recipe_with_it(self):
+        ingredient = self.recipe.ingredients.first()
+        # user, ingredient with recipe, measure choices
+        with self.assertNumQueries(3):
+            response = self.client.get(self.url('update_ingredient', ingredient, self.recipe))
+        self.assertEqual(response.context['recipe'], self.recipe)
+
+    def test_update_step_form_loads_the_recipe_with_it(self):
+        step = self.recipe.steps.first()
+        # user, step with recipe
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url('update_instruction', step, self.recipe))
+        self.assertContains(response, 'Tomato Soup')
+
+    def test_delete_step(self):
+        step = self.recipe.steps.first()
+        # user, step with recipe, any version yet, delete, recipe updated_at, then record_version's 8
+        with self.assertNumQueries(13):
+            response = self.client.post(self.url('delete_instruction', step, self.recipe))
+        self.assertRedirects(response, self.url('read_recipe', self.recipe), fetch_redirect_response=False)
+        self.assertFalse(Step.objects.filter(pk=step.pk).exists())
+
+    def test_children_of_other_users_recipes_are_not_found(self):
+        ingredient, step = self.foreign.ingredients.first(), self.foreign.steps.first()
+        for name, child in (('update_ingredient', ingredient), ('delete_ingredient', ingredient),
+                            ('update_instruction', step), ('delete_instruction', step)):
+            with self.subTest(name):
+                self.assertEqual(self.client.get(self.url(name, child, self.foreign)).status_code, 404)
+                self.assertEqual(self.client.post(self.url(name, child, self.foreign)).status_code, 404)
+        self.assertEqual(self.foreign.ingredients.count(), 2)
+        self.assertEqual(self.foreign.steps.count(), 2)
+
+    # step order
+    def step_updates(self, queries):
+        return [q['sql'] for q in queries if q['sql'].startswith('UPDATE "recipe_app_step"')]
+
+    def test_reorder_steps_is_one_update(self):
+        first, second = self.recipe.steps.all()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.url('reorder_instructions', self.recipe), {'step': [second.pk, first.pk]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(self.step_updates(queries)), 1)
+        self.assertEqual(list(self.recipe.steps.all()), [second, first])
+        self.assertEqual(list(response.context['steps']), [second, first])
+
+    def test_reorder_with_a_stale_order_is_a_conflict(self):
+        steps = list(self.recipe.steps.all())
+        response = self.client.post(self.url('reorder_instructions', self.recipe), {'step': [steps[1].pk]})
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(list(self.recipe.steps.all()), steps)
+        response = self.client.post(self.url('reorder_instructions', self.recipe),
+                                    {'step': [steps[1].pk, steps[0].pk, self.foreign.steps.first().pk]})
+        self.assertEqual(response.status_code, 409)
+
+    def test_reorder_steps_of_other_users_is_not_found(self):
+        steps = list(self.foreign.steps.all())
+        response = self.client.post(self.url('reorder_instructions', self.foreign), {'step': [s.pk for s in steps[::-1]]})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(list(self.foreign.steps.all()), steps)
+
+    def test_add_step_at_a_position_writes_one_row(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(self.url('add_instruction', self.recipe), {'position': 1, 'step': 'Wash.'})
+        self.assertEqual(self.step_updates(queries), [])
+        self.assertEqual([step.step for step in self.recipe.steps.all()], ['Wash.', 'Step 1.', 'Step 2.'])
+        self.client.post(self.url('add_instruction', self.recipe), {'step': 'Serve.'})
+        self.assertEqual(self.recipe.steps.last().step, 'Serve.')
+
+
+class StepOrderTests(TestCase):
+    """Gap keys of step_order.py: few rows written, order always right, keys never repeated."""
+
+    @classmethod
+    def setUpTestData(cls):
+        owner = CustomUser.objects.create_user('cook', 'cook@example.com', 'pass')
+        cls.recipe = Recipe.objects.create(title='Pie', description='Sweet.', prep_time=10, cook_time=30, owner=owner)
+        Step.objects.bulk_create(
+            Step(recipe=cls.recipe, step_number=(number + 1) * step_order.STEP_GAP, step=f"Step {number}.")
+            for number in range(8)
+        )
+
+    def order(self):
+        return list(self.recipe.steps.values_list('pk', flat=True))
+
+    def test_moving_one_step_changes_one_key(self):
+        rng = random.Random(42)
+        for _ in range(50):
+            order = self.order()
+            order.insert(rng.randrange(len(order)), order.pop(rng.randrange(len(order))))
+            changed = step_order.reorder(self.recipe, order)
+            self.assertEqual(self.order(), order)
+            self.assertLessEqual(changed, 1)
+
+    def test_any_new_order_is_applied(self):
+        rng = random.Random(7)
+        for _ in range(20):
+            order = self.order()
+            rng.shuffle(order)
+            step_order.reorder(self.recipe, order)
+            self.assertEqual(self.order(), order)
+
+    def test_order_must_hold_every_step_once(self):
+        order = self.order()
+        for bad in (order[:-1], order + order[:1], order[:-1] + [0]):
+            with self.subTest(bad=bad), self.assertRaises(ValueError):
+                step_order.reorder(self.recipe, bad)
+
+    def test_full_gap_is_compacted(self):
+        for number in range(20):
+            Step.objects.create(recipe=self.recipe, step=f"Early {number}.",
+                                step_number=step_order.insert_key(self.recipe, 2))
+            self.assertEqual(self.recipe.steps.all()[1].step, f"Early {number}.")
+
+    def test_compact(self):
+        Step.objects.create(recipe=self.recipe, step='Squeezed in.', step_number=step_order.STEP_GAP + 1)
+        self.assertEqual(step_order.crowded_recipes(), {self.recipe.pk})
+        order = self.order()
+        self.assertEqual(step_order.compact(self.recipe), 9)
+        self.assertEqual(self.order(), order)
+        self.assertEqual(step_order.crowded_recipes(), set())
+
+
+@override_settings(DASHBOARD_EAGER=True)
+class DashboardTests(TestCase):
+    """Stats kept by deltas equal a rebuild; the page reads them through the cache."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user('baker', 'baker@example.com', 'pass')
+        cls.other = CustomUser.objects.create_user('taster', 'taster@example.com', 'pass')
+        cls.categories = [Category.objects.create(name=name) for name in ('Breads', 'Cakes')]
+
+    def setUp(self):
+        caches['default'].clear()
+
+    def stats(self, user):
+        row = UserStats.objects.get(pk=user.pk)
+        return [row.recipe_count, row.spice_total, row.favorite_count, row.category_counts, row.recent, row.quickest]
+
+    def assertMatchesRebuild(self, user):
+        live = self.stats(user)
+        dashboard.rebuild(user.pk)
+        self.assertEqual(live, self.stats(user))
+
+    def test_deltas_match_a_rebuild(self):
+        rng = random.Random(5)
+        recipes = []
+        for number in range(60):
+            choice = rng.random()
+            if choice < 0.4 or not recipes:
+                recipes.append(Recipe.objects.create(
+                    title=f"Loaf {number}", description='.', prep_time=5, cook_time=rng.randint(1, 90),
+                    cook_time_unit=rng.choice(['min', 'hr']), spice_level=rng.randrange(6),
+                    category=rng.choice(self.categories + [None]), owner=rng.choice([self.user, self.other]),
+                ))
+            elif choice < 0.7:
+                recipe = rng.choice(recipes)
+                recipe.cook_time, recipe.category = rng.randint(1, 90), rng.choice(self.categories + [None])
+                recipe.owner = rng.choice([self.user, self.other])
+                recipe.save()
+            elif choice < 0.85:
+                recipes.pop(rng.randrange(len(recipes))).delete()
+            else:
+                favorite, created = FavoriteRecipe.objects.get_or_create(user=self.user, recipe=rng.choice(recipes))
+                if not created:
+                    favorite.delete()
+        self.assertMatchesRebuild(self.user)
+        self.assertMatchesRebuild(self.other)
+
+    def test_saves_do_not_read_the_recipe_again(self):
+        created = Recipe.objects.create(title='Rye', description='.', prep_time=5, cook_time=2, owner=self.user,
+                                        category=self.categories[0])
+        recipe = Recipe.objects.get(pk=created.pk)
+        recipe.spice_level = 3
+        with CaptureQueriesContext(connection) as queries:
+            recipe.save()
+        reads = [q['sql'] for q in queries.captured_queries
+                 if q['sql'].startswith('SELECT') and 'FROM "recipe_app_recipe"' in q['sql']]
+        self.assertEqual(reads, [])
+        # changed elsewhere: a refresh reloads what the recipe counts for
+        Recipe.objects.filter(pk=recipe.pk).update(category=self.categories[1])
+        dashboard.rebuild(self.user.pk)
+        recipe.refresh_from_db()
+        recipe.category = None
+        recipe.save()
+        self.assertMatchesRebuild(self.user)
+        # an instance that was not loaded reads the row
+        Recipe(pk=recipe.pk, title='Rye', description='.', prep_time=5, cook_time=2, owner=self.other).save()
+        self.assertMatchesRebuild(self.user)
+        self.assertMatchesRebuild(self.other)
+
+    def test_home_page_serves_cached_stats(self):
+        Recipe.objects.create(title='Rye', description='.', prep_time=5, cook_time=2, cook_time_unit='hr',
+                              spice_level=1, category=self.categories[0], owner=self.user)
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('home'))
+        self.assertEqual(response.context['dashboard']['categories'], [('Breads', 1)])
+        self.assertEqual(response.context['dashboard']['quickest'][0]['cook'], '2 Hours')
+        # user only, the stats come from the cache
+        with self.assertNumQueries(1):
+            self.client.get(reverse('home'))
+
+    def test_changes_are_served_stale_then_refreshed(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse('home')).context['dashboard']['recipes'], 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            Recipe.objects.create(title='Scone', description='.', prep_time=5, cook_time=20, owner=self.user)
+        self.assertEqual(self.client.get(reverse('home')).context['dashboard']['recipes'], 0)
+        self.assertEqual(self.client.get(reverse('home')).context['dashboard']['recipes'], 1)
+
+    def test_missing_row_is_rebuilt(self):
+        Recipe.objects.create(title='Bun', description='.', prep_time=5, cook_time=20, owner=self.user)
+        UserStats.objects.filter(pk=self.user.pk).delete()
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse('home')).context['dashboard']['recipes'], 1)
+
+
+class WarmupTests(TestCase):
+    """Server start-up: the warm-up phases and the import profile."""
+
+    def test_phases_run_once_per_process(self):
+        warmup.timings.clear()
+        with self.assertLogs('recipe_app.warmup', 'INFO'):
+            timings = warmup.warm_app()
+        self.assertEqual(list(timings), ['urls', 'templates', 'lookups'])
+        self.assertTrue(all(count > 0 for count, _seconds in timings.values()))
+        with self.assertNoLogs('recipe_app.warmup', 'INFO'):
+            self.assertIs(warmup.warm_app(), timings)
+        self.assertEqual(warmup.prime_database(), 1)
+
+    def test_templates_are_compiled_into_the_cached_loader(self):
+        loader = engines['django'].engine.template_loaders[0]
+        loader.reset()
+        # views whose GET is never rendered name templates that do not exist: skipped with a warning
+        with self.assertLogs('recipe_app.warmup', 'WARNING') as missing:
+            loaded = warmup.warm_templates()
+        compiled = {name for name, template in loader.get_template_cache.items()
+                    if not isinstance(template, (type, Exception))}
+        self.assertEqual(len(compiled), loaded)
+        self.assertEqual(loaded + len(missing.records), len(warmup.template_names()))
+        self.assertTrue({'base.html', 'partials/navbar.html', 'recipe_app/recipe/list_recipe.html'} <= compiled)
+
+    def test_parse_importtime(self):
+        report = ("import time: self [us] | cumulative | imported package\n"
+                  "import time:       120 |        120 |    django.utils\n"
+                  "import time:      2048 |       2168 |  django\n"
+                  "something else\n")
+        self.assertEqual(parse_importtime(report), [('django.utils', 120, 120, 1), ('django', 2048, 2168, 0)])
+
+
+class HTMLMinifyTests(SimpleTestCase):
+    """HTML loses indentation and comments, never the content of whitespace-sensitive tags."""
+
+    PRESERVED = ('<pre>  a\n\n    b  </pre>', '<textarea name="x">\n  keep\n\n  me\n</textarea>',
+                 '<script>\n  if (a) {\n    // <!-- not a comment -->\n  }\n</script>')
+
+    def test_whitespace_sensitive_tags_are_kept(self):
+        html = '\n'.join(f"    <div>\n        {block}\n    </div>" for block in self.PRESERVED)
+        minified = middleware.minify_html(html)
+        for block in self.PRESERVED:
+            self.assertIn(block, minified)
+        self.assertNotIn('    <div>', minified)
+
+    def test_only_conditional_comments_are_kept(self):
+        html = '<!-- header -->\n  <!--[if IE]><p>old</p><![endif]-->\n  <p>hi</p>\n  <!--\n  footer\n  -->'
+        self.assertEqual(middleware.minify_html(html), '<!--[if IE]><p>old</p><![endif]-->\n<p>hi</p>')
+
+    def respond(self, response):
+        with override_settings(HTML_MINIFY=True):
+            return middleware.HTMLMinifyMiddleware(lambda request: response)(RequestFactory().get('/'))
+
+    def test_html_responses_are_minified(self):
+        response = HttpResponse('<p>\n    hi\n</p>\n\n')
+        response['Content-Length'] = len(response.content)
+        response = self.respond(response)
+        self.assertEqual(response.content, b'<p>\nhi\n</p>')
+        self.assertEqual(response['Content-Length'], '11')
+
+    def test_other_responses_pass_through(self):
+        body = '<p>\n    hi\n</p>'
+        json_response = HttpResponse(body, content_type='application/json')
+        compressed = HttpResponse(gzip.compress(body.encode()))
+        compressed['Content-Encoding'] = 'gzip'
+        for response in (json_response, compressed):
+            content = response.content
+            self.assertEqual(self.respond(response).content, content)
+        streaming = self.respond(StreamingHttpResponse(iter([body])))
+        self.assertEqual(b''.join(streaming.streaming_content), body.encode())
+
+    @override_settings(HTML_MINIFY=False)
+    def test_off(self):
+        with self.assertRaises(MiddlewareNotUsed):
+            middleware.HTMLMinifyMiddleware(lambda request: HttpResponse())
+
+
+class ArchiveTests(TestCase):
+    """Stale recipes move to the archive whole, are read from it and come back when edited."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = CustomUser.objects.create_user('archivist', 'archivist@example.com', 'pass')
+        cls.fan = CustomUser.objects.create_user('fan', 'fan@example.com', 'pass')
+        cls.measure = IngreadientMeasure.objects.create(measure='pinch')
+        cls.recipe = Recipe.objects.create(title='Old Stew', description='.', prep_time=5, cook_time=90,
+                                           owner=cls.owner, image='recipe_images/stew.jpg')
+        cls.ingredient = Ingredient.objects.create(recipe=cls.recipe, name='Salt', quantity='1', measure=cls.measure)
+        Step.objects.create(recipe=cls.recipe, step_number=step_order.STEP_GAP, step='Simmer all day.')
+        RecipeVersion.objects.create(recipe=cls.recipe, number=1, is_checkpoint=True, data={'title': 'Old Stew'})
+        FavoriteRecipe.objects.create(user=cls.fan, recipe=cls.recipe)
+        cls.fresh = Recipe.objects.create(title='New Salad', description='.', prep_time=5, cook_time=0, owner=cls.owner)
+        Recipe.objects.filter(pk=cls.recipe.pk).update(updated_at=archive.cutoff(13))
+
+    def setUp(self):
+        caches['default'].clear()
+        self.client.force_login(self.owner)
+        self.assertEqual(sum(archive.archive_stale(months=12)), 1)
+
+    def read_url(self):
+        return reverse('read_recipe', args=[self.recipe.pk, self.recipe.slug])
+
+    def test_moves_the_recipe_and_its_children(self):
+        self.assertFalse(Recipe.objects.filter(pk=self.recipe.pk).exists())
+        for model in (Ingredient, Step, RecipeVersion, FavoriteRecipe):
+            self.assertFalse(model.objects.exists())
+        self.assertTrue(Recipe.objects.filter(pk=self.fresh.pk).exists())
+        # the image stays for when the recipe comes back
+        self.assertFalse(Task.objects.exists())
+        self.assertEqual(UserStats.objects.get(pk=self.owner.pk).recipe_count, 1)
+        self.assertEqual(UserStats.objects.get(pk=self.fan.pk).favorite_count, 0)
+
+    def test_read_from_the_archive(self):
+        response = self.client.get(self.read_url())
+        self.assertContains(response, 'Simmer all day.')
+        self.assertContains(response, 'pinch')
+        self.assertTrue(response.context['recipe'].is_archived)
+        self.assertTrue(ArchivedRecipe.objects.filter(pk=self.recipe.pk).exists())
+        self.assertContains(self.client.get(reverse('recipe_list')), 'Old Stew')
+        self.client.force_login(self.fan)
+        self.assertEqual(self.client.get(self.read_url()).status_code, 404)
+
+    def test_edit_moves_it_back(self):
+        response = self.client.get(reverse('update_recipe', args=[self.recipe.pk, self.recipe.slug]))
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(ArchivedRecipe.objects.exists())
+        recipe = Recipe.objects.get(pk=self.recipe.pk)
+        self.assertGreater(recipe.updated_at, archive.cutoff(1))
+        self.assertEqual(list(recipe.ingredients.values_list('pk', 'measure')), [(self.ingredient.pk, self.measure.pk)])
+        self.assertEqual(recipe.steps.get().step, 'Simmer all day.')
+        self.assertEqual(recipe.versions.get().data, {'title': 'Old Stew'})
+        self.assertTrue(FavoriteRecipe.objects.filter(user=self.fan, recipe=recipe).exists())
+        self.assertEqual(UserStats.objects.get(pk=self.owner.pk).recipe_count, 2)
+        self.assertEqual(UserStats.objects.get(pk=self.fan.pk).favorite_count, 1)
+
+    def test_child_edit_moves_it_back(self):
+        response = self.client.get(reverse('update_ingredient', args=[self.ingredient.pk, self.recipe.slug]))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(Recipe.objects.filter(pk=self.recipe.pk).exists())
+
+    def test_deleted_measure_is_cleared(self):
+        self.measure.delete()
+        self.client.get(reverse('update_recipe', args=[self.recipe.pk, self.recipe.slug]))
+        self.assertIsNone(Ingredient.objects.get(pk=self.ingredient.pk).measure_id)
+
+    def test_child_urls_find_the_recipe_by_index(self):
+        step_id = ArchivedRecipe.objects.get().data['steps'][0]['id']
+        self.assertEqual(sorted(ArchivedChild.objects.values_list('archived_id', 'kind', 'child_id')),
+                         [(self.recipe.pk, 'ingredients', self.ingredient.pk), (self.recipe.pk, 'steps', step_id)])
+        with self.assertNumQueries(1):
+            found = archive.find_by_child(self.owner, self.recipe.slug, Ingredient, self.ingredient.pk)
+        self.assertEqual(found.pk, self.recipe.pk)
+        self.assertEqual(archive.find_by_child(self.owner, self.recipe.slug, Step, step_id).pk, self.recipe.pk)
+        self.assertIsNone(archive.find_by_child(self.owner, self.recipe.slug, Step, step_id + 1))
+        self.assertIsNone(archive.find_by_child(self.fan, self.recipe.slug, Ingredient, self.ingredient.pk))
+        archive.restore(self.owner, self.recipe.pk)
+        self.assertFalse(ArchivedChild.objects.exists())
+
+    def test_restore_reaches_the_pantry_index_and_dashboard(self):
+        folder = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, folder, ignore_errors=True)
+        (folder / 'generation').write_text('1')
+        with override_settings(PANTRY_INDEX_DIR=folder), self.captureOnCommitCallbacks(execute=True):
+            archive.restore(self.owner, self.recipe.pk)
+        changes = [json.loads(line) for line in (folder / 'changes-1.log').read_text().splitlines()]
+        self.assertIn({'id': self.recipe.pk, 'owner': self.owner.pk, 'public': False, 'tokens': ['salt']}, changes)
+        self.assertEqual(UserStats.objects.get(pk=self.owner.pk).recipe_count, 2)
+        self.assertEqual(UserStats.objects.get(pk=self.fan.pk).favorite_count, 1)
+
+    def test_deleted_owner_takes_the_archive_along(self):
+        self.owner.delete()
+        self.assertFalse(ArchivedRecipe.objects.exists())
+        self.assertFalse(ArchivedChild.objects.exists())
+        # the image and its rendition
+        self.assertEqual(Task.objects.count(), 2)
+
+
+@override_settings(EVENT_LOG_EAGER=True)
+class VersioningTests(TestCase):
+    """Versions are stored as checkpoints and diffs and rebuilt from them."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = CustomUser.objects.create_user('editor', 'editor@example.com', 'pass')
+        cls.category = Category.objects.create(name='Breakfast')
+        cls.recipe = Recipe.objects.create(title='Pancakes', description='Fluffy.', prep_time=5, cook_time=10,
+                                           category=cls.category, owner=cls.owner)
+        cls.ingredient = Ingredient.objects.create(recipe=cls.recipe, name='Flour', quantity='200')
+        cls.step = Step.objects.create(recipe=cls.recipe, step_number=step_order.STEP_GAP, step='Whisk.')
+
+    def setUp(self):
+        caches['default'].clear()
+        self.client.force_login(self.owner)
+
+    def test_first_edit_can_be_undone(self):
+        response = self.client.post(reverse('update_recipe', args=[self.recipe.pk, self.recipe.slug]), {
+            'title': 'Crepes', 'description': 'Thin.', 'prep_time': 5, 'prep_time_unit': 'min',
+            'cook_time': 10, 'cook_time_unit': 'min', 'spice_level': 0, 'category': self.category.pk,
+        })
+        self.assertEqual(response.status_code, 302)
+        baseline, edit = self.recipe.versions.order_by('number')
+        self.assertEqual((baseline.number, baseline.is_checkpoint, baseline.author), (1, True, None))
+        self.assertEqual(baseline.data['title'], 'Pancakes')
+        self.assertEqual(edit.data, {'s': {'title': 'Crepes', 'description': 'Thin.'}})
+
+        self.recipe.refresh_from_db()
+        self.client.post(reverse('restore_recipe_version', args=[self.recipe.pk, self.recipe.slug, 1]))
+        self.recipe.refresh_from_db()
+        self.assertEqual((self.recipe.title, self.recipe.description), ('Pancakes', 'Fluffy.'))
+        self.assertEqual(self.recipe.versions.count(), 3)
+
+    def test_diff_round_trips(self):
+        old = {'title': 'A', 'image': '', 'steps': {'1': {'step': 'Mix.', 'step_number': 1024}, '2': {'step': 'Bake.'}}}
+        new = {'title': 'B', 'cook_time': 5, 'steps': {'1': {'step': 'Stir.', 'step_number': 1024}, '3': {'step': 'Eat.'}}}
+        delta = versioning.diff(old, new)
+        self.assertEqual(delta, {'s': {'title': 'B', 'cook_time': 5}, 'd': ['image'],
+                                 'c': {'steps': {'s': {'3': {'step': 'Eat.'}}, 'd': ['2'],
+                                                 'c': {'1': {'s': {'step': 'Stir.'}}}}}})
+        self.assertEqual(versioning.apply_diff(old, delta), new)
+        self.assertEqual(versioning.apply_diff(new, versioning.diff(new, old)), old)
+        self.assertEqual(versioning.diff(new, new), {})
+
+    def edit(self, count):
+        for number in range(count):
+            Recipe.objects.filter(pk=self.recipe.pk).update(cook_time=number)
+            self.recipe.refresh_from_db()
+            versioning.record_version(self.recipe)
+
+    @override_settings(RECIPE_VERSION_CHECKPOINT_EVERY=3)
+    def test_reconstruct_across_checkpoints(self):
+        self.edit(7)
+        versions = self.recipe.versions.order_by('number')
+        self.assertEqual([v.number for v in versions if v.is_checkpoint], [1, 4, 7])
+        self.assertEqual([versioning.reconstruct(self.recipe, number)['cook_time'] for number in range(1, 8)],
+                         list(range(7)))
+        with self.assertRaises(RecipeVersion.DoesNotExist):
+            versioning.reconstruct(self.recipe, 8)
+
+    def test_reconstruct_after_the_checkpoint_interval_changed(self):
+        with self.settings(RECIPE_VERSION_CHECKPOINT_EVERY=4):
+            self.edit(6)
+        with self.settings(RECIPE_VERSION_CHECKPOINT_EVERY=3):
+            self.assertEqual(versioning.reconstruct(self.recipe, 6)['cook_time'], 5)
+            self.edit(2)
+        self.assertEqual([v.number for v in self.recipe.versions.order_by('number') if v.is_checkpoint], [1, 5, 8])
+        self.assertEqual([versioning.reconstruct(self.recipe, number)['cook_time'] for number in range(1, 9)],
+                         [0, 1, 2, 3, 4, 5, 0, 1])
+
+    def test_restore_version_recreates_children_with_their_pks(self):
+        versioning.record_version(self.recipe)
+        salt = Ingredient.objects.create(recipe=self.recipe, name='Salt', quantity='1')
+        flour, whisk = self.ingredient.pk, self.step.pk
+        self.ingredient.delete()
+        self.step.delete()
+        Step.objects.create(recipe=self.recipe, step_number=step_order.STEP_GAP, step='Pour.')
+        versioning.record_version(self.recipe)
+
+        version = versioning.restore_version(self.recipe, 1, self.owner)
+        self.assertEqual((version.number, version.author), (3, self.owner))
+        self.assertEqual(list(self.recipe.ingredients.values_list('pk', 'name')), [(flour, 'Flour')])
+        self.assertFalse(Ingredient.objects.filter(pk=salt.pk).exists())
+        self.assertEqual(list(self.recipe.steps.values_list('pk', 'step', 'step_number')),
+                         [(whisk, 'Whisk.', step_order.STEP_GAP)])
+        self.assertEqual(versioning.reconstruct(self.recipe, 3), versioning.reconstruct(self.recipe, 1))
+
+    def test_images_of_versions_are_kept_until_the_recipe_goes(self):
+        for image in ('recipe_images/old.jpg', 'recipe_images/new.jpg'):
+            Recipe.objects.filter(pk=self.recipe.pk).update(image=image)
+            self.recipe.refresh_from_db()
+            versioning.record_version(self.recipe)
+        self.assertEqual(versioning.version_images(self.recipe), {'recipe_images/old.jpg', 'recipe_images/new.jpg'})
+        self.assertFalse(Task.objects.exists())
+
+        self.recipe.delete()
+        images = {'recipe_images/old.jpg', 'recipe_images/new.jpg'}
+        deleted = {args[0] for (args,) in Task.objects.values_list('args')}
+        self.assertEqual(deleted, images | {export.rendition_name(image) for image in images})
+
+    def test_baseline_only_once(self):
+        self.assertEqual(versioning.record_baseline(self.recipe).number, 1)
+        self.assertIsNone(versioning.record_baseline(self.recipe))
+
+
+class TaskQueueTests(TestCase):
+    """Tasks are claimed once, by priority, retried with backoff and queued once per key."""
+
+    def setUp(self):
+        task_calls.clear()
+
+    def test_claims_by_priority_then_age(self):
+        low = sometimes_failing.enqueue(False)
+        high = sometimes_failing.enqueue(False, priority=5)
+        sometimes_failing.enqueue(False, delay=60)
+        claimed = task_queue.claim_next()
+        self.assertEqual((claimed.pk, claimed.status, claimed.attempts), (high.pk, Task.RUNNING, 1))
+        self.assertEqual(task_queue.claim_next().pk, low.pk)
+        # claimed ones are invisible, the delayed one is not due
+        self.assertIsNone(task_queue.claim_next())
+
+        # until the worker holding one is presumed dead
+        Task.objects.filter(pk=low.pk).update(locked_until=timezone.now() - timedelta(seconds=1))
+        reclaimed = task_queue.claim_next()
+        self.assertEqual((reclaimed.pk, reclaimed.attempts), (low.pk, 2))
+
+    def test_task_killing_its_worker_fails_after_max_attempts(self):
+        queued = sometimes_failing.enqueue(False)
+        for attempt in (1, 2):
+            self.assertEqual(task_queue.claim_next().attempts, attempt)
+            # the worker died: its claim expires
+            Task.objects.filter(pk=queued.pk).update(locked_until=timezone.now() - timedelta(seconds=1))
+        self.assertIsNone(task_queue.claim_next())
+        failed = Task.objects.get(pk=queued.pk)
+        self.assertEqual((failed.status, failed.attempts, failed.last_error),
+                         (Task.FAILED, 2, task_queue.ABANDONED_ERROR))
+        self.assertIsNotNone(failed.finished_at)
+
+    def test_expired_claim_does_not_record_outcome(self):
+        queued = sometimes_failing.enqueue(False)
+        slow = task_queue.claim_next()
+        Task.objects.filter(pk=queued.pk).update(locked_until=timezone.now() - timedelta(seconds=1))
+        again = task_queue.claim_next()
+        # the first worker finishes while the second still runs it
+        self.assertTrue(task_queue.run_task(slow))
+        self.assertEqual(Task.objects.get(pk=queued.pk).status, Task.RUNNING)
+        self.assertTrue(task_queue.run_task(again))
+        self.assertEqual(Task.objects.get(pk=queued.pk).status, Task.DONE)
+
+    def test_success(self):
+        sometimes_failing.enqueue(False)
+        self.assertEqual(task_queue.work(max_tasks=5), 1)
+        self.assertEqual(task_calls, [False])
+        self.assertEqual(Task.objects.get().status, Task.DONE)
+
+    def test_failures_are_retried_with_backoff(self):
+        queued = sometimes_failing.enqueue(True)
+        self.assertFalse(task_queue.run_task(task_queue.claim_next()))
+        retry = Task.objects.get(pk=queued.pk)
+        self.assertEqual(retry.status, Task.QUEUED)
+        self.assertIn("failed on purpose", retry.last_error)
+        # backoff ** attempts seconds later
+        self.assertAlmostEqual((retry.run_at - timezone.now()).total_seconds(), 3.0, delta=1.0)
+        self.assertIsNone(task_queue.claim_next())
+
+        Task.objects.filter(pk=queued.pk).update(run_at=timezone.now())
+        self.assertFalse(task_queue.run_task(task_queue.claim_next()))
+        failed = Task.objects.get(pk=queued.pk)
+        self.assertEqual((failed.status, failed.attempts), (Task.FAILED, 2))
+        self.assertEqual(task_calls, [True, True])
+
+    def test_idempotency_key_queues_once(self):
+        first = sometimes_failing.enqueue(False, idempotency_key='once')
+        second = sometimes_failing.enqueue(True, idempotency_key='once')
+        self.assertEqual(first.pk, second.pk)
+        self.assertEqual(Task.objects.get().args, [False])
+
+    @override_settings(TASK_ALWAYS_EAGER=True)
+    def test_eager_runs_inline(self):
+        self.assertIsNone(sometimes_failing.enqueue(False))
+        self.assertEqual(task_calls, [False])
+        self.assertFalse(Task.objects.exists())
+
+    def test_metrics_read_the_table(self):
+        sometimes_failing.enqueue(False)
+        sometimes_failing.enqueue(True)
+        task_queue.work(max_tasks=2)
+        stats = task_queue.metrics()
+        self.assertEqual(stats['depth'], {Task.QUEUED: 1, Task.RUNNING: 0, Task.DONE: 1, Task.FAILED: 0})
+        self.assertEqual(stats['done_last_window'], 1)
+
+
+class QueryAuditTests(TestCase):
+    """Plans are flagged for full table scans and sorts, not for covering index scans."""
+
+    def test_covering_index_scan_is_accepted(self):
+        sql = 'SELECT "recipe_app_recipe"."id" FROM "recipe_app_recipe" ORDER BY "recipe_app_recipe"."id"'
+        lines = ['SCAN recipe_app_recipe USING COVERING INDEX recipe_owner_updated_idx']
+        self.assertEqual(query_audit._sqlite_problems(sql, lines), (lines, []))
+        lines = ['SCAN recipe_app_recipe', 'USE TEMP B-TREE FOR ORDER BY']
+        self.assertEqual(query_audit._sqlite_problems(sql, lines)[1],
+                         [('full scan', 'recipe_app_recipe'), ('sort', 'recipe_app_recipe')])
+
+    def test_card_ingredients_are_read_in_index_order(self):
+        owner = CustomUser.objects.create_user('auditor', 'auditor@example.com', 'pass')
+        recipes = Recipe.objects.filter(owner=owner).order_by('title')
+        with CaptureQueriesContext(connection) as queries:
+            read_models.recipe_cards(recipes, with_ingredients=True)
+        _lines, problems = query_audit.explain(queries.captured_queries[-1]['sql'])
+        self.assertEqual(problems, [])
+
+
+class StaticAssetTests(SimpleTestCase):
+    """The CSS bundle keeps the rules templates use; hashed, precompressed files are served."""
+
+    CSS = """/*! license */
+@charset "UTF-8";
+.navbar, .never-used { color: red; }
+.never-used > .btn { margin: 0; }
+a:not(.never-used) { color: blue; }
+@media (min-width: 576px) {
+  .container-fluid { padding: 1rem; }
+  .never-used { display: none; }
+}
+@media print { .never-used { display: none; } }
+@font-face { font-family: "x"; src: url("x.woff2"); }
+"""
+
+    def test_purge_keeps_used_rules(self):
+        used = static_assets.used_classes()
+        # in templates/partials/navbar.html
+        self.assertTrue({'navbar', 'container-fluid', 'btn'} <= used)
+        self.assertNotIn('never-used', used)
+        self.assertEqual(static_assets.purge_css(self.CSS, used).split('\n'), [
+            '/*! license */',
+            '@charset "UTF-8";',
+            '.navbar{color: red;}',
+            'a:not(.never-used){color: blue;}',
+            '@media (min-width: 576px){.container-fluid{padding: 1rem;}}',
+            '@font-face{font-family: "x";src: url("x.woff2");}',
+        ])
+
+    def test_braces_in_strings_and_comments(self):
+        css = '.btn::after { content: "}"; } /* .never-used { } */ .never-used { content: "{"; }'
+        self.assertEqual(static_assets.purge_css(css, {'btn'}), '.btn::after{content: "}";}')
+
+    def serve(self, name, encoding=''):
+        middleware = static_assets.StaticAssetMiddleware(lambda request: HttpResponse('app'))
+        return middleware(RequestFactory().get(f"/static/{name}", HTTP_ACCEPT_ENCODING=encoding))
+
+    def test_middleware_serves_precompressed_files(self):
+        root = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        (root / 'css').mkdir()
+        bundle = root / 'css' / 'app.0123456789ab.css'
+        bundle.write_text('.navbar{color: red;}' * 50)
+        self.assertIn('gzip', static_assets.compress_file(bundle))
+
+        with self.settings(STATIC_ROOT=root, STATIC_ASSETS_SERVE=True):
+            with mock.patch.object(staticfiles_storage, 'hashed_files', {'css/app.css': 'css/app.0123456789ab.css'},
+                                   create=True):
+                response = self.serve('css/app.0123456789ab.css', 'gzip, deflate')
+                self.assertEqual((response['Content-Encoding'], response['Content-Type']), ('gzip', 'text/css'))
+                self.assertEqual(response['Cache-Control'], static_assets.IMMUTABLE)
+                self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), bundle.read_bytes())
+                response.close()
+
+                response = self.serve('css/app.0123456789ab.css')
+                self.assertFalse(response.has_header('Content-Encoding'))
+                response.close()
+            with self.assertRaises(Http404):
+                self.serve('../settings.py')
+            with self.assertRaises(Http404):
+                self.serve('css/missing.css')
+            middleware = static_assets.StaticAssetMiddleware(lambda request: HttpResponse('app'))
+            self.assertEqual(middleware(RequestFactory().get('/recipes/')).content, b'app')
+
+
+@override_settings(EVENT_LOG_EAGER=True)
+class ThrottleTests(TestCase):
+    """POSTs over the rate get a 429, the window slides, repeats replay the first response."""
+
+    def setUp(self):
+        caches['default'].clear()
+
+    def post(self, view, at):
+        request = RequestFactory().post('/favorite/', REMOTE_ADDR='10.0.0.1')
+        request.user = AnonymousUser()
+        with mock.patch.object(time, 'time', return_value=at):
+            return view(request)
+
+    def test_over_the_limit_is_429(self):
+        view = throttling.throttle(lambda request: HttpResponse('ok'), rate='2/m')
+        self.assertEqual([self.post(view, 6000).status_code for _ in range(3)], [200, 200, 429])
+        self.assertEqual(self.post(view, 6000)['Retry-After'], '60')
+
+    def test_window_slides(self):
+        view = throttling.throttle(lambda request: HttpResponse('ok'), rate='2/m')
+        # three hits in the window starting at 6000 (the third refused)
+        self.assertEqual([self.post(view, 6000).status_code for _ in range(3)], [200, 200, 429])
+        # 50s into the next window a sixth of the last one still counts: 0.5 + 1
+        self.assertEqual(self.post(view, 6110).status_code, 200)
+        # and a second hit goes over: 0.45 + 2
+        self.assertEqual(self.post(view, 6111).status_code, 429)
+        # a window later, nothing counts from the first one
+        self.assertEqual(self.post(view, 6180).status_code, 200)
+
+    def test_repeated_post_replays_the_first_response(self):
+        owner = CustomUser.objects.create_user('clicker', 'clicker@example.com', 'pass')
+        recipe = Recipe.objects.create(title='Chili', description='.', prep_time=5, cook_time=60, owner=owner)
+        self.client.force_login(owner)
+        url = reverse('add_ingredient', args=[recipe.pk, recipe.slug])
+        first = self.client.post(url, {'name': 'Beans', 'quantity': '1'})
+        repeat = self.client.post(url, {'name': 'Beans', 'quantity': '1'})
+        self.assertEqual((first.status_code, repeat.status_code), (302, 302))
+        self.assertEqual(repeat['Location'], first['Location'])
+        self.assertEqual(recipe.ingredients.count(), 1)
+        # different data is another request
+        self.client.post(url, {'name': 'Onion', 'quantity': '1'})
+        self.assertEqual(recipe.ingredients.count(), 2)
+
+
+@override_settings(DATABASE_REPLICAS=['replica'], REPLICA_PIN_SECONDS=5)
+class ReplicaRouterTests(SimpleTestCase):
+    """Reads go to the replica unless the request or its user wrote to the primary."""
+
+    def setUp(self):
+        self.router = replicas.PrimaryReplicaRouter()
+
+    def request(self, method='get', cookies=None, writes=False, model=Recipe):
+        """Run a request through ReplicaPinMiddleware; return the response and where its reads went."""
+        reads = []
+
+        def view(request):
+            reads.append(self.router.db_for_read(model))
+            if writes:
+                self.assertEqual(self.router.db_for_write(model), 'default')
+                reads.append(self.router.db_for_read(model))
+            return HttpResponse()
+
+        request = getattr(RequestFactory(), method)('/')
+        request.COOKIES.update(cookies or {})
+        # the context variables as a server thread starts them
+        response = contextvars.Context().run(replicas.ReplicaPinMiddleware(view), request)
+        return response, reads
+
+    def test_reads_go_to_the_replica(self):
+        response, reads = self.request()
+        self.assertEqual(reads, ['replica'])
+        self.assertNotIn(replicas.PIN_COOKIE, response.cookies)
+
+    def test_primary_only_models_and_transactions_read_the_primary(self):
+        self.assertEqual(self.request(model=Task)[1], ['default'])
+        with mock.patch.object(connections['default'], 'in_atomic_block', True):
+            self.assertEqual(self.request()[1], ['default'])
+
+    def test_writes_are_read_back_from_the_primary(self):
+        response, reads = self.request(method='post', writes=True)
+        self.assertEqual(reads, ['default', 'default'])
+        # a GET that writes reads the primary from then on
+        response, reads = self.request(writes=True)
+        self.assertEqual(reads, ['replica', 'default'])
+        pinned_until = float(response.cookies[replicas.PIN_COOKIE].value)
+        self.assertAlmostEqual(pinned_until, time.time() + 5, delta=2)
+
+        # the user's next requests too, until the pin expires
+        self.assertEqual(self.request(cookies={replicas.PIN_COOKIE: str(pinned_until)})[1], ['default'])
+        self.assertEqual(self.request(cookies={replicas.PIN_COOKIE: str(time.time() - 1)})[1], ['replica'])
+        self.assertEqual(self.request(cookies={replicas.PIN_COOKIE: 'garbage'})[1], ['replica'])
+
+    def test_relations_and_migrations(self):
+        self.assertTrue(self.router.allow_relation(Recipe(), CustomUser()))
+        self.assertTrue(self.router.allow_migrate('default', 'recipe_app'))
+        self.assertFalse(self.router.allow_migrate('replica', 'recipe_app'))
+
+
+class DuplicateTests(TestCase):
+    """Recipes of one owner and title are compared by shingles, merged into the richest."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = CustomUser.objects.create_user('twin', 'twin@example.com', 'pass')
+        cls.other = CustomUser.objects.create_user('stranger', 'stranger@example.com', 'pass')
+
+    @classmethod
+    def make(cls, owner, ingredients, steps, title='Lentil Soup'):
+        recipe = Recipe.objects.create(title=title, slug=slugify(title), description='.', prep_time=5, cook_time=30,
+                                       owner=owner)
+        Ingredient.objects.bulk_create(Ingredient(recipe=recipe, name=name) for name in ingredients)
+        Step.objects.bulk_create(Step(recipe=recipe, step_number=(number + 1) * step_order.STEP_GAP, step=text)
+                                 for number, text in enumerate(steps))
+        return recipe
+
+    def test_similarity(self):
+        shingles = duplicates.ingredient_shingles
+        # order, casing and punctuation do not matter
+        self.assertEqual(shingles(['Red lentils', 'Onion']), shingles(['onion', 'red  lentils!']))
+        steps = duplicates.text_shingles(['Fry the onion in oil.', 'Add the lentils and simmer.'])
+        self.assertEqual(len(steps), 8)
+        self.assertEqual(duplicates.jaccard({1, 2, 3}, {2, 3, 4}), 0.5)
+        self.assertEqual(duplicates.jaccard(set(), set()), 1.0)
+
+        a = {'ingredients': shingles(['lentils', 'onion', 'carrot', 'cumin']), 'steps': steps}
+        b = {'ingredients': shingles(['lentils', 'onion', 'carrot', 'salt']), 'steps': steps}
+        # 0.6 * 3/5 + 0.4 * 1
+        self.assertAlmostEqual(duplicates.similarity(a, b), 0.76)
+
+    def test_threshold_and_blocking(self):
+        steps = ['Fry the onion in oil.', 'Add the lentils and simmer for half an hour.']
+        rich = self.make(self.owner, ['lentils', 'onion', 'carrot', 'cumin', 'salt'], steps)
+        copy = self.make(self.owner, ['Lentils', 'Onion', 'Carrot', 'Cumin'], steps)
+        different = self.make(self.owner, ['lentils', 'bacon'], ['Boil everything.'])
+        # same content, but another owner's or another title: never compared
+        self.make(self.other, ['lentils', 'onion', 'carrot', 'cumin', 'salt'], steps)
+        self.make(self.owner, ['lentils', 'onion', 'carrot', 'cumin', 'salt'], steps, title='Lentil Stew')
+
+        # 0.6 * 4/5 + 0.4
+        self.assertEqual(list(duplicates.find_duplicates(threshold=0.88)), [[rich.pk, copy.pk]])
+        self.assertEqual(list(duplicates.find_duplicates(threshold=0.9)), [])
+        self.assertEqual(list(duplicates.find_duplicates(threshold=0.05)), [[rich.pk, copy.pk, different.pk]])
+
+    def test_merge_keeps_the_children_and_favorites(self):
+        keep = self.make(self.owner, ['lentils', 'onion'], ['Simmer.'])
+        copy = self.make(self.owner, ['lentils'], ['Simmer.'])
+        second_copy = self.make(self.owner, ['lentils'], ['Simmer.'])
+        fans = [CustomUser.objects.create_user(f"fan{n}", f"fan{n}@example.com", 'pass') for n in range(3)]
+        # fan 0 favorited the kept one and a copy, fan 1 both copies, fan 2 one copy
+        for user, recipe in ((fans[0], keep), (fans[0], copy), (fans[1], copy), (fans[1], second_copy),
+                             (fans[2], second_copy)):
+            FavoriteRecipe.objects.create(user=user, recipe=recipe)
+
+        self.assertEqual(duplicates.merge_recipes(keep.pk, [copy.pk, second_copy.pk]), 2)
+        self.assertEqual(list(Recipe.objects.filter(owner=self.owner).values_list('pk', flat=True)), [keep.pk])
+        self.assertEqual(sorted(keep.ingredients.values_list('name', flat=True)), ['lentils', 'onion'])
+        self.assertEqual(list(keep.steps.values_list('step', flat=True)), ['Simmer.'])
+        self.assertEqual(sorted(FavoriteRecipe.objects.values_list('user__username', 'recipe')),
+                         [('fan0', keep.pk), ('fan1', keep.pk), ('fan2', keep.pk)])
+
+
+class PantryTests(TestCase):
+    """The ingredient index ranks what a user can read by missing, then used ingredients."""
+
+    # (recipe id, owner id, is public, ingredient name), public first, private by owner
+    ROWS = [
+        (1, 7, True, 'Eggs'), (1, 7, True, 'Flour'), (1, 7, True, 'Milk'),
+        (2, 8, True, 'Chopped Tomatoes'), (2, 8, True, 'Eggs'),
+        (3, 7, False, 'eggs'), (3, 7, False, 'butter'),
+        (4, 8, False, 'Egg'),
+    ]
+
+    def setUp(self):
+        folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, folder, ignore_errors=True)
+        self.enterContext(override_settings(PANTRY_INDEX_DIR=folder))
+        self.folder = Path(folder)
+        # the index of another test's folder
+        pantry._index = None
+        self.addCleanup(setattr, pantry, '_index', None)
+
+    def index(self, rows=None, generation=1):
+        pantry.write_base(generation, iter(rows or self.ROWS))
+        return pantry.PantryIndex(pantry._base_path(generation))
+
+    def test_normalize(self):
+        for name, token in (('Chopped Tomatoes', 'tomato'), ('berries', 'berry'), ('EGGS', 'egg'),
+                            ('glass', 'glass'), ('hummus', 'hummus'), ('Gas', 'gas'),
+                            ('Fresh  Green Beans!', 'green bean'), ('diced', '')):
+            with self.subTest(name):
+                self.assertEqual(pantry.normalize(name), token)
+        self.assertEqual(pantry.parse_pantry("Eggs, flour;\nsmall potatoes,,"), {'egg', 'flour', 'potato'})
+
+    def test_search_ranks_what_the_user_can_read(self):
+        index = self.index()
+        self.assertEqual((len(index.doc_ids), index.public_docs), (4, 2))
+        # user 7: both public recipes and their own 3, not user 8's 4
+        self.assertEqual(index.search(frozenset({'egg', 'butter'}), 7, 10), [(3, 2, 0), (2, 1, 1), (1, 1, 2)])
+        self.assertEqual(index.search(frozenset({'egg'}), 8, 10), [(4, 1, 0), (2, 1, 1), (1, 1, 2)])
+        self.assertEqual(index.search(frozenset({'egg'}), 9, 1), [(2, 1, 1)])
+        self.assertEqual(index.search(frozenset({'caviar'}), 7, 10), [])
+
+    def test_changes_are_replayed_over_the_base(self):
+        index = self.index()
+        changes = [
+            {'id': 1, 'owner': 7, 'public': True, 'tokens': ['egg']},
+            {'id': 2},
+            {'id': 5, 'owner': 8, 'public': False, 'tokens': ['butter', 'egg']},
+        ]
+        log = pantry._log_path(1)
+        # the last line is still being written
+        log.write_text(''.join(json.dumps(change) + '\n' for change in changes) + '{"id": 3')
+        index.refresh(1)
+        index.refresh(1)
+        self.assertEqual(index.search(frozenset({'egg'}), 7, 10), [(1, 1, 0), (3, 1, 1)])
+        self.assertEqual(index.search(frozenset({'egg'}), 8, 10), [(4, 1, 0), (1, 1, 0), (5, 1, 1)])
+
+        with log.open('a') as out:
+            out.write(', "owner": 7, "public": false, "tokens": []}\n')
+        index.refresh(1)
+        self.assertEqual(index.search(frozenset({'egg'}), 7, 10), [(1, 1, 0)])
+
+    def test_build_rolls_the_generation_over(self):
+        owner = CustomUser.objects.create_user('cook', 'cook@example.com', 'pass')
+        recipe = Recipe.objects.create(title='Omelette', description='.', prep_time=5, cook_time=5, owner=owner)
+        Ingredient.objects.create(recipe=recipe, name='Eggs')
+        self.assertIsNone(pantry.search({'egg'}, owner))
+
+        self.assertEqual(pantry.build(), (1, 1, 1))
+        self.assertEqual(pantry.search({'egg'}, owner), [(recipe.pk, 1, 0)])
+        with self.captureOnCommitCallbacks(execute=True):
+            Ingredient.objects.create(recipe=recipe, name='Cheese')
+        self.assertEqual(pantry.search({'egg'}, owner), [(recipe.pk, 1, 1)])
+
+        self.assertEqual(pantry.build()[0], 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            Ingredient.objects.create(recipe=recipe, name='Ham')
+        self.assertEqual(pantry.build()[0], 3)
+        # the newest base, its log and the previous one
+        self.assertEqual(sorted(path.name for path in self.folder.iterdir()),
+                         ['base-3.idx', 'changes-2.log', 'generation'])
+        self.assertEqual(pantry.search({'egg', 'ham'}, owner), [(recipe.pk, 2, 1)])
+
+    def test_counter_fallback_matches_numpy(self):
+        if pantry.numpy is None:
+            self.skipTest("numpy is not installed")
+        rng = random.Random(7)
+        names = [f"spice {chr(97 + n)}" for n in range(20)]
+        rows = []
+        for recipe_id in range(1, 400):
+            public = recipe_id <= 150
+            owner = 0 if public else rng.randint(1, 5)
+            rows.append((public, owner, recipe_id, rng.sample(names, rng.randint(1, 8))))
+        rows.sort(key=lambda row: (not row[0], row[1], row[2]))
+        rows = [(recipe_id, owner, public, name) for public, owner, recipe_id, recipe in rows for name in recipe]
+
+        vectorized = self.index(rows)
+        with mock.patch.object(pantry, 'numpy', None):
+            fallback = pantry.PantryIndex(pantry._base_path(1))
+        for index in (vectorized, fallback):
+            index._apply({'id': 10, 'owner': 0, 'public': True, 'tokens': ['spice a']})
+        for user_id in range(0, 7):
+            pantry_tokens = rng.sample(names, 4)
+            for limit in (1, 5, 50, 1000):
+                with self.subTest(user=user_id, limit=limit):
+                    self.assertEqual(
+                        vectorized._score_vectorized(self.postings(vectorized, pantry_tokens), user_id, limit),
+                        [tuple(map(int, result)) for result in
+                         fallback._score(self.postings(fallback, pantry_tokens), user_id, limit)],
+                    )
+
+    def postings(self, index, tokens):
+        return [index.postings[start:start + count] for start, count in (index.vocabulary[token] for token in tokens)]
+
+
+class OfflineSnapshotTests(TestCase):
+    """Deltas of the offline recipe book hold what changed since the client's version."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = CustomUser.objects.create_user('traveller', 'traveller@example.com', 'pass')
+        cls.other = CustomUser.objects.create_user('host', 'host@example.com', 'pass')
+        cls.soup = Recipe.objects.create(title='Soup', description='.', prep_time=5, cook_time=20, owner=cls.owner)
+        cls.bread = Recipe.objects.create(title='Bread', description='.', prep_time=30, cook_time=40, owner=cls.owner)
+        cls.steps = [Step.objects.create(recipe=cls.bread, step_number=n * step_order.STEP_GAP, step=f"Step {n}.")
+                     for n in (1, 2, 3)]
+        cls.pie = Recipe.objects.create(title='Pie', description='.', prep_time=20, cook_time=50, owner=cls.other)
+        cls.tart = Recipe.objects.create(title='Tart', description='.', prep_time=20, cook_time=50, owner=cls.other)
+        FavoriteRecipe.objects.create(user=cls.owner, recipe=cls.pie)
+
+    def setUp(self):
+        # the client's copy is a minute old, the recipes older still
+        Recipe.objects.update(updated_at=timezone.now() - timedelta(hours=1))
+        FavoriteRecipe.objects.update(added_on=timezone.now() - timedelta(hours=1))
+        self.since = timezone.now() - timedelta(minutes=1)
+
+    def delta(self):
+        data = offline.snapshot(self.owner, self.since)
+        self.assertFalse(data['full'])
+        return data
+
+    def test_full_and_unchanged(self):
+        data = offline.snapshot(self.owner)
+        self.assertTrue(data['full'])
+        self.assertEqual([recipe['title'] for recipe in data['recipes']], ['Bread', 'Pie', 'Soup'])
+        self.assertEqual(data['favorites'], [self.pie.pk])
+        delta = self.delta()
+        self.assertEqual(delta['recipes'], [])
+        self.assertEqual(delta['ids'], [self.soup.pk, self.bread.pk, self.pie.pk])
+
+    def test_child_edit_is_sent(self):
+        Ingredient.objects.create(recipe=self.pie, name='Apples', quantity='4')
+        self.assertEqual([(r['title'], r['ingredients']) for r in self.delta()['recipes']],
+                         [('Pie', [['Apples', '4', '']])])
+
+    def test_reorder_is_sent(self):
+        first, second, third = self.steps
+        step_order.reorder(self.bread, [third.pk, first.pk, second.pk])
+        recipes = self.delta()['recipes']
+        self.assertEqual([r['title'] for r in recipes], ['Bread'])
+        self.assertEqual(recipes[0]['steps'], [[1, 'Step 3.'], [2, 'Step 1.'], [3, 'Step 2.']])
+
+    def test_favorite_and_deletions(self):
+        FavoriteRecipe.objects.create(user=self.owner, recipe=self.tart)
+        FavoriteRecipe.objects.filter(recipe=self.pie).delete()
+        self.soup.delete()
+        delta = self.delta()
+        # the tart has not changed in an hour, it was favorited
+        self.assertEqual([r['title'] for r in delta['recipes']], ['Tart'])
+        self.assertEqual(delta['ids'], [self.bread.pk, self.tart.pk])
+        self.assertEqual(delta['favorites'], [self.tart.pk])
+
+    def test_view(self):
+        self.client.force_login(self.owner)
+        step = self.steps[0]
+        step.step = 'Knead.'
+        step.save()
+        response = self.client.get(reverse('offline_snapshot'), {'since': offline.version_of(self.since)})
+        self.assertEqual(response['Cache-Control'], 'private, no-cache')
+        self.assertEqual([r['steps'][0] for r in response.json()['recipes']], [[1, 'Knead.']])
+        self.assertTrue(self.client.get(reverse('offline_snapshot'), {'since': 'bad'}).json()['full'])
+
+
+class PublicCacheTests(TestCase):
+    """Public recipe pages are cacheable by anyone and purged by tag when the recipe changes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = CustomUser.objects.create_user('sharer', 'sharer@example.com', 'pass')
+        cls.recipe = Recipe.objects.create(title='Shared Salad', description='Crisp.', prep_time=10, cook_time=0,
+                                           owner=cls.owner, is_public=True)
+        cls.url = reverse('public_recipe', args=[cls.recipe.pk, cls.recipe.slug])
+
+    def setUp(self):
+        caches['default'].clear()
+
+    def test_anonymous_page_is_public(self):
+        response = self.client.get(self.url)
+        self.assertContains(response, 'Shared Salad')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=300, s-maxage=86400')
+        self.assertEqual(response['Surrogate-Key'], public_cache.recipe_tag(self.recipe.pk))
+        self.assertEqual(response.cookies, {})
+        self.assertNotIn('cookie', response.get('Vary', '').lower())
+
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(public_cache.stats(), {'hits': 1, 'misses': 1, 'hit_rate': 0.5})
+
+        private = Recipe.objects.create(title='Secret', description='.', prep_time=1, cook_time=1, owner=self.owner)
+        self.assertEqual(self.client.get(reverse('public_recipe', args=[private.pk, private.slug])).status_code, 404)
+
+    @override_settings(PUBLIC_CACHE_PURGE_HOOKS=['recipe_app.tests.purge_hook'])
+    def test_edits_purge_the_page(self):
+        self.client.get(self.url)
+        Ingredient.objects.create(recipe=self.recipe, name='Cucumber', quantity='1')
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertContains(response, 'Cucumber')
+        # the purge is forwarded to the hooks in the background
+        task_calls.clear()
+        self.assertEqual(task_queue.work(max_tasks=5), 1)
+        self.assertEqual(task_calls, [[public_cache.recipe_tag(self.recipe.pk)]])
+
+        self.client.get(self.url)
+        self.recipe.description = 'Crisp and cold.'
+        self.recipe.save()
+        self.assertEqual(self.client.get(self.url)['X-Cache'], 'MISS')
+
+    def test_query_strings_share_the_entry(self):
+        cache = caches['default']
+        self.client.get(self.url)
+        self.client.get(self.url)
+        entries = len(cache._cache)
+        for n in range(5):
+            self.assertEqual(self.client.get(self.url, {'utm_source': n})['X-Cache'], 'HIT')
+        # one version per tag, however many urls were served
+        self.assertEqual(len(cache._cache), entries)
+        self.assertIsInstance(cache.get(f"public_cache:tag:{public_cache.recipe_tag(self.recipe.pk)}"), str)
+
+        with override_settings(PUBLIC_CACHE_QUERY_PARAMS=['lang']):
+            self.assertEqual(self.client.get(self.url, {'utm_source': 1})['X-Cache'], 'HIT')
+            self.assertEqual(self.client.get(self.url, {'lang': 'fr'})['X-Cache'], 'MISS')
+            self.assertEqual(self.client.get(self.url, {'lang': 'fr', 'utm_source': 1})['X-Cache'], 'HIT')
+
+    def test_evicted_tag_counts_as_purged(self):
+        self.client.get(self.url)
+        caches['default'].delete(f"public_cache:tag:{public_cache.recipe_tag(self.recipe.pk)}")
+        self.assertEqual(self.client.get(self.url)['X-Cache'], 'MISS')
+        self.assertEqual(self.client.get(self.url)['X-Cache'], 'HIT')
+
+
+class ExportTests(TestCase):
+    """Cookbooks are written chapter by chapter, as HTML or as a PDF with a valid cross-reference table."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = CustomUser.objects.create_user('author', 'author@example.com', 'pass')
+        soups = Category.objects.create(name='Soups')
+        cls.recipes = [
+            Recipe.objects.create(title=title, description='Good (really).', prep_time=5, cook_time=20,
+                                  category=category, owner=cls.owner, image=image)
+            for title, category, image in (('Miso Soup', soups, 'recipe_images/bowl.jpg'),
+                                           ('Onion Soup', soups, 'recipe_images/bowl.jpg'),
+                                           ('Toast', None, ''))
+        ]
+        for recipe in cls.recipes:
+            Ingredient.objects.create(recipe=recipe, name='Water', quantity='1')
+            Step.objects.create(recipe=recipe, step_number=step_order.STEP_GAP, step='Heat it. ' * 40)
+
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        self.enterContext(override_settings(MEDIA_ROOT=media))
+        picture = io.BytesIO()
+        Image.new('RGB', (1200, 800), 'orange').save(picture, 'JPEG')
+        default_storage.save('recipe_images/bowl.jpg', picture)
+
+    def book(self, fmt):
+        chunks = export.chunks(fmt, self.owner, 'book', export.export_queryset(self.owner, 'book'))
+        return ''.join(chunks) if fmt == 'html' else b''.join(chunks)
+
+    def test_html(self):
+        html = self.book('html')
+        self.assertIn('author&#x27;s Recipe Book', html)
+        positions = [html.index(text) for text in ('Uncategorized', 'Toast', 'Soups', 'Miso Soup', 'Onion Soup')]
+        self.assertEqual(positions, sorted(positions))
+        self.assertEqual(html.count('data:image/jpeg;base64,'), 2)
+        # the rendition is made once and kept
+        with default_storage.open(export.rendition_name('recipe_images/bowl.jpg')) as rendition:
+            self.assertEqual(Image.open(rendition).size, (480, 320))
+
+    def test_pdf_cross_references(self):
+        data = self.book('pdf')
+        self.assertTrue(data.startswith(b'%PDF-1.4'))
+        self.assertTrue(data.endswith(b'%%EOF\n'))
+        xref = int(re.search(rb'startxref\n(\d+)\n%%EOF\n$', data).group(1))
+        self.assertTrue(data[xref:].startswith(b'xref\n0 '))
+        size = int(re.search(rb'/Size (\d+)', data[xref:]).group(1))
+        entries = re.findall(rb'(\d{10}) (\d{5}) ([nf]) \n', data[xref:])
+        self.assertEqual(len(entries), size)
+        for obj_id, (offset, _generation, kind) in enumerate(entries):
+            if kind == b'n':
+                self.assertTrue(data[int(offset):].startswith(b'%d 0 obj\n' % obj_id), obj_id)
+        self.assertEqual(sum(kind == b'n' for _offset, _generation, kind in entries), size - 1)
+
+        # title page, two chapter pages, three recipes; one image shared by two of them
+        self.assertIn(b'/Type /Pages /Kids', data)
+        self.assertEqual(re.search(rb'/Count (\d+)', data).group(1), b'6')
+        self.assertEqual(data.count(b'/Subtype /Image'), 1)
+        self.assertIn(pdf._literal('Good (really).'), zlib.decompress(self.page_stream(data, 'Miso Soup')))
+
+    def page_stream(self, data, title):
+        for stream in re.findall(rb'/FlateDecode >>\nstream\n(.*?)\nendstream', data, re.DOTALL):
+            if pdf._literal(title) in zlib.decompress(stream):
+                return stream
+        self.fail(f"No page with {title}")
+
+
+class EventLogTests(TestCase):
+    """Events wait in the buffer until a flush writes them in one batch; pruning drops whole old days."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = CustomUser.objects.create_user('cook', 'cook@example.com', 'pass')
+        cls.recipe = Recipe.objects.create(title='Stew', description='Slow.', prep_time=5, cook_time=90,
+                                           owner=cls.owner)
+
+    def setUp(self):
+        # a buffer of this process whose flusher never starts: the test flushes it
+        self.buffer = events.EventBuffer()
+        self.buffer.pid = os.getpid()
+        self.enterContext(mock.patch.object(events, 'buffer', self.buffer))
+        self.log_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.log_dir, ignore_errors=True)
+
+    def test_buffered_until_flushed(self):
+        with self.assertNumQueries(0):
+            events.record(self.owner, Event.UPDATE, self.recipe, fields=['title'])
+            events.record(self.owner, Event.FAVORITE, self.recipe)
+        self.assertFalse(Event.objects.exists())
+        # not written yet, but already in the recipe's feed
+        self.assertEqual([event.action for event in events.recipe_feed(self.recipe.pk)],
+                         [Event.FAVORITE, Event.UPDATE])
+
+        with self.assertNumQueries(1):
+            self.buffer.flush()
+        self.assertEqual(self.buffer.snapshot(), [])
+        logged = Event.objects.order_by('pk')
+        self.assertEqual([(event.action, event.actor_id, event.label, event.data) for event in logged],
+                         [(Event.UPDATE, self.owner.pk, 'Stew', {'fields': ['title']}),
+                          (Event.FAVORITE, self.owner.pk, 'Stew', {})])
+        with self.assertNumQueries(0):
+            self.buffer.flush()
+
+    @override_settings(EVENT_LOG_BATCH_SIZE=2)
+    def test_full_buffer_wakes_the_flusher(self):
+        events.record(self.owner, Event.UPDATE, self.recipe)
+        self.assertFalse(self.buffer.wakeup.is_set())
+        events.record(self.owner, Event.UPDATE, self.recipe)
+        self.assertTrue(self.buffer.wakeup.is_set())
+
+    def test_flush_to_daily_files(self):
+        with override_settings(EVENT_LOG_SINK='jsonl', EVENT_LOG_DIR=self.log_dir):
+            events.record(self.owner, Event.CREATE, self.recipe)
+            self.buffer.flush()
+            self.assertEqual([event.action for event in events.recipe_feed(self.recipe.pk)], [Event.CREATE])
+        self.assertFalse(Event.objects.exists())
+        day_file = Path(self.log_dir) / f"{timezone.now():%Y-%m-%d}.jsonl"
+        self.assertEqual(json.loads(day_file.read_text())['label'], 'Stew')
+
+    def test_feed_reads_only_the_files_it_needs(self):
+        now = timezone.now()
+        with override_settings(EVENT_LOG_SINK='jsonl', EVENT_LOG_DIR=self.log_dir, EVENT_LOG_FEED_DAYS=30):
+            events.write([{'created_at': now - timedelta(days=days_ago), **events.actor(self.owner),
+                           'action': Event.UPDATE, **events.describe(self.recipe), 'data': {'days_ago': days_ago}}
+                          for days_ago in (0, 2, 40)])
+            with mock.patch.object(events, '_read_day', wraps=events._read_day) as read_day:
+                feed = events.recipe_feed(self.recipe.pk)
+                self.assertEqual([event.data['days_ago'] for event in feed], [0, 2])
+                self.assertEqual(read_day.call_count, 2)
+                read_day.reset_mock()
+                self.assertEqual(len(events.recipe_feed(self.recipe.pk, limit=1)), 1)
+                self.assertEqual(read_day.call_count, 1)
+
+    def test_prune_rows(self):
+        now = timezone.now()
+        for days_ago in (1, 9, 11, 30):
+            events.write([{'created_at': now - timedelta(days=days_ago), **events.actor(self.owner),
+                           'action': Event.UPDATE, **events.describe(self.recipe), 'data': {}}])
+        with mock.patch.object(events, 'PRUNE_BATCH', 1):
+            self.assertEqual(events.prune(10), 2)
+        self.assertEqual(Event.objects.count(), 2)
+        out = io.StringIO()
+        call_command('prune_events', days=5, stdout=out)
+        self.assertIn("Removed 1 events older than 5 days.", out.getvalue())
+        self.assertEqual(Event.objects.get().created_at, now - timedelta(days=1))
+
+    def test_prune_files(self):
+        with override_settings(EVENT_LOG_SINK='jsonl', EVENT_LOG_DIR=self.log_dir):
+            now = timezone.now()
+            events.write([{'created_at': now - timedelta(days=days_ago), **events.actor(self.owner),
+                           'action': Event.UPDATE, **events.describe(self.recipe), 'data': {}}
+                          for days_ago in (0, 20, 20, 40)])
+            Path(self.log_dir, 'notes.jsonl').write_text('{}\n')
+            self.assertEqual(events.prune(10), 3)
+        self.assertEqual(sorted(path.name for path in Path(self.log_dir).iterdir()),
+                         sorted([f"{now:%Y-%m-%d}.jsonl", 'notes.jsonl']))
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'wizard-default'},
+            'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'wizard-shared'}},
+    WIZARD_CACHE_ALIAS='shared', WIZARD_STORAGE_TIMEOUT=60, EVENT_LOG_EAGER=True,
+)
+class WizardStorageTests(TestCase):
+    """Wizard steps live in the shared cache, one entry per user, gone when finished or abandoned."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.cook = CustomUser.objects.create_user('wizard', 'wizard@example.com', 'pass')
+        cls.other = CustomUser.objects.create_user('bystander', 'bystander@example.com', 'pass')
+
+    def setUp(self):
+        caches['shared'].clear()
+        temp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp, ignore_errors=True)
+        self.file_storage = FileSystemStorage(location=temp)
+
+    def storage(self, user):
+        request = RequestFactory().get('/')
+        request.user = user
+        request.session = SessionStore()
+        return CacheStorage('wiz_form', request, self.file_storage)
+
+    def started(self, user):
+        storage = self.storage(user)
+        storage.current_step = 'ingredients'
+        storage.set_step_data('recipe', {'recipe-title': ['Soup']})
+        storage.set_step_files('recipe', {'recipe-image': SimpleUploadedFile('soup.jpg', b'jpeg', 'image/jpeg')})
+        storage.update_response(HttpResponse())
+        return storage
+
+    def test_steps_persist_across_requests(self):
+        self.started(self.cook)
+        storage = self.storage(self.cook)
+        self.assertEqual(storage.current_step, 'ingredients')
+        self.assertEqual(storage.get_step_data('recipe')['recipe-title'], 'Soup')
+        image = storage.get_step_files('recipe')['recipe-image']
+        self.assertEqual((image.name, image.read()), ('soup.jpg', b'jpeg'))
+        image.close()
+
+    def test_entries_per_user_and_session(self):
+        started = self.started(self.cook)
+        other = self.storage(self.other)
+        self.assertNotEqual(other.cache_key, started.cache_key)
+        self.assertIsNone(other.current_step)
+        self.assertIsNone(other.get_step_data('recipe'))
+        # anonymous visitors are told apart by their session
+        first, second = self.storage(AnonymousUser()), self.storage(AnonymousUser())
+        self.assertTrue(first.cache_key.startswith('wizard_wiz_form:session_'))
+        self.assertNotEqual(first.cache_key, second.cache_key)
+
+    def test_reset_deletes_entry_and_files(self):
+        storage = self.started(self.cook)
+        tmp_name = storage.data[storage.step_files_key]['recipe']['recipe-image']['tmp_name']
+        storage.reset()
+        storage.update_response(HttpResponse())
+        self.assertIsNone(caches['shared'].get(storage.cache_key))
+        self.assertFalse(self.file_storage.exists(tmp_name))
+
+    def test_abandoned_wizard_expires(self):
+        now = time.time()
+        storage = self.started(self.cook)
+        with mock.patch('time.time', return_value=now + 59):
+            self.assertIsNotNone(caches['shared'].get(storage.cache_key))
+        with mock.patch('time.time', return_value=now + 61):
+            self.assertIsNone(caches['shared'].get(storage.cache_key))
+
+    def test_done_deletes_entry(self):
+        category = Category.objects.create(name='Soups')
+        measure = IngreadientMeasure.objects.create(measure='cup')
+        self.client.force_login(self.cook)
+        url = reverse('create_recipe')
+        self.client.get(url)
+        self.client.post(url, {'wiz_form-current_step': 'recipe', 'recipe-title': 'Wizard Soup',
+                               'recipe-description': 'Hot.', 'recipe-prep_time': 10, 'recipe-prep_time_unit': 'min',
+                               'recipe-cook_time': 20, 'recipe-cook_time_unit': 'min', 'recipe-spice_level': 1,
+                               'recipe-category': category.pk})
+        key = f"wizard_wiz_form:user_{self.cook.pk}"
+        self.assertEqual(caches['shared'].get(key)['step'], 'ingredients')
+        self.client.post(url, {'wiz_form-current_step': 'ingredients', 'ingredients-name': 'Salt',
+                               'ingredients-quantity': 1, 'ingredients-measure': measure.pk})
+        response = self.client.post(url, {'wiz_form-current_step': 'steps', 'steps-step': 'Cook it.'})
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(Recipe.objects.filter(title='Wizard Soup').exists())
+        self.assertIsNone(caches['shared'].get(key))
+
+
+# not in a transaction: the loading pragmas cannot be set inside one
+class SeedTests(TransactionTestCase):
+    """Seeding makes the planned rows, the same ones for the same seed, and adds to what is there."""
+
+    def seed(self, seed=7):
+        call_command('seed_chef', rows=1000, seed=seed, processes=1, stdout=io.StringIO())
+
+    def counts(self):
+        return [model.objects.count() for model in (CustomUser, Recipe, Ingredient, Step, FavoriteRecipe)]
+
+    def snapshot(self):
+        return (list(CustomUser.objects.order_by('pk').values_list('pk', 'username', 'first_name', 'joined_at')),
+                list(Recipe.objects.order_by('pk').values_list('pk', 'title', 'slug', 'owner_id', 'category__name',
+                                                                 'updated_at')),
+                list(Ingredient.objects.order_by('pk').values_list('recipe_id', 'name', 'quantity',
+                                                                   'measure__measure')),
+                list(Step.objects.order_by('pk').values_list('recipe_id', 'step_number', 'step')),
+                list(FavoriteRecipe.objects.order_by('pk').values_list('user_id', 'recipe_id', 'added_on')))
+
+    def test_rows_per_model(self):
+        self.seed()
+        users, recipes, ingredients, steps, favorites = self.counts()
+        self.assertEqual((users, recipes), seeding.plan(1000))
+        self.assertTrue(3 * recipes <= ingredients <= 14 * recipes)
+        self.assertTrue(2 * recipes <= steps <= 9 * recipes)
+        self.assertTrue(favorites <= 16 * users)
+        self.assertEqual(Category.objects.count(), len(seeding.CATEGORIES))
+        self.assertEqual(IngreadientMeasure.objects.count(), len(seeding.MEASURES))
+        self.assertEqual(Step.objects.filter(step_number__lt=step_order.STEP_GAP).count(), 0)
+
+    def test_same_seed_same_data(self):
+        self.seed()
+        first = self.snapshot()
+        CustomUser.objects.all().delete()
+        self.assertEqual(self.counts(), [0] * 5)
+        self.seed()
+        self.assertEqual(self.snapshot(), first)
+        CustomUser.objects.all().delete()
+        self.seed(seed=8)
+        self.assertNotEqual(self.snapshot()[1], first[1])
+
+    def test_second_run_adds_new_rows(self):
+        self.seed()
+        once = self.counts()
+        categories = list(Category.objects.order_by('pk').values_list('pk', flat=True))
+        self.seed()
+        self.assertEqual(self.counts(), [2 * count for count in once])
+        self.assertEqual(list(Category.objects.order_by('pk').values_list('pk', flat=True)), categories)
+        self.assertEqual(CustomUser.objects.values('username').distinct().count(), 2 * once[0])
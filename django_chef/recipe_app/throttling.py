@@ -0,0 +1,121 @@
+"""
+Rate limiting and request coalescing for write endpoints.
+
+Wrap a view in ``urls.py`` with ``throttle(view, rate='30/m', coalesce=2)``:
+
+* ``coalesce`` collapses identical POSTs (same user, URL and form data)
+  arriving within that many seconds: the first one runs, the repeats wait for
+  it and get the same redirect without touching the database. A double-click
+  on "favorite" therefore toggles once.
+* ``rate`` caps the remaining POSTs per user (or per IP for anonymous users)
+  for that URL name, using a sliding window counter kept in the cache; extra
+  requests get a 429 with ``Retry-After``.
+
+Counters live in ``THROTTLE_CACHE_ALIAS``; with a per-process cache the limits
+apply per process.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse, HttpResponseRedirect
+
+KEY_PREFIX = 'throttle'
+UNITS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 60 * 60 * 24}
+COALESCE_POLL = 0.05
+IN_FLIGHT = 'in-flight'
+
+
+def get_cache():
+    return caches[getattr(settings, 'THROTTLE_CACHE_ALIAS', 'default')]
+
+
+def parse_rate(rate):
+    """``'30/m'`` -> ``(30, 60)``, ``'5/10s'`` -> ``(5, 10)``."""
+    limit, _, period = rate.partition('/')
+    multiplier, unit = period[:-1] or '1', period[-1]
+    return int(limit), int(multiplier) * UNITS[unit]
+
+
+def _client_id(request):
+    if request.user.is_authenticated:
+        return f"user-{request.user.pk}"
+    return f"ip-{request.META.get('REMOTE_ADDR', '')}"
+
+
+# rate limiting
+def allow(key, limit, period):
+    """Count a hit for ``key``; False if it exceeds ``limit`` per ``period`` seconds.
+
+    Sliding window approximation: the previous fixed window is weighted by
+    how much of it still overlaps the last ``period`` seconds.
+    """
+    cache = get_cache()
+    now = time.time()
+    window = int(now // period)
+    current_key = f"{KEY_PREFIX}:{key}:{window}"
+    # add() is a no-op if the counter already exists
+    cache.add(current_key, 0, period * 2)
+    current = cache.incr(current_key)
+    previous = cache.get(f"{KEY_PREFIX}:{key}:{window - 1}", 0)
+    overlap = 1 - (now % period) / period
+    return previous * overlap + current <= limit
+
+
+# coalescing
+def _fingerprint(request):
+    data = sorted((key, request.POST.getlist(key)) for key in request.POST if key != 'csrfmiddlewaretoken')
+    files = sorted((key, f.name, f.size) for key, f in request.FILES.items())
+    return hashlib.md5(repr((request.path, data, files)).encode()).hexdigest()
+
+
+def _wait_for(cache, key, timeout):
+    """Return the first request's redirect location once it has one, else None."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        result = cache.get(key)
+        if result is None:
+            return None
+        if result != IN_FLIGHT:
+            return result
+        time.sleep(COALESCE_POLL)
+    return None
+
+
+def throttle(view, rate=None, coalesce=None, methods=('POST',)):
+    """Rate limit and/or coalesce ``methods`` requests to ``view``."""
+    limit, period = parse_rate(rate) if rate else (None, None)
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method not in methods or not getattr(settings, 'THROTTLE_ENABLED', True):
+            return view(request, *args, **kwargs)
+
+        name = request.resolver_match.url_name if request.resolver_match else request.path
+        client = _client_id(request)
+        cache = get_cache()
+        key = f"{KEY_PREFIX}:coalesce:{name}:{client}:{_fingerprint(request)}"
+        # repeats are answered before counting, they never reach the database
+        if coalesce and not cache.add(key, IN_FLIGHT, coalesce):
+            location = _wait_for(cache, key, coalesce)
+            if location is not None:
+                return HttpResponseRedirect(location)
+
+        if limit is not None and not allow(f"{name}:{client}", limit, period):
+            cache.delete(key)
+            response = HttpResponse("Too many requests, please slow down.", status=429, content_type='text/plain')
+            response['Retry-After'] = str(period)
+            return response
+
+        response = view(request, *args, **kwargs)
+        if coalesce:
+            if 300 <= response.status_code < 400 and response.has_header('Location'):
+                # repeats inside the window get the same redirect
+                cache.set(key, response['Location'], coalesce)
+            else:
+                cache.delete(key)
+        return response
+
+    return wrapper
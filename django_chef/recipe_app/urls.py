@@ -7,21 +7,31 @@ from .views import (CreateCategory, ListCategories, UpdateCategories, DelCategor
                     CreateMeasurement, ListMeasurement, UpdateMeasurement, DelMeasurement,
                     ReadRecipe, UpdateRecipe, DelRecipe, CreateIngredient, UpdateIngredient, DelIngredient,
                     CreateInstruction, Updateinstruction, DelInstruction, FavoriteListView, ToggleFavoriteView)
+from .views import (RecipeHistory, ReadRecipeVersion, RestoreRecipeVersion, RecipeActivity, PublicRecipe)
+from .views import (OfflineSnapshot, ServiceWorker, WebManifest, OfflineShell, ExportCookbook, PantrySearch)
+from .views import ReorderInstructions
+from .throttling import throttle
+
+# write endpoints: POSTs per user per window, and seconds in which identical POSTs
+# (double-clicks, resubmits) share the first one's result (see throttling.py).
+# the wizard is only rate limited: a resubmitted last step finds its storage reset anyway
+FAVORITE_LIMITS = {'rate': '30/m', 'coalesce': 2}
+CREATE_LIMITS = {'rate': '60/m', 'coalesce': 5}
 
 urlpatterns = [
     path('', HomePageView.as_view(), name='home'),
     path('register_to_django_chef/', UserRegisterView.as_view(), name='register'),
-    path('create_recipe/', WizForm.as_view(), name='create_recipe'),
+    path('create_recipe/', throttle(WizForm.as_view(), rate=CREATE_LIMITS['rate']), name='create_recipe'),
     path('login/', UserLoginView.as_view(), name='login'),
     path('my_account/', CustomUserDetails.as_view(), name='account'),
     path('update_account/', CustomUserDetailUpdateView.as_view(), name='update_account'),
     path('delete_account/', DelUserView.as_view(), name='delete_account'),
     path('logout/', UserLogOutView.as_view(), name='logout'),
-    path('create_category/', CreateCategory.as_view(), name='create_category'),
+    path('create_category/', throttle(CreateCategory.as_view(), **CREATE_LIMITS), name='create_category'),
     path('list_category/', ListCategories.as_view(), name='list_category'),
     path('update_category/<int:pk>/', UpdateCategories.as_view(), name='update_category'),
     path('delete_category/<int:pk>/', DelCategory.as_view(), name='delete_category'),
-    path('create_measurement/', CreateMeasurement.as_view(), name='create_measurement'),
+    path('create_measurement/', throttle(CreateMeasurement.as_view(), **CREATE_LIMITS), name='create_measurement'),
     path('list_measurement/', ListMeasurement.as_view(), name='list_measurement'),
     path('update_measurement/<int:pk>/', UpdateMeasurement.as_view(), name='update_measurement'),
     path('delete_measurement/<int:pk>/', DelMeasurement.as_view(), name='delete_measurement'),
@@ -29,13 +39,25 @@ urlpatterns = [
     path('recipe/id_<int:pk>/<slug:slug>/read/', ReadRecipe.as_view(), name='read_recipe'),
     path('update_recipe/id_<int:pk>/<slug:slug>/', UpdateRecipe.as_view(), name='update_recipe'),
     path('recipe/id_<int:pk>/<slug:slug>/delete/', DelRecipe.as_view(), name='delete_recipe'),
-    path('add_ingredient/id_<int:pk>/<slug:slug>/', CreateIngredient.as_view(), name='add_ingredient'),
+    path('shared/recipe/id_<int:pk>/<slug:slug>/', PublicRecipe.as_view(), name='public_recipe'),
+    path('recipe/id_<int:pk>/<slug:slug>/history/', RecipeHistory.as_view(), name='recipe_history'),
+    path('recipe/id_<int:pk>/<slug:slug>/history/v<int:number>/', ReadRecipeVersion.as_view(), name='read_recipe_version'),
+    path('recipe/id_<int:pk>/<slug:slug>/history/v<int:number>/restore/', RestoreRecipeVersion.as_view(), name='restore_recipe_version'),
+    path('recipe/id_<int:pk>/<slug:slug>/activity/', RecipeActivity.as_view(), name='recipe_activity'),
+    path('add_ingredient/id_<int:pk>/<slug:slug>/', throttle(CreateIngredient.as_view(), **CREATE_LIMITS), name='add_ingredient'),
     path('update_ingredient/id_<int:pk>/<slug:slug>/update/', UpdateIngredient.as_view(), name='update_ingredient'),
     path('ingredient/id_<int:pk>/<slug:slug>/delete/', DelIngredient.as_view(), name='delete_ingredient'),
-    path('add_instruction/id_<int:pk>/<slug:slug>/', CreateInstruction.as_view(), name='add_instruction'),
+    path('add_instruction/id_<int:pk>/<slug:slug>/', throttle(CreateInstruction.as_view(), **CREATE_LIMITS), name='add_instruction'),
     path('update_instruction/id_<int:pk>/<slug:slug>/', Updateinstruction.as_view(), name='update_instruction'),
     path('delete_instruction/id_<int:pk>/<slug:slug>/', DelInstruction.as_view(), name='delete_instruction'),
-    path('recipe/id_<int:pk>/favorite/', ToggleFavoriteView.as_view(), name='toggle_favorite'),
+    path('recipe/id_<int:pk>/<slug:slug>/steps/order/', ReorderInstructions.as_view(), name='reorder_instructions'),
+    path('recipe/id_<int:pk>/favorite/', throttle(ToggleFavoriteView.as_view(), **FAVORITE_LIMITS), name='toggle_favorite'),
     path('favorite_recipes/<str:username>s_fav_recipes/', FavoriteListView.as_view(), name='favorites_list'),
+    path('what_can_i_cook/', PantrySearch.as_view(), name='pantry_search'),
+    path('sw.js', ServiceWorker.as_view(), name='service_worker'),
+    path('manifest.webmanifest', WebManifest.as_view(), name='web_manifest'),
+    path('offline/', OfflineShell.as_view(), name='offline_shell'),
+    path('offline/snapshot.json', OfflineSnapshot.as_view(), name='offline_snapshot'),
+    path('export/<str:scope>/<str:fmt>/', ExportCookbook.as_view(), name='export_cookbook'),
     # path('create_recipe/', RecipeWizard.as_view([RecipeForm, IngredientsForm, StepsForm]), name='create_recipe'),
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
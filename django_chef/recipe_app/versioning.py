@@ -0,0 +1,200 @@
+"""
+Recipe revision history.
+
+A recipe "aggregate" is the recipe row plus its ingredients and steps. Every
+save stores a compact JSON diff against the previous version, and every
+``RECIPE_VERSION_CHECKPOINT_EVERY`` versions a full snapshot (checkpoint) is
+stored instead, so rebuilding any version never needs more than that many
+diff applications.
+
+Versions are recorded after each save. A recipe that has none yet (created
+before versioning, seeded or imported) gets its unedited state stored first
+by ``record_baseline``, so its first edit can be undone too. An image a
+version refers to is kept until the recipe is deleted (``version_images``),
+so restoring that version brings it back.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Subquery
+
+from .models import Recipe, Ingredient, Step, RecipeVersion, Category, IngreadientMeasure
+from .step_order import STEP_GAP
+
+RECIPE_FIELDS = [
+    'title', 'description', 'prep_time', 'prep_time_unit', 'cook_time',
+    'cook_time_unit', 'spice_level', 'category_id', 'image',
+]
+
+
+def checkpoint_every():
+    return getattr(settings, 'RECIPE_VERSION_CHECKPOINT_EVERY', 10)
+
+
+# snapshot / diff helpers
+def snapshot(recipe):
+    """Return the full JSON-able state of a recipe with its children."""
+    data = {field: getattr(recipe, field) for field in RECIPE_FIELDS}
+    data['image'] = recipe.image.name if recipe.image else ''
+    data['ingredients'] = {
+        str(ing.pk): {'name': ing.name, 'quantity': ing.quantity, 'measure_id': ing.measure_id}
+        for ing in recipe.ingredients.all()
+    }
+    data['steps'] = {
+        str(step.pk): {'step_number': step.step_number, 'step': step.step}
+        for step in recipe.steps.all()
+    }
+    return data
+
+
+def diff(old, new):
+    """Return a compact delta turning ``old`` into ``new`` (both dicts).
+
+    ``s`` holds keys to set, ``d`` keys to delete and ``c`` nested deltas for
+    keys whose values are both dicts. Empty parts are left out.
+    """
+    delta = {}
+    changed = {}
+    nested = {}
+    for key, value in new.items():
+        if key not in old:
+            changed[key] = value
+        elif old[key] != value:
+            if isinstance(value, dict) and isinstance(old[key], dict):
+                nested[key] = diff(old[key], value)
+            else:
+                changed[key] = value
+    removed = [key for key in old if key not in new]
+    if changed:
+        delta['s'] = changed
+    if removed:
+        delta['d'] = removed
+    if nested:
+        delta['c'] = nested
+    return delta
+
+
+def apply_diff(base, delta):
+    """Return a new dict with ``delta`` (from ``diff``) applied to ``base``."""
+    result = dict(base)
+    for key in delta.get('d', []):
+        result.pop(key, None)
+    result.update(delta.get('s', {}))
+    for key, child in delta.get('c', {}).items():
+        result[key] = apply_diff(result.get(key, {}), child)
+    return result
+
+
+def image_of(data):
+    """The image name a version's stored ``data`` sets, '' when none."""
+    return data.get('image') or data.get('s', {}).get('image') or ''
+
+
+def version_images(recipe):
+    """Names of the image files the versions of ``recipe`` refer to."""
+    names = set()
+    # what image_of reads, without loading the versions' data
+    for row in RecipeVersion.objects.filter(recipe=recipe).values_list('data__image', 'data__s__image'):
+        names.update(row)
+    return names - {None, ''}
+
+
+# version storage
+def _rebuild(recipe, number):
+    """Return ``(checkpoint number, snapshot)`` of ``recipe`` at version ``number``.
+
+    The chain starts at the latest stored checkpoint at or before ``number``,
+    wherever ``RECIPE_VERSION_CHECKPOINT_EVERY`` put it at the time.
+    """
+    checkpoint = (RecipeVersion.objects
+                  .filter(recipe=recipe, is_checkpoint=True, number__lte=number)
+                  .order_by('-number').values('number')[:1])
+    versions = list(
+        RecipeVersion.objects
+        .filter(recipe=recipe, number__lte=number, number__gte=Subquery(checkpoint))
+        .order_by('number')
+        .values_list('number', 'is_checkpoint', 'data')
+    )
+    if not versions or versions[-1][0] != number:
+        raise RecipeVersion.DoesNotExist(f"Recipe {recipe.pk} has no version {number}.")
+
+    state = None
+    for _number, is_checkpoint, data in versions:
+        state = data if is_checkpoint else apply_diff(state, data)
+    return versions[0][0], state
+
+
+def reconstruct(recipe, number):
+    """Rebuild the full snapshot of ``recipe`` at version ``number``."""
+    return _rebuild(recipe, number)[1]
+
+
+def record_baseline(recipe):
+    """Store the saved state of ``recipe`` as version 1 if it has no versions yet.
+
+    Called before an edit is saved. Returns the new ``RecipeVersion`` or ``None``.
+    """
+    if RecipeVersion.objects.filter(recipe=recipe).exists():
+        return None
+    with transaction.atomic():
+        Recipe.objects.select_for_update().filter(pk=recipe.pk).exists()
+        if RecipeVersion.objects.filter(recipe=recipe).exists():
+            return None
+        # the form has already changed ``recipe`` (or a child) in memory: read it back
+        stored = Recipe.objects.prefetch_related('ingredients', 'steps').get(pk=recipe.pk)
+        return RecipeVersion.objects.create(recipe=recipe, number=1, is_checkpoint=True, data=snapshot(stored))
+
+
+def record_version(recipe, user=None):
+    """Store the current state of ``recipe`` as its next version.
+
+    Returns the new ``RecipeVersion`` or ``None`` when nothing changed.
+    """
+    with transaction.atomic():
+        # lock the recipe row so concurrent saves can't reuse a number
+        Recipe.objects.select_for_update().filter(pk=recipe.pk).exists()
+        current = snapshot(recipe)
+        last = RecipeVersion.objects.filter(recipe=recipe).order_by('-number').first()
+        checkpoint, previous = _rebuild(recipe, last.number) if last else (None, {})
+        if last and previous == current:
+            return None
+
+        number = last.number + 1 if last else 1
+        is_checkpoint = checkpoint is None or number - checkpoint >= checkpoint_every()
+        return RecipeVersion.objects.create(
+            recipe=recipe,
+            number=number,
+            is_checkpoint=is_checkpoint,
+            data=current if is_checkpoint else diff(previous, current),
+            author=user,
+        )
+
+
+def restore_version(recipe, number, user=None):
+    """Put ``recipe`` back to version ``number`` and record that as a new version."""
+    state = reconstruct(recipe, number)
+    # categories and measures may have been deleted since that version
+    if not Category.objects.filter(pk=state['category_id']).exists():
+        state['category_id'] = None
+    measures = set(IngreadientMeasure.objects.values_list('pk', flat=True))
+    for values in state['ingredients'].values():
+        if values['measure_id'] not in measures:
+            values['measure_id'] = None
+
+    with transaction.atomic():
+        for field in RECIPE_FIELDS:
+            setattr(recipe, field, state[field])
+        recipe.save()
+
+        recipe.ingredients.all().delete()
+        Ingredient.objects.bulk_create(
+            Ingredient(pk=int(pk), recipe=recipe, **values)
+            for pk, values in state['ingredients'].items()
+        )
+        recipe.steps.all().delete()
+        # same order, keys spread out again (older versions may even repeat a number)
+        steps = sorted(state['steps'].items(), key=lambda item: (item[1]['step_number'], int(item[0])))
+        Step.objects.bulk_create(
+            Step(pk=int(pk), recipe=recipe, step=values['step'], step_number=(number + 1) * STEP_GAP)
+            for number, (pk, values) in enumerate(steps)
+        )
+        return record_version(recipe, user)
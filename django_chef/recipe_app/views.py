@@ -3,13 +3,25 @@ from django.views.generic import (CreateView, DetailView, UpdateView, ListView,
 from django.contrib.auth.views import LoginView, LogoutView
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib import messages
-from django.shortcuts import get_object_or_404, redirect
+from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse_lazy, reverse
+from django.utils.functional import cached_property
 from django.utils.text import slugify
-from .forms import (RecipeForm, IngredientsForm, StepsForm, CustomUserCreation, CustomLoginForm)
-from .models import (Recipe, Ingredient, Step, IngreadientMeasure, CustomUser, Category, IngreadientMeasure, FavoriteRecipe)
+from .forms import (RecipeForm, IngredientsForm, StepsForm, InstructionForm, CustomUserCreation, CustomLoginForm)
+from .models import (Recipe, Ingredient, Step, IngreadientMeasure, CustomUser, Category, IngreadientMeasure, FavoriteRecipe,
+                     RecipeVersion, Event)
+from .versioning import record_baseline, record_version, reconstruct, restore_version, version_images
 from django.core.files.storage import FileSystemStorage
 from django.conf import settings
+from django.utils.cache import patch_cache_control
+from .public_cache import recipe_tag
+from .tasks import delete_stored_file
+from . import archive, dashboard, export, offline, pantry, read_models, step_order
+from .events import EventLogMixin, record, recipe_feed
+from django.http import JsonResponse, StreamingHttpResponse, FileResponse, Http404
+from django.core.files.storage import default_storage
+from django.templatetags.static import static
+from django.db import transaction
 import os
 
 """ 
@@ -18,11 +30,18 @@ Home page view
 class HomePageView(TemplateView):
     template_name = 'home.html'
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        if self.request.user.is_authenticated:
+            # materialized and cached, see dashboard.py
+            context['dashboard'] = dashboard.dashboard(self.request.user)
+        return context
+
 """
 User CRUD Section
 """
 # user register view
-class UserRegisterView(CreateView):
+class UserRegisterView(EventLogMixin, CreateView):
     model = CustomUser
     form_class = CustomUserCreation
     template_name = 'recipe_app/users/register_user.html'
@@ -52,7 +71,7 @@ class CustomUserDetails(LoginRequiredMixin, TemplateView):
         return context
     
 # user update
-class CustomUserDetailUpdateView(LoginRequiredMixin, UpdateView):
+class CustomUserDetailUpdateView(LoginRequiredMixin, EventLogMixin, UpdateView):
     model = CustomUser
     template_name = 'recipe_app/users/update_account.html'
     fields = ['username', 'email', 'first_name', 'last_name', 'profile_pic']
@@ -63,7 +82,7 @@ class CustomUserDetailUpdateView(LoginRequiredMixin, UpdateView):
         return self.request.user
 
 # user delete
-class DelUserView(LoginRequiredMixin, DeleteView):
+class DelUserView(LoginRequiredMixin, EventLogMixin, DeleteView):
     model = CustomUser
     template_name = 'recipe_app/users/delete_account.html'
     success_url = reverse_lazy('home')
@@ -72,6 +91,66 @@ class DelUserView(LoginRequiredMixin, DeleteView):
         # only allow deleting your own account
         return self.request.user
 
+"""
+Recipe Scope
+"""
+# the recipe a view works on: resolved once per request, only among the user's own
+class RecipeScopedMixin:
+    """Owner-enforced recipe of the url, cached as ``self.recipe`` (and the ``recipe`` context).
+
+    Recipe views and the ingredient/step create views find it by the url's ``pk``
+    and ``slug``. Ingredient/step update and delete views find the child by its
+    ``pk`` (the ``slug`` is its recipe's) among the user's recipes, with the recipe
+    loaded by the same query. Another user's recipe is a 404.
+
+    An archived recipe (see archive.py) is moved back first, or read as it is
+    from the archive where ``archive_reads`` is set.
+    """
+    archive_reads = False
+
+    def get_recipe_queryset(self):
+        return Recipe.objects.for_user(self.request.user)
+
+    @cached_property
+    def recipe(self):
+        child = getattr(self, 'object', None)
+        if isinstance(child, (Ingredient, Step)):
+            return child.recipe
+        try:
+            return get_object_or_404(self.get_recipe_queryset(), pk=self.kwargs['pk'], slug=self.kwargs['slug'])
+        except Http404:
+            archived = archive.find(self.request.user, self.kwargs['pk'], self.kwargs['slug'])
+            if archived is None:
+                raise
+            if self.archive_reads:
+                return archive.read(archived, self.request.user)
+            archive.rehydrate(archived)
+            return get_object_or_404(self.get_recipe_queryset(), pk=self.kwargs['pk'], slug=self.kwargs['slug'])
+
+    def get_queryset(self):
+        if self.model in (Ingredient, Step):
+            return self.model.objects.for_user(self.request.user).filter(recipe__slug=self.kwargs['slug'])
+        return self.get_recipe_queryset()
+
+    def get_object(self, queryset=None):
+        if self.model is Recipe:
+            return self.recipe
+        try:
+            return super().get_object(queryset)
+        except Http404:
+            archived = archive.find_by_child(self.request.user, self.kwargs['slug'], self.model, self.kwargs['pk'])
+            if archived is None:
+                raise
+            archive.rehydrate(archived)
+            return super().get_object(queryset)
+
+    def get_context_data(self, **kwargs):
+        kwargs.setdefault('recipe', self.recipe)
+        return super().get_context_data(**kwargs)
+
+    def get_success_url(self):
+        return reverse('read_recipe', kwargs={'pk': self.recipe.pk, 'slug': self.recipe.slug})
+
 """
 Recipe CRUD Section
 """
@@ -89,6 +168,8 @@ class WizForm(LoginRequiredMixin, SessionWizardView):
     "steps": "recipe_app/recipe_forms/instruction_form.html",
     }
     
+    # step data lives in the cache, not the session row (see wizard_storage.py)
+    storage_name = 'recipe_app.wizard_storage.CacheStorage'
     file_storage = FileSystemStorage(
          location=os.path.join(settings.MEDIA_ROOT, 'wizard_temp')
     )
@@ -119,9 +200,11 @@ class WizForm(LoginRequiredMixin, SessionWizardView):
         step_form = form_list[2].cleaned_data
         Step.objects.create(
             recipe=recipe,
-            step_number=step_form['step_number'],
+            step_number=step_order.STEP_GAP,
             step=step_form['step']
         )
+        record_version(recipe, self.request.user)
+        record(self.request.user, Event.CREATE, recipe)
 
         messages.success(self.request, f"<strong>{recipe.title}</strong> has been created.")
     
@@ -136,169 +219,264 @@ class RecipeListView(LoginRequiredMixin, ListView):
     ordering = ['title']
     
     def get_queryset(self):
-        # Get only the recipes created by the logged-in user
-        queryset = Recipe.objects.filter(owner=self.request.user).order_by('title')
-
-        # Get all favorited recipe IDs for this user
-        favorites = set(
-            FavoriteRecipe.objects.filter(user=self.request.user)
-            .values_list('recipe_id', flat=True)
-        )
+        # only the recipes created by the logged-in user, as cards (see read_models.py)
+        recipes = Recipe.objects.for_user(self.request.user).with_is_fav(self.request.user).order_by('title')
+        return read_models.recipe_cards(recipes, with_ingredients=True)
 
-        # Add a dynamic "is_fav" attribute to each recipe
-        for recipe in queryset:
-            recipe.is_fav = recipe.id in favorites
-
-        return queryset
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['archived'] = archive.titles(self.request.user)
+        return context
 
 # read recipe
-class ReadRecipe(LoginRequiredMixin, DetailView):
+class ReadRecipe(LoginRequiredMixin, RecipeScopedMixin, DetailView):
     model = Recipe
     context_object_name = 'recipe'
     template_name = 'recipe_app/recipe/read_recipe.html'
-
-    def get_object(self, queryset=None):
-        recipe = get_object_or_404(Recipe, pk=self.kwargs.get('pk'),  slug=self.kwargs.get('slug'), owner=self.request.user)
-
-        #
-        recipe.is_fav = FavoriteRecipe.objects.filter(
-            user=self.request.user,
-            recipe=recipe
-        ).exists()
-
-        return recipe
+    # shown from the archive without moving it back
+    archive_reads = True
+
+    def get_recipe_queryset(self):
+        return (super().get_recipe_queryset()
+                .with_is_fav(self.request.user)
+                .select_related('category')
+                .prefetch_related('ingredients__measure', 'steps'))
     
 # update recipe
-class UpdateRecipe(LoginRequiredMixin, UpdateView):
+class UpdateRecipe(LoginRequiredMixin, RecipeScopedMixin, EventLogMixin, UpdateView):
     model = Recipe
     template_name = 'recipe_app/recipe/update_recipe.html'
     form_class = RecipeForm
     http_method_names = ['get', 'post']
 
-    def get_success_url(self):
-        return reverse('read_recipe', kwargs={'pk': self.object.pk, 'slug': self.object.slug})
-    
-    def get_object(self, queryset=None):
-        return get_object_or_404(
-            Recipe,
-            pk=self.kwargs.get('pk'),
-            slug=self.kwargs.get('slug')
-        )
-    
-    def get_queryset(self):
-        return Recipe.objects.filter(owner=self.request.user)
+    def form_valid(self, form):
+        old_image = form.initial.get('image')
+        record_baseline(self.object)
+        response = super().form_valid(form)
+        record_version(self.object, self.request.user)
+        # the replaced/cleared image file is deleted in the background, unless a version
+        # still refers to it: then it goes with the recipe
+        if (old_image and old_image.name != self.object.image.name
+                and old_image.name not in version_images(self.object)):
+            delete_stored_file.enqueue(old_image.name)
+            delete_stored_file.enqueue(export.rendition_name(old_image.name))
+        return response
 
 
 #delete recipe
-class DelRecipe(LoginRequiredMixin, DeleteView):
+class DelRecipe(LoginRequiredMixin, RecipeScopedMixin, EventLogMixin, DeleteView):
     model = Recipe
     template_name = 'recipe_app/recipe/delete_recipe.html'
-    success_url = reverse_lazy('recipe_list')
     context_object_name = 'recipe'
-    
-    def get_object(self, queryset=None):
-        # Ensure only existing recipes are deleted
-        return get_object_or_404(Recipe, pk=self.kwargs.get('pk'), slug=self.kwargs.get('slug'))
-        
-    def get_queryset(self):
-        return Recipe.objects.filter(owner=self.request.user)
-    
+
+    def get_success_url(self):
+        return reverse('recipe_list')
+
     def form_valid(self, form):
         messages.info(self.request, f"<strong>{self.object.title}</strong> has been deleted.",)
         return super().form_valid(form)
 
+"""
+Public Recipe Section
+"""
+# read a shared recipe without logging in
+class PublicRecipe(DetailView):
+    """Anonymous, edge-cacheable recipe page.
+
+    The template never touches ``user``, ``messages`` or ``csrf_token`` so the
+    session is never loaded: no ``Vary: Cookie`` and no session table query.
+    """
+    model = Recipe
+    context_object_name = 'recipe'
+    template_name = 'recipe_app/recipe/public_recipe.html'
+    http_method_names = ['get', 'head']
+
+    def get_queryset(self):
+        return (Recipe.objects.filter(is_public=True)
+                .select_related('category')
+                .prefetch_related('ingredients__measure', 'steps'))
+
+    def get(self, request, *args, **kwargs):
+        self.object = self.get_object()
+        # old links keep working after a rename
+        if self.object.slug != kwargs['slug']:
+            return redirect('public_recipe', pk=self.object.pk, slug=self.object.slug, permanent=True)
+
+        response = self.render_to_response(self.get_context_data(object=self.object))
+        patch_cache_control(
+            response,
+            public=True,
+            max_age=settings.PUBLIC_RECIPE_MAX_AGE,
+            s_maxage=settings.PUBLIC_RECIPE_S_MAXAGE,
+        )
+        response['Surrogate-Key'] = recipe_tag(self.object.pk)
+        return response
+
+"""
+Recipe History Section
+"""
+# list saved versions of a recipe
+class RecipeHistory(LoginRequiredMixin, RecipeScopedMixin, ListView):
+    model = RecipeVersion
+    template_name = 'recipe_app/recipe/history_recipe.html'
+    context_object_name = 'versions'
+    http_method_names = ['get']
+
+    def get_queryset(self):
+        # data is skipped on purpose: diffs are only rebuilt for the version being viewed
+        return (RecipeVersion.objects.filter(recipe=self.recipe)
+                .select_related('author').defer('data'))
+
+# read one saved version
+class ReadRecipeVersion(LoginRequiredMixin, RecipeScopedMixin, TemplateView):
+    template_name = 'recipe_app/recipe/version_recipe.html'
+    http_method_names = ['get']
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        version = get_object_or_404(RecipeVersion, recipe=self.recipe, number=self.kwargs['number'])
+        state = reconstruct(self.recipe, version.number)
+
+        context['version'] = version
+        context['state'] = state
+        context['category'] = Category.objects.filter(pk=state['category_id']).first()
+        measures = dict(IngreadientMeasure.objects.values_list('pk', 'measure'))
+        context['ingredients'] = [
+            {**values, 'measure': measures.get(values['measure_id'], '')}
+            for values in state['ingredients'].values()
+        ]
+        context['steps'] = sorted(state['steps'].values(), key=lambda step: step['step_number'])
+        return context
+
+# restore a saved version
+class RestoreRecipeVersion(LoginRequiredMixin, RecipeScopedMixin, View):
+    """Roll a recipe back to one of its saved versions."""
+    def post(self, request, *args, **kwargs):
+        recipe = self.recipe
+        version = get_object_or_404(RecipeVersion, recipe=recipe, number=kwargs['number'])
+        restore_version(recipe, version.number, request.user)
+        record(request.user, Event.RESTORE, recipe, version=version.number)
+
+        messages.success(request, f"<strong>{recipe.title}</strong> has been restored to version {version.number}.")
+        return redirect('read_recipe', pk=recipe.pk, slug=recipe.slug)
+
+# who did what to a recipe and its ingredients and steps
+class RecipeActivity(LoginRequiredMixin, RecipeScopedMixin, TemplateView):
+    template_name = 'recipe_app/recipe/activity_recipe.html'
+    http_method_names = ['get']
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['events'] = recipe_feed(self.recipe.pk)
+        return context
+
 """
 Ingredient CRUD Section
 """
 # create ingredients
-class CreateIngredient(LoginRequiredMixin, CreateView):
+class CreateIngredient(LoginRequiredMixin, RecipeScopedMixin, EventLogMixin, CreateView):
     model = Ingredient
     template_name = 'recipe_app/ingredients/create_ingredients.html'
     fields = ['name', 'quantity', 'measure']
     
     def form_valid(self, form):
-        recipe = get_object_or_404(Recipe, pk=self.kwargs['pk'], slug=self.kwargs['slug'])
-        form.instance.recipe = recipe
-        return super().form_valid(form)
-
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        recipe = get_object_or_404(Recipe, pk=self.kwargs['pk'], slug=self.kwargs['slug'])
-        context['recipe'] = recipe
-        return context
-
-    def get_success_url(self):
-        return reverse_lazy('read_recipe', kwargs={'pk': self.object.recipe.pk, 'slug': self.object.recipe.slug})
-
-    def get_recipe(self):
-        return get_object_or_404(Recipe, pk=self.kwargs['pk'], slug=self.kwargs['slug'])
+        form.instance.recipe = self.recipe
+        record_baseline(self.recipe)
+        response = super().form_valid(form)
+        record_version(self.recipe, self.request.user)
+        return response
 
 # update ingredient
-class UpdateIngredient(LoginRequiredMixin, UpdateView):
+class UpdateIngredient(LoginRequiredMixin, RecipeScopedMixin, EventLogMixin, UpdateView):
     model = Ingredient
     template_name = 'recipe_app/ingredients/update_ingredients.html'
     fields = ['name', 'quantity', 'measure']
 
-    def get_success_url(self):
-        return reverse_lazy('read_recipe', kwargs={'pk': self.object.recipe.pk, 'slug': self.object.recipe.slug})
+    def form_valid(self, form):
+        record_baseline(self.recipe)
+        response = super().form_valid(form)
+        record_version(self.recipe, self.request.user)
+        return response
 
 # delete ingredient
-class DelIngredient(LoginRequiredMixin, DeleteView):
+class DelIngredient(LoginRequiredMixin, RecipeScopedMixin, EventLogMixin, DeleteView):
     model = Ingredient
     template_name = 'recipe_app/ingredients/delete_ingredient.html'
 
-    def get_success_url(self):
-        return reverse_lazy('read_recipe', kwargs={'pk': self.object.recipe.pk, 'slug': self.object.recipe.slug})
+    def form_valid(self, form):
+        record_baseline(self.recipe)
+        response = super().form_valid(form)
+        record_version(self.recipe, self.request.user)
+        return response
 
 """
 Step CRUD Section
 """
 # create step
-class CreateInstruction(LoginRequiredMixin, CreateView):
+class CreateInstruction(LoginRequiredMixin, RecipeScopedMixin, EventLogMixin, CreateView):
     model = Step
     template_name = 'recipe_app/instructions/create_instruction.html'
-    fields = ['step_number', 'step']
+    form_class = InstructionForm
     
     def form_valid(self, form):
-        recipe = get_object_or_404(Recipe, pk=self.kwargs['pk'], slug=self.kwargs['slug'])
-        form.instance.recipe = recipe
-        return super().form_valid(form)
-
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        recipe = get_object_or_404(Recipe, pk=self.kwargs['pk'], slug=self.kwargs['slug'])
-        context['recipe'] = recipe
-        return context
-
-    def get_success_url(self):
-        return reverse_lazy('read_recipe', kwargs={'pk': self.object.recipe.pk, 'slug': self.object.recipe.slug})
-
-    def get_recipe(self):
-        return get_object_or_404(Recipe, pk=self.kwargs['pk'], slug=self.kwargs['slug'])
+        form.instance.recipe = self.recipe
+        record_baseline(self.recipe)
+        # the key and the insert in one transaction, with the recipe locked in between
+        with transaction.atomic():
+            form.instance.step_number = step_order.insert_key(self.recipe, form.cleaned_data['position'])
+            response = super().form_valid(form)
+        record_version(self.recipe, self.request.user)
+        return response
 
 # update step
-class Updateinstruction(LoginRequiredMixin, UpdateView):
+class Updateinstruction(LoginRequiredMixin, RecipeScopedMixin, EventLogMixin, UpdateView):
     model = Step
     template_name = 'recipe_app/instructions/update_instruction.html'
-    fields = ['step_number', 'step']
+    # the order is changed on the recipe page, see ReorderInstructions
+    fields = ['step']
 
-    def get_success_url(self):
-        return reverse_lazy('read_recipe', kwargs={'pk': self.object.recipe.pk, 'slug': self.object.recipe.slug})
+    def form_valid(self, form):
+        record_baseline(self.recipe)
+        response = super().form_valid(form)
+        record_version(self.recipe, self.request.user)
+        return response
 
 # delete step
-class DelInstruction(LoginRequiredMixin, DeleteView):
+class DelInstruction(LoginRequiredMixin, RecipeScopedMixin, EventLogMixin, DeleteView):
     model = Step
     template_name = 'recipe_app/instructions/delete_instruction.html'
 
-    def get_success_url(self):
-        return reverse_lazy('read_recipe', kwargs={'pk': self.object.recipe.pk, 'slug': self.object.recipe.slug})
+    def form_valid(self, form):
+        record_baseline(self.recipe)
+        response = super().form_valid(form)
+        record_version(self.recipe, self.request.user)
+        return response
+
+# new order of all steps from the drag-and-drop list (htmx), answered with the list
+class ReorderInstructions(LoginRequiredMixin, RecipeScopedMixin, View):
+    http_method_names = ['post']
+
+    def post(self, request, *args, **kwargs):
+        status = 200
+        try:
+            order = [int(pk) for pk in request.POST.getlist('step')]
+            record_baseline(self.recipe)
+            if step_order.reorder(self.recipe, order):
+                record_version(self.recipe, request.user)
+                record(request.user, Event.UPDATE, self.recipe, steps='reordered')
+        except ValueError:
+            # a step was added or deleted elsewhere meanwhile: show the current order
+            status = 409
+        steps = self.recipe.steps.order_by('step_number')
+        return render(request, 'recipe_app/instructions/step_list.html',
+                      {'recipe': self.recipe, 'steps': steps}, status=status)
 
 """
 Category CRUD Section
 """
 
 # create category
-class CreateCategory(LoginRequiredMixin, CreateView):
+class CreateCategory(LoginRequiredMixin, EventLogMixin, CreateView):
     model = Category
     template_name = 'recipe_app/category/create_category.html'
     fields = ['name']
@@ -314,7 +492,7 @@ class ListCategories(LoginRequiredMixin, ListView):
     ordering = ['name']
 
 # update category
-class UpdateCategories(LoginRequiredMixin, UpdateView):
+class UpdateCategories(LoginRequiredMixin, EventLogMixin, UpdateView):
     model = Category
     template_name = 'recipe_app/category/update_category.html'
     success_url = reverse_lazy('list_category')
@@ -322,7 +500,7 @@ class UpdateCategories(LoginRequiredMixin, UpdateView):
     http_method_names = ['get', 'post']
 
 # delete category
-class DelCategory(LoginRequiredMixin, DeleteView):
+class DelCategory(LoginRequiredMixin, EventLogMixin, DeleteView):
     model = Category
     success_url = reverse_lazy('list_category')
     template_name = 'recipe_app/category/delete_category.html'
@@ -340,7 +518,7 @@ Measurement CRUD Section
 """
 
 # create measurement
-class CreateMeasurement(LoginRequiredMixin, CreateView):
+class CreateMeasurement(LoginRequiredMixin, EventLogMixin, CreateView):
     model = IngreadientMeasure
     template_name = 'recipe_app/measurements/create_measurement.html'
     fields = ['measure']
@@ -356,7 +534,7 @@ class ListMeasurement(LoginRequiredMixin, ListView):
     ordering = ['measure']
 
 # update measurement
-class UpdateMeasurement(LoginRequiredMixin, UpdateView):
+class UpdateMeasurement(LoginRequiredMixin, EventLogMixin, UpdateView):
     model = IngreadientMeasure
     template_name = 'recipe_app/measurements/update_measurement.html'
     success_url = reverse_lazy('list_measurement')
@@ -364,7 +542,7 @@ class UpdateMeasurement(LoginRequiredMixin, UpdateView):
     http_method_names = ['get', 'post']
 
 # delete measurement
-class DelMeasurement(LoginRequiredMixin, DeleteView):
+class DelMeasurement(LoginRequiredMixin, EventLogMixin, DeleteView):
     model = IngreadientMeasure
     success_url = reverse_lazy('list_measurement')
     template_name = 'recipe_app/measurements/delete_measurement.html'
@@ -382,13 +560,17 @@ Favorite Recipe Add, Delete, List
 class ToggleFavoriteView(LoginRequiredMixin, View):
     """Add or remove a recipe from favorites."""
     def post(self, request, *args, **kwargs):
-        recipe = get_object_or_404(Recipe, pk=kwargs['pk'])
+        # the owner's archived recipe is moved back first (see archive.py)
+        recipe = Recipe.objects.filter(pk=kwargs['pk']).first() or archive.restore(request.user, kwargs['pk'])
+        if recipe is None:
+            raise Http404
 
         favorite, created = FavoriteRecipe.objects.get_or_create(
             user=request.user,
             recipe=recipe
         )
 
+        record(request.user, Event.FAVORITE if created else Event.UNFAVORITE, recipe)
         if created:
             messages.success(request, f"Added <strong class='text-decoration-underline'>{recipe.title}</strong> to favorites.")
         else:
@@ -405,4 +587,103 @@ class FavoriteListView(LoginRequiredMixin, ListView):
     context_object_name = 'favorites'
 
     def get_queryset(self):
-        return FavoriteRecipe.objects.filter(user=self.request.user).select_related('recipe')
\ No newline at end of file
+        return read_models.favorite_cards(self.request.user)
+
+"""
+Pantry Search Section
+"""
+# what can I cook with what I have
+class PantrySearch(LoginRequiredMixin, TemplateView):
+    """Recipes the user can read ranked by how few ingredients they are missing, see pantry.py."""
+    template_name = 'recipe_app/recipe/pantry_search.html'
+    http_method_names = ['get']
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['have'] = self.request.GET.get('have', '')
+        pantry_tokens = pantry.parse_pantry(context['have'])
+        if pantry_tokens:
+            context['suggestions'] = pantry.suggest(self.request.user, pantry_tokens)
+            context['indexing'] = context['suggestions'] is None
+        return context
+
+"""
+Offline Section
+"""
+# json snapshot of the user's recipe book, full or changes since ?since=<version>
+class OfflineSnapshot(LoginRequiredMixin, View):
+    raise_exception = True
+    http_method_names = ['get']
+
+    def get(self, request, *args, **kwargs):
+        since = offline.parse_version(request.GET.get('since'))
+        response = JsonResponse(offline.snapshot(request.user, since), json_dumps_params={'separators': (',', ':')})
+        # the service worker keeps its own copy
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+# service worker, served from the root so it controls every page
+class ServiceWorker(TemplateView):
+    template_name = 'recipe_app/offline/sw.js'
+    content_type = 'application/javascript'
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['precache'] = offline.precache_urls()
+        context['cache_version'] = offline.cache_version(context['precache'])
+        context['static_prefix'] = static('')
+        context['media_prefix'] = settings.MEDIA_URL
+        return context
+
+    def render_to_response(self, context, **response_kwargs):
+        response = super().render_to_response(context, **response_kwargs)
+        # browsers check for a new worker on every navigation, never from the http cache
+        response['Cache-Control'] = 'no-cache'
+        return response
+
+# web app manifest
+class WebManifest(TemplateView):
+    template_name = 'recipe_app/offline/manifest.webmanifest'
+    content_type = 'application/manifest+json'
+
+# page the service worker falls back to when a navigation fails offline
+class OfflineShell(TemplateView):
+    """Renders recipes from the cached snapshot, see ``static/js/offline.js``.
+
+    Cached by the service worker and shown for any user, so like
+    ``PublicRecipe`` the template never touches ``user`` or ``messages``.
+    """
+    template_name = 'recipe_app/offline/shell.html'
+
+"""
+Cookbook Export Section
+"""
+# download the recipe book or favorites as a printable html/pdf cookbook
+class ExportCookbook(LoginRequiredMixin, View):
+    """Small books stream chapter by chapter, bigger ones are written in the background.
+
+    While the background export runs, the page refreshes itself until the
+    file is there and then downloads it.
+    """
+    http_method_names = ['get']
+
+    def get(self, request, scope, fmt):
+        if scope not in export.SCOPES or fmt not in export.CONTENT_TYPES:
+            raise Http404("Unknown export.")
+        recipes = export.export_queryset(request.user, scope)
+        count = recipes.count()
+
+        if count <= settings.EXPORT_STREAM_MAX:
+            response = StreamingHttpResponse(export.chunks(fmt, request.user, scope, recipes),
+                                             content_type=export.CONTENT_TYPES[fmt])
+        else:
+            name, task = export.request_export(request.user, scope, fmt, recipes, retry='retry' in request.GET)
+            if task is not None:
+                return render(request, 'recipe_app/export/export_pending.html', {
+                    'title': export.title(request.user, scope),
+                    'count': count,
+                    'failed': task.status == task.FAILED,
+                })
+            response = FileResponse(default_storage.open(name, 'rb'), content_type=export.CONTENT_TYPES[fmt])
+        response['Content-Disposition'] = f'attachment; filename="{export.filename(scope, fmt)}"'
+        return response
@@ -0,0 +1,151 @@
+"""
+Start-up warm-up for server processes.
+
+Without it a fresh worker pays on its first requests for what it could have
+done before accepting any: importing the views (and formtools, Pillow's
+plugins...), compiling the URL patterns, compiling templates and opening the
+database connection. ``warm_app`` runs the phases that need no database:
+
+* ``warm_urls`` imports the URLconf and fills the resolver's reverse tables
+  and compiled patterns,
+* ``warm_templates`` loads every template the views (and ``base.html``'s
+  partials) use, so the cached template loader holds them compiled,
+* ``warm_lookups`` fills lookup tables built lazily otherwise: Pillow's
+  image plugins, the static files manifest, the translation catalogs, the
+  recipe time strings and the pantry index.
+
+``RecipeAppConfig.ready`` runs it when ``STARTUP_WARMUP`` is on and the
+process starts as a server (``SERVER_ENV`` is set, by wsgi.py, asgi.py and
+``manage.py serve``), before a preforking server forks its workers, so they
+share the result. ``prime_database`` opens the connections and loads the
+content types; it queries, so it runs in each worker after the fork
+(prefork.py) and never in ``ready``.
+"""
+import inspect
+import logging
+import time
+
+from django.conf import settings
+from django.template import TemplateDoesNotExist
+from django.template.loader import get_template
+
+logger = logging.getLogger(__name__)
+
+# set in the environment of processes that serve requests
+SERVER_ENV = 'DJANGO_CHEF_SERVER'
+
+# included by base.html on every page
+BASE_TEMPLATES = [
+    'base.html',
+    'partials/navbar.html',
+    'partials/message_alert.html',
+    'partials/footer.html',
+]
+
+# time strings of recipe cards, made up front for the usual amounts
+TIME_DISPLAY_AMOUNTS = range(1, 121)
+
+# phase name -> (items warmed, seconds), filled once per process by warm_app
+timings = {}
+
+
+def template_names():
+    """Return every template name referenced by ``recipe_app.views``."""
+    from . import views
+
+    names = list(BASE_TEMPLATES)
+    for _name, view in inspect.getmembers(views, inspect.isclass):
+        if view.__module__ != views.__name__:
+            continue
+        if getattr(view, 'template_name', None):
+            names.append(view.template_name)
+        # the recipe wizard picks its template per step
+        names.extend(getattr(view, 'TEMPLATES', {}).values())
+    return list(dict.fromkeys(names))
+
+
+def warm_templates():
+    """Compile all view templates into the cached loader; return how many loaded."""
+    loaded = 0
+    for name in template_names():
+        try:
+            get_template(name)
+        except TemplateDoesNotExist:
+            logger.warning("Template warm-up: %s does not exist.", name)
+        else:
+            loaded += 1
+    return loaded
+
+
+def _compile_patterns(resolver):
+    compiled = 0
+    for pattern in resolver.url_patterns:
+        # patterns compile their regex on first use
+        pattern.pattern.regex
+        compiled += 1
+        if hasattr(pattern, 'url_patterns'):
+            compiled += _compile_patterns(pattern)
+    return compiled
+
+
+def warm_urls():
+    """Import the URLconf (and with it the views) and compile its patterns; return how many."""
+    from django.urls import get_resolver
+
+    resolver = get_resolver()
+    # builds the reverse tables of every namespace
+    resolver.reverse_dict
+    return _compile_patterns(resolver)
+
+
+def warm_lookups():
+    """Fill the lookup tables a first request would build; return how many."""
+    from django.contrib.staticfiles.storage import staticfiles_storage
+    from django.utils import translation
+    from PIL import Image
+
+    from . import pantry
+    from .models import Recipe, time_display
+
+    # Pillow registers its format plugins on the first image opened or saved
+    Image.init()
+    # the manifest storage reads its manifest when created
+    staticfiles_storage.location
+    with translation.override(settings.LANGUAGE_CODE):
+        translation.gettext('Recipe')
+    for unit in Recipe.TIME_UNIT_NAMES:
+        for amount in TIME_DISPLAY_AMOUNTS:
+            time_display(amount, unit)
+    warmed = 3 + len(Recipe.TIME_UNIT_NAMES) * len(TIME_DISPLAY_AMOUNTS)
+    # maps the index files, before a fork shares the pages
+    if pantry.get_index() is not None:
+        warmed += 1
+    return warmed
+
+
+PHASES = [('urls', warm_urls), ('templates', warm_templates), ('lookups', warm_lookups)]
+
+
+def warm_app():
+    """Run the phases that need no database, once per process; return ``timings``."""
+    if not timings:
+        for name, phase in PHASES:
+            started = time.perf_counter()
+            count = phase()
+            timings[name] = (count, time.perf_counter() - started)
+        logger.info("Warm-up: %s", ", ".join(f"{name} {count} in {seconds * 1000:.0f}ms"
+                                              for name, (count, seconds) in timings.items()))
+    return timings
+
+
+def prime_database():
+    """Connect to every database and load the content types; return how many connections."""
+    from django.apps import apps
+    from django.contrib.contenttypes.models import ContentType
+    from django.db import connections
+
+    for connection in connections.all(initialized_only=False):
+        connection.ensure_connection()
+    # the admin and permission checks look these up per model
+    ContentType.objects.get_for_models(*apps.get_models())
+    return len(connections.all(initialized_only=True))
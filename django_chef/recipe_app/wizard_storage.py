@@ -0,0 +1,45 @@
+"""
+Form wizard storage kept in the cache layer.
+
+formtools' ``SessionStorage`` rewrites the session row on every wizard step.
+``CacheStorage`` keeps the step data in ``WIZARD_CACHE_ALIAS`` instead, under
+a key per user and wizard, and lets it expire after ``WIZARD_STORAGE_TIMEOUT``
+seconds so abandoned wizards clean themselves up. The steps of one wizard can
+be served by different processes, so the alias must be a cache they share
+(``'shared'``, on files, by default). Uploaded files still go to
+the wizard's ``file_storage``; ``manage.py clear_wizard_temp`` removes the
+ones left behind by abandoned wizards.
+"""
+from django.conf import settings
+from django.core.cache import caches
+from formtools.wizard.storage.base import BaseStorage
+
+
+class CacheStorage(BaseStorage):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cache = caches[getattr(settings, 'WIZARD_CACHE_ALIAS', 'default')]
+        self.cache_key = f"{self.prefix}:{self._owner()}"
+        self.data = self.cache.get(self.cache_key)
+        if self.data is None:
+            self.init_data()
+
+    def _owner(self):
+        user = getattr(self.request, 'user', None)
+        if user is not None and user.is_authenticated:
+            return f"user_{user.pk}"
+        # anonymous wizards need a session to tell visitors apart
+        if self.request.session.session_key is None:
+            self.request.session.save()
+        return f"session_{self.request.session.session_key}"
+
+    def _is_empty(self):
+        return not any(self.data[key] for key in (self.step_key, self.step_data_key, self.step_files_key, self.extra_data_key))
+
+    def update_response(self, response):
+        super().update_response(response)
+        if self._is_empty():
+            self.cache.delete(self.cache_key)
+        else:
+            self.cache.set(self.cache_key, self.data, getattr(settings, 'WIZARD_STORAGE_TIMEOUT', 60 * 60 * 24))
@@ -0,0 +1,147 @@
+// offline mode: service worker registration, recipe book sync and the offline shell
+(function() {
+  document.addEventListener("DOMContentLoaded", function() {
+    const body = document.body;
+    if (!("serviceWorker" in navigator) || !body.dataset.serviceWorker) {
+      return;
+    }
+
+    navigator.serviceWorker.register(body.dataset.serviceWorker);
+    navigator.serviceWorker.ready.then(registration => {
+      const user = body.dataset.user;
+      if (user === undefined || !registration.active) {
+        return;  // shared and offline pages leave the book alone
+      }
+      if (user) {
+        registration.active.postMessage({type: "sync", user: Number(user)});
+      } else {
+        registration.active.postMessage({type: "clear"});
+      }
+    });
+
+    const book = document.getElementById("offline-book");
+    if (book) {
+      caches.match(body.dataset.snapshot)
+        .then(response => response ? response.json() : null)
+        .then(snapshot => renderBook(book, snapshot));
+    }
+  });
+
+  // "/recipe/id_0/slug/read/" with {"id_0": ..., "slug": ...} -> a RegExp matching any recipe
+  function urlPattern(url, placeholders) {
+    let pattern = url.replace(/[.*+?^${}()|[\]\\]/g, "\\$&");
+    for (const [placeholder, group] of Object.entries(placeholders)) {
+      pattern = pattern.replace(placeholder, group);
+    }
+    return new RegExp(`^${pattern}$`);
+  }
+
+  function element(tag, className, text) {
+    const node = document.createElement(tag);
+    if (className) {
+      node.className = className;
+    }
+    if (text !== undefined) {
+      node.textContent = text;
+    }
+    return node;
+  }
+
+  function renderBook(book, snapshot) {
+    if (!snapshot || !snapshot.recipes.length) {
+      book.append(element("h5", "text-white text-center", "No recipes have been saved on this device yet."));
+      return;
+    }
+    const readUrl = book.dataset.readUrl;
+    const link = recipe => readUrl.replace("id_0/slug", `id_${recipe.id}/${recipe.slug}`);
+    const path = window.location.pathname;
+    const favorites = new Set(snapshot.favorites);
+
+    const detail = path.match(urlPattern(readUrl, {"id_0": "id_(\\d+)", "slug": "[^/]+"}));
+    const recipe = detail && snapshot.recipes.find(r => r.id === Number(detail[1]));
+    if (recipe) {
+      book.append(recipeDetail(recipe));
+      return;
+    }
+
+    let recipes = snapshot.recipes;
+    if (path === book.dataset.listUrl) {
+      recipes = recipes.filter(r => r.mine);
+    } else if (urlPattern(book.dataset.favoritesUrl, {"username": "[^/]+"}).test(path)) {
+      recipes = recipes.filter(r => favorites.has(r.id));
+    }
+    const row = element("div", "row row-cols-1 row-cols-md-3 g-4");
+    recipes.forEach(r => row.append(recipeCard(r, link(r))));
+    book.append(row);
+  }
+
+  function recipeCard(recipe, url) {
+    const col = element("div", "col mb-3");
+    const card = element("div", "card border-dark rounded bg-secondary h-100");
+    card.append(element("h3", "card-header text-center text-white fw-semibold", recipe.title));
+    const image = element("img", "img-fluid");
+    image.src = recipe.image;
+    image.alt = `Image of ${recipe.title}`;
+    card.append(image);
+
+    const cardBody = element("div", "card-body text-center text-white");
+    cardBody.append(element("p", "mb-1", `Category: ${recipe.category || "Uncategorized"}`));
+    cardBody.append(element("p", "mb-1", `Spice Level: ${recipe.spice} of 5`));
+    cardBody.append(element("p", "mb-3", `Prep: ${recipe.prep} - Cook: ${recipe.cook}`));
+    const read = element("a", "btn btn-info", "Read ");
+    read.href = url;
+    read.append(element("i", "bi bi-book-half"));
+    cardBody.append(read);
+    card.append(cardBody);
+    col.append(card);
+    return col;
+  }
+
+  function recipeDetail(recipe) {
+    const container = element("div", "container");
+    const title = element("div", "text-center mb-5");
+    title.append(element("h2", "fw-bold text-white", recipe.title));
+    title.append(element("p", "text-white fst-italic", `Category: ${recipe.category || "Uncategorized"}`));
+    container.append(title);
+
+    const image = element("div", "container-fluid text-center my-4");
+    const img = element("img", "img-fluid");
+    img.src = recipe.image;
+    img.alt = `Image of ${recipe.title}`;
+    image.append(img);
+    container.append(image);
+
+    const info = element("div", "card mb-4 border-dark shadow");
+    const infoBody = element("div", "card-body row text-center");
+    [["Prep Time:", recipe.prep], ["Cook Time:", recipe.cook], ["Spice Level:", recipe.spice]].forEach(([label, value]) => {
+      const cell = element("div", "col-md-4 col-12");
+      cell.append(element("strong", "badge rounded-pill bg-info", label), element("br"), String(value));
+      infoBody.append(cell);
+    });
+    info.append(infoBody);
+    container.append(info);
+
+    container.append(section("Description", element("p", "card-text text-dark lh-lg p-3", recipe.description)));
+
+    const ingredients = element("ul", "list-group list-group-flush");
+    recipe.ingredients.forEach(([name, quantity, measure]) => {
+      const item = element("li", "list-group-item");
+      item.append(element("strong", "", name), ` — ${quantity} ${measure}`);
+      ingredients.append(item);
+    });
+    container.append(section("Ingredients", ingredients));
+
+    const steps = element("ol", "list-group list-group-flush list-group-numbered");
+    recipe.steps.forEach(([, text]) => steps.append(element("li", "list-group-item", text)));
+    container.append(section("Instructions", steps));
+    return container;
+  }
+
+  function section(heading, content) {
+    const card = element("div", "card border-dark mb-4 shadow-sm");
+    const header = element("div", "card-header bg-light fw-bold text-center");
+    header.append(element("h3", "m-0", heading));
+    card.append(header, content);
+    return card;
+  }
+})();
@@ -0,0 +1,56 @@
+// drag-and-drop step order: items of a <ul data-sortable> move under the pointer, and once one
+// is dropped somewhere new the list's form gets an "end" event, which htmx posts (hx-trigger="end")
+(function() {
+  let dragged = null;
+  let before = "";
+
+  function order(list) {
+    return Array.from(list.children).map(item => item.dataset.step).join(",");
+  }
+
+  function sortableItem(target) {
+    return target.closest ? target.closest("[data-sortable] > li[draggable]") : null;
+  }
+
+  document.addEventListener("dragstart", function(event) {
+    const item = sortableItem(event.target);
+    if (!item) {
+      return;
+    }
+    dragged = item;
+    before = order(item.parentElement);
+    item.classList.add("opacity-50");
+    event.dataTransfer.effectAllowed = "move";
+  });
+
+  document.addEventListener("dragover", function(event) {
+    const item = dragged && sortableItem(event.target);
+    if (!item || item.parentElement !== dragged.parentElement) {
+      return;
+    }
+    event.preventDefault();
+    if (item !== dragged) {
+      const box = item.getBoundingClientRect();
+      const below = event.clientY > box.top + box.height / 2;
+      item.parentElement.insertBefore(dragged, below ? item.nextSibling : item);
+    }
+  });
+
+  document.addEventListener("drop", function(event) {
+    if (dragged) {
+      event.preventDefault();
+    }
+  });
+
+  document.addEventListener("dragend", function() {
+    if (!dragged) {
+      return;
+    }
+    const list = dragged.parentElement;
+    dragged.classList.remove("opacity-50");
+    dragged = null;
+    if (order(list) !== before) {
+      list.dispatchEvent(new Event("end", {bubbles: true}));
+    }
+  });
+})();